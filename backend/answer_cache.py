@@ -0,0 +1,173 @@
+"""
+Per-collection semantic answer cache.
+
+Near-identical questions against the same document ("summarise this", "what
+are the main topics?") are answered from memory when the new question's
+embedding is within SEMANTIC_CACHE_MAX_DISTANCE (cosine distance) of a
+cached one, skipping retrieval and the LLM call.
+
+Answers are bucketed by whether web search was requested, so a document-only
+request never gets a web-augmented answer. Web-augmented answers age out
+faster (SEMANTIC_CACHE_WEB_TTL_SECONDS) because the web part goes stale.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.05"))
+SEMANTIC_CACHE_PER_COLLECTION = int(os.getenv("SEMANTIC_CACHE_PER_COLLECTION", "256"))
+SEMANTIC_CACHE_MAX_COLLECTIONS = int(os.getenv("SEMANTIC_CACHE_MAX_COLLECTIONS", "1024"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_WEB_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_WEB_TTL_SECONDS", "300"))
+
+
+class CachedAnswer:
+    def __init__(self, question: str, embedding: np.ndarray, answer: str, dist: float, threshold: float,
+                 web_search_used: bool, web_search_reason: str | None, ttl_seconds: float):
+        self.question = question
+        self.embedding = embedding
+        self.answer = answer
+        self.dist = dist
+        self.threshold = threshold
+        self.web_search_used = web_search_used
+        self.web_search_reason = web_search_reason
+        self.expires_at = time.monotonic() + ttl_seconds
+        self.last_used = time.monotonic()
+
+
+class _Bucket:
+    """Answers for one (collection, web flag) pair, least recently used first."""
+
+    def __init__(self):
+        self.entries: list[CachedAnswer] = []
+        self._matrix: np.ndarray | None = None
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.vstack([entry.embedding for entry in self.entries])
+        return self._matrix
+
+    def remove(self, indexes: set[int]):
+        self.entries = [entry for i, entry in enumerate(self.entries) if i not in indexes]
+        self._matrix = None
+
+    def append(self, entry: CachedAnswer):
+        self.entries.append(entry)
+        self._matrix = None
+
+
+def _unit(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_distance: float = SEMANTIC_CACHE_MAX_DISTANCE,
+                 max_per_collection: int = SEMANTIC_CACHE_PER_COLLECTION,
+                 max_collections: int = SEMANTIC_CACHE_MAX_COLLECTIONS,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+                 web_ttl_seconds: float = SEMANTIC_CACHE_WEB_TTL_SECONDS):
+        self.max_distance = max_distance
+        self.max_per_collection = max_per_collection
+        self.max_collections = max_collections
+        self.ttl_seconds = ttl_seconds
+        self.web_ttl_seconds = web_ttl_seconds
+        self.hits = 0
+        self.web_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # collection name -> {use_web_search: bucket}
+        self._collections: OrderedDict[str, dict[bool, _Bucket]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, collection_name: str, embedding, threshold: float, use_web_search: bool) -> CachedAnswer | None:
+        """Return the closest cached answer within `max_distance`, or None.
+
+        Only answers produced under the same threshold and web-search setting
+        are considered, since both change how a question is routed.
+        """
+        query = _unit(embedding)
+        with self._lock:
+            buckets = self._collections.get(collection_name)
+            bucket = buckets.get(use_web_search) if buckets else None
+            if not bucket or not bucket.entries:
+                self.misses += 1
+                return None
+            self._collections.move_to_end(collection_name)
+
+            now = time.monotonic()
+            expired = {i for i, entry in enumerate(bucket.entries) if entry.expires_at <= now}
+            if expired:
+                bucket.remove(expired)
+                self.expirations += len(expired)
+                if not bucket.entries:
+                    self.misses += 1
+                    return None
+
+            distances = 1.0 - bucket.matrix() @ query
+            for i in np.argsort(distances):
+                if distances[i] > self.max_distance:
+                    break
+                entry = bucket.entries[i]
+                if entry.threshold != threshold:
+                    continue
+                entry.last_used = now
+                self.hits += 1
+                if entry.web_search_used:
+                    self.web_hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def store(self, collection_name: str, question: str, embedding, answer: str, dist: float, threshold: float,
+              use_web_search: bool, web_search_used: bool, web_search_reason: str | None = None):
+        ttl = self.web_ttl_seconds if web_search_used else self.ttl_seconds
+        entry = CachedAnswer(question, _unit(embedding), answer, dist, threshold, web_search_used, web_search_reason, ttl)
+        with self._lock:
+            buckets = self._collections.setdefault(collection_name, {})
+            self._collections.move_to_end(collection_name)
+            bucket = buckets.setdefault(use_web_search, _Bucket())
+            bucket.append(entry)
+            if len(bucket.entries) > self.max_per_collection:
+                # Drop the least recently used answers
+                order = sorted(range(len(bucket.entries)), key=lambda i: bucket.entries[i].last_used)
+                excess = set(order[:len(bucket.entries) - self.max_per_collection])
+                bucket.remove(excess)
+                self.evictions += len(excess)
+            while len(self._collections) > self.max_collections:
+                _, dropped = self._collections.popitem(last=False)
+                self.evictions += sum(len(b.entries) for b in dropped.values())
+
+    def invalidate(self, collection_name: str):
+        """Forget every answer involving a collection, e.g. after its documents change.
+
+        Multi-document chats cache under "name1|name2|..." keys, so those are
+        dropped too.
+        """
+        with self._lock:
+            for key in [key for key in self._collections if collection_name in key.split("|")]:
+                dropped = self._collections.pop(key)
+                self.invalidations += sum(len(b.entries) for b in dropped.values())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "collections": len(self._collections),
+            "entries": sum(len(b.entries) for buckets in self._collections.values() for b in buckets.values()),
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "web_hits": self.web_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
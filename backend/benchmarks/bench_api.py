@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Offline load benchmark for the HTTP API.
+
+Runs main.app in-process against stand-ins (see stand_ins.py and
+memory_mongo.py): hashing embeddings and a fake LLM and web search with
+configurable latency, and an in-memory MongoDB, or a scratch database on a
+real server with --mongo-uri. It uploads synthetic documents through
+/upload/ (polling /jobs/{id}), then sends /query/ requests from
+--concurrency workers, and prints a JSON report: throughput, p50/p95/p99 per
+stage (client-side HTTP latency, the backend's own stages and the simulated
+provider calls), route/cache/coalescing counts, LLM prompt tokens and
+/cache/stats.
+
+Chroma data, lexical indexes and spooled uploads go to a temp directory. No
+API keys or network access are needed. Backend settings are read from the
+environment as usual, so configurations can be compared directly:
+
+    CHROMA_STORAGE_MODE=shared HYBRID_SEARCH_ENABLED=false python benchmarks/bench_api.py
+
+Exits non-zero if any request or ingestion job failed.
+
+Usage:
+    python benchmarks/bench_api.py --documents 20 --queries 500 --concurrency 32
+    python benchmarks/bench_api.py --llm-latency-ms 800 --web-search --output report.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Must be in place before the backend modules read their settings at import time
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+
+import httpx  # noqa: E402  (installed with the OpenAI SDK)
+
+from memory_mongo import AsyncMemoryCollection, MemoryCollection  # noqa: E402
+from stand_ins import FakeLLM, FakeWebSearch, LatencyEmbedding, StageTimer  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tor", "vek", "sa", "qu", "zen", "dal", "po", "mir", "tek", "nor", "bi", "lus"]
+JOB_DONE = ("completed", "failed")
+
+
+def make_vocabulary(rng, size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES, size=rng.integers(2, 4))))
+    return sorted(words)
+
+
+def make_document(rng, vocabulary: list[str], index: int, size_kb: int) -> tuple[str, list[str], list[str]]:
+    """Synthetic text of about `size_kb`, with the sentences and part numbers it contains."""
+    sentences, identifiers = [], []
+    length = 0
+    while length < size_kb * 1024:
+        words = list(rng.choice(vocabulary, size=rng.integers(8, 17)))
+        if len(sentences) % 10 == 0:
+            identifier = f"PX-{index:03d}{len(identifiers):02d}"
+            identifiers.append(identifier)
+            words.insert(rng.integers(len(words)), identifier)
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+    return "\n\n".join(paragraphs), sentences, identifiers
+
+
+def make_questions(rng, corpus: list[tuple[str, list[str], list[str]]], count: int, identifier_ratio: float) -> list[tuple[int, str]]:
+    questions = []
+    for _ in range(count):
+        index = int(rng.integers(len(corpus)))
+        _, sentences, identifiers = corpus[index]
+        if identifiers and rng.random() < identifier_ratio:
+            questions.append((index, f"What is {rng.choice(identifiers)} used for?"))
+        else:
+            words = [w for w in sentences[rng.integers(len(sentences))].rstrip(".").split() if not w.startswith("PX-")]
+            start = int(rng.integers(max(1, len(words) - 4)))
+            questions.append((index, f"What does the document say about {' '.join(words[start:start + 4]).lower()}?"))
+    return questions
+
+
+def load_app(args, timer: StageTimer):
+    """Import main from the temp working directory and swap in the stand-ins."""
+    import ingestion
+    import main
+    from llama_index.core import Settings
+    from scheduled_models import ScheduledEmbedding
+
+    # Build the real services first, so a request can't initialise them over the stand-ins
+    main.initialise_services()
+    embed_model = LatencyEmbedding(timer, latency_ms=args.embed_latency_ms, per_text_ms=args.embed_per_text_ms)
+    if main.SCHEDULER_ENABLED:
+        # Same path as the OpenAI provider in production: coalesced batches under embed_limiter
+        embed_model = main.embedding_scheduler = ScheduledEmbedding(embed_model, main.embed_limiter)
+    Settings.embed_model = embed_model
+    Settings.llm = FakeLLM(
+        timer, limiter=main.llm_limiter if main.SCHEDULER_ENABLED else None,
+        latency_ms=args.llm_latency_ms, stream_delay_ms=args.llm_stream_delay_ms
+    )
+    main.dappier_tool = FakeWebSearch(timer, latency_ms=args.web_latency_ms)
+
+    # main imports embed_and_store from ingestion when a document is ingested
+    ingestion.embed_and_store = timer.wrap("backend.embed_and_store", ingestion.embed_and_store)
+    for name, stage in [
+        ("ingest_document", "backend.ingest_document"),
+        ("lexical_search", "backend.lexical_search"),
+        ("pack_context", "backend.context_packing"),
+    ]:
+        setattr(main, name, timer.wrap(stage, getattr(main, name)))
+    for name, stage in [
+        ("resolve_documents", "backend.resolve_documents"),
+        ("plan_query", "backend.plan_query"),
+        ("retrieve_from_collections", "backend.vector_search"),
+        ("gather_web_and_document", "backend.gather_web_and_document"),
+        ("generate_answer", "backend.generate_answer"),
+        ("record_answer", "backend.record_answer"),
+    ]:
+        setattr(main, name, timer.wrap_async(stage, getattr(main, name)))
+    return main
+
+
+def use_memory_mongo(main):
+    documents = MemoryCollection("documents")
+    main.chats = AsyncMemoryCollection(MemoryCollection("chats"))
+    main.chat_summaries = AsyncMemoryCollection(MemoryCollection("chat_summaries"))
+    main.documents = AsyncMemoryCollection(documents)
+    main.documents_sync = documents
+
+
+def use_scratch_mongo(main, uri: str):
+    """Point main at a throwaway database; returns a function that drops it."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import MongoClient
+
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    async_db = AsyncIOMotorClient(uri)[name]
+    sync_client = MongoClient(uri)
+    main.chats = async_db.chats
+    main.chat_summaries = async_db.chat_summaries
+    main.documents = async_db.documents
+    main.documents_sync = sync_client[name].documents
+    return lambda: sync_client.drop_database(name)
+
+
+async def upload_one(client: httpx.AsyncClient, timer: StageTimer, chat_id: str, filename: str, text: str) -> str | None:
+    """Upload and wait for ingestion; returns an error message, or None on success."""
+    start = time.perf_counter()
+    response = await client.post(
+        "/upload/", params={"chat_id": chat_id},
+        files={"file": (filename, text.encode("utf-8"), "text/plain")}
+    )
+    timer.record("http.upload_accept", time.perf_counter() - start)
+    if response.status_code != 202:
+        return f"upload {filename}: HTTP {response.status_code} {response.text[:200]}"
+
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in JOB_DONE:
+            break
+        await asyncio.sleep(0.01)
+    timer.record("http.upload_to_indexed", time.perf_counter() - start)
+    if job["status"] == "failed":
+        return f"ingest {filename}: {job['error']}"
+    return None
+
+
+async def run_pool(concurrency: int, items: list, fn) -> list:
+    """Run `fn` over `items` with `concurrency` workers; results in item order."""
+    results = [None] * len(items)
+    queue: asyncio.Queue = asyncio.Queue()
+    for position, item in enumerate(items):
+        queue.put_nowait((position, item))
+
+    async def worker():
+        while not queue.empty():
+            position, item = queue.get_nowait()
+            results[position] = await fn(item)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return results
+
+
+async def run(args, main, timer: StageTimer) -> dict:
+    rng = np.random.default_rng(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    corpus = [make_document(rng, vocabulary, i, args.document_kb) for i in range(args.documents)]
+    pool = make_questions(rng, corpus, args.unique_questions, args.identifier_ratio)
+    workload = [pool[i] for i in rng.integers(len(pool), size=args.queries)]
+    errors: list[str] = []
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        upload_errors = await run_pool(
+            args.upload_concurrency, list(enumerate(corpus)),
+            lambda item: upload_one(client, timer, f"bench-chat-{item[0]}", f"doc{item[0]}.txt", item[1][0])
+        )
+        upload_seconds = time.perf_counter() - start
+        errors.extend(e for e in upload_errors if e)
+
+        counts = {"retrieval": {}, "cached": 0, "coalesced": 0, "web_search_used": 0, "llm_prompt_tokens": 0}
+
+        async def ask(item):
+            index, question = item
+            start = time.perf_counter()
+            response = await client.post(
+                "/query/", params={"threshold": args.threshold, "use_web_search": args.web_search, "timings": True},
+                json={"question": question, "chat_id": f"bench-chat-{index}"}
+            )
+            timer.record("http.query", time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"query: HTTP {response.status_code} {response.text[:200]}")
+                return
+            body = response.json()
+            retrieval = body.get("retrieval", "none")
+            counts["retrieval"][retrieval] = counts["retrieval"].get(retrieval, 0) + 1
+            for flag in ("cached", "coalesced", "web_search_used"):
+                counts[flag] += bool(body.get(flag))
+            # Counted by the token callback in the request that ran the LLM (not in coalesced ones)
+            counts["llm_prompt_tokens"] += body.get("timings", {}).get("tokens", {}).get("llm_prompt", 0)
+
+        start = time.perf_counter()
+        await run_pool(args.concurrency, workload, ask)
+        query_seconds = time.perf_counter() - start
+
+        cache_stats = (await client.get("/cache/stats")).json()
+
+    corpus_bytes = sum(len(text.encode("utf-8")) for text, _, _ in corpus)
+    return {
+        "config": {
+            **vars(args),
+            "storage_mode": main.CHROMA_STORAGE_MODE,
+            "hybrid_search": main.HYBRID_SEARCH_ENABLED,
+            "semantic_cache": main.SEMANTIC_CACHE_ENABLED,
+            "scheduler": main.SCHEDULER_ENABLED,
+            "context_packing": main.CONTEXT_PACKING_ENABLED,
+        },
+        "uploads": {
+            "documents": len(corpus),
+            "seconds": round(upload_seconds, 3),
+            "documents_per_second": round(len(corpus) / upload_seconds, 3) if upload_seconds else None,
+            "mb_per_second": round(corpus_bytes / 1e6 / upload_seconds, 3) if upload_seconds else None,
+        },
+        "queries": {
+            "requests": len(workload),
+            "seconds": round(query_seconds, 3),
+            "requests_per_second": round(len(workload) / query_seconds, 3) if query_seconds else None,
+            **counts,
+        },
+        "stages": timer.report(),
+        "errors": {"count": len(errors), "first": errors[:10]},
+        "cache_stats": cache_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=10, help="One document per chat")
+    parser.add_argument("--document-kb", type=int, default=20)
+    parser.add_argument("--vocabulary", type=int, default=2000)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--unique-questions", type=int, default=100, help="Queries are drawn from this many, so some repeat")
+    parser.add_argument("--identifier-ratio", type=float, default=0.2, help="Share of questions naming a part number")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--web-search", action="store_true", help="Send use_web_search=true")
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.5)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-stream-delay-ms", type=float, default=5.0)
+    parser.add_argument("--web-latency-ms", type=float, default=800.0)
+    parser.add_argument("--mongo-uri", help="Use a scratch database on this server instead of the in-memory stand-in")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    cwd = os.getcwd()
+    # main.py keeps Chroma, lexical indexes and upload spool files relative to the working directory
+    os.chdir(workdir)
+    drop_database = None
+    try:
+        timer = StageTimer()
+        app_module = load_app(args, timer)
+        if args.mongo_uri:
+            drop_database = use_scratch_mongo(app_module, args.mongo_uri)
+        else:
+            use_memory_mongo(app_module)
+        report = asyncio.run(run(args, app_module, timer))
+    finally:
+        if drop_database:
+            drop_database()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(output)
+    queries = report["queries"]
+    print(f"uploads {report['uploads']['documents_per_second']} docs/s, queries {queries['requests_per_second']} req/s, "
+          f"http.query p95 {report['stages'].get('http.query', {}).get('p95_ms')}ms, errors {report['errors']['count']}",
+          file=sys.stderr)
+    sys.exit(1 if report["errors"]["count"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Compare the two Chroma layouts (see chroma_layout.py) on synthetic data.
+
+For each document count, builds a fresh store in a temp directory with
+(a) one collection per document and (b) a shared collection filtered by
+`document_id`, then reports ingest time, cold client start + first lookup,
+query latency percentiles and on-disk size as JSON.
+
+Needs only chromadb and numpy; no API keys.
+
+Usage:
+    python benchmarks/bench_chroma_layout.py --docs 1000 10000 --chunks-per-doc 10
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def percentiles(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def fresh_client(path: str):
+    # Drop Chroma's per-path client cache so the next client really starts cold
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(path=path)
+
+
+def build(layout: str, path: str, docs: int, chunks: int, dim: int, rng) -> float:
+    client = fresh_client(path)
+    shared = client.get_or_create_collection("shared_chunks_0") if layout == "shared" else None
+    start = time.perf_counter()
+    for d in range(docs):
+        document_id = f"doc{d}"
+        embeddings = rng.standard_normal((chunks, dim)).astype(np.float32)
+        ids = [f"{document_id}-{c}" for c in range(chunks)]
+        texts = [f"chunk {c} of {document_id}" for c in range(chunks)]
+        if layout == "shared":
+            shared.add(ids=ids, embeddings=embeddings.tolist(), documents=texts,
+                       metadatas=[{"document_id": document_id}] * chunks)
+        else:
+            collection = client.create_collection(f"document_{document_id}")
+            collection.add(ids=ids, embeddings=embeddings.tolist(), documents=texts)
+    return time.perf_counter() - start
+
+
+def run_queries(layout: str, path: str, docs: int, dim: int, queries: int, top_k: int, rng) -> dict:
+    start = time.perf_counter()
+    client = fresh_client(path)
+    first_target = "shared_chunks_0" if layout == "shared" else "document_doc0"
+    client.get_collection(first_target)
+    cold_start = time.perf_counter() - start
+
+    shared = client.get_collection("shared_chunks_0") if layout == "shared" else None
+    samples = []
+    for _ in range(queries):
+        document_id = f"doc{rng.integers(docs)}"
+        embedding = rng.standard_normal(dim).astype(np.float32).tolist()
+        start = time.perf_counter()
+        if layout == "shared":
+            shared.query(query_embeddings=[embedding], n_results=top_k, where={"document_id": document_id})
+        else:
+            client.get_collection(f"document_{document_id}").query(query_embeddings=[embedding], n_results=top_k)
+        samples.append(time.perf_counter() - start)
+    return {"cold_start_ms": round(cold_start * 1000, 3), "query": percentiles(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--chunks-per-doc", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (ada-002 is 1536)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "results": []}
+    for docs in args.docs:
+        for layout in ("per_document", "shared"):
+            rng = np.random.default_rng(args.seed)
+            path = tempfile.mkdtemp(prefix=f"chroma_{layout}_{docs}_")
+            try:
+                ingest_seconds = build(layout, path, docs, args.chunks_per_doc, args.dim, rng)
+                result = run_queries(layout, path, docs, args.dim, args.queries, args.top_k, rng)
+                result.update({
+                    "layout": layout,
+                    "documents": docs,
+                    "chunks": docs * args.chunks_per_doc,
+                    "ingest_seconds": round(ingest_seconds, 3),
+                    "disk_bytes": dir_size(path),
+                })
+                report["results"].append(result)
+                print(f"{layout:>12} docs={docs}: ingest {ingest_seconds:.1f}s, "
+                      f"query p50 {result['query']['p50_ms']}ms, disk {result['disk_bytes'] / 1e6:.1f}MB", flush=True)
+            finally:
+                SharedSystemClient.clear_system_cache()
+                shutil.rmtree(path, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Compare Chroma with the flat NumPy store (see flat_store.py) on synthetic chats.
+
+Each chat is one collection of --chunks-per-chat embeddings, drawn around a
+few topic centres and normalised like real sentence embeddings. For each
+backend the same chats are ingested into a fresh temp directory, then
+queries (a chunk of a random chat plus noise) are run against that chat's
+collection. Reports ingest time, cold client start + first query, query
+latency percentiles, recall@k against exact float32 brute force, and
+on-disk size as JSON.
+
+Backends are "chroma" and "flat-<dtype>" (float32, float16, int8), with a
+"-rerank" suffix for the float32 rerank of quantised stores. Needs numpy,
+plus chromadb for the chroma backend; no API keys.
+
+Usage:
+    python benchmarks/bench_vector_store.py --chats 50 --chunks-per-chat 500
+    python benchmarks/bench_vector_store.py --backends flat-float16 flat-int8 flat-int8-rerank --dim 1536
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from flat_store import FlatCollection, FlatStoreClient  # noqa: E402
+
+DEFAULT_BACKENDS = ["chroma", "flat-float32", "flat-float16", "flat-int8", "flat-int8-rerank"]
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def percentiles(samples: list[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def make_chat(chunks: int, dim: int, topics: int, rng) -> np.ndarray:
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centres[rng.integers(topics, size=chunks)] + 0.6 * rng.standard_normal((chunks, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def open_client(backend: str, path: str):
+    """A fresh client for `backend`, so every run starts cold."""
+    if backend == "chroma":
+        import chromadb
+        from chromadb.api.client import SharedSystemClient
+        # Drop Chroma's per-path client cache so the next client really starts cold
+        SharedSystemClient.clear_system_cache()
+        return chromadb.PersistentClient(path=path)
+    return FlatStoreClient(path)
+
+
+def build(backend: str, path: str, chats: list[np.ndarray]) -> float:
+    client = open_client(backend, path)
+    start = time.perf_counter()
+    for c, vectors in enumerate(chats):
+        name = f"document_chat{c}"
+        if backend == "chroma":
+            collection = client.create_collection(name)
+        else:
+            _, dtype, *rerank = backend.split("-")
+            collection = FlatCollection.create(os.path.join(path, name), name, dtype=dtype, rerank=bool(rerank))
+        ids = [f"chat{c}-{i}" for i in range(len(vectors))]
+        texts = [f"chunk {i} of chat {c}" for i in range(len(vectors))]
+        # Ingestion adds nodes in EMBED_BATCH_SIZE batches
+        for start_row in range(0, len(vectors), 64):
+            rows = slice(start_row, start_row + 64)
+            collection.add(ids=ids[rows], embeddings=vectors[rows].tolist(), documents=texts[rows])
+    return time.perf_counter() - start
+
+
+def run_queries(backend: str, path: str, chats: list[np.ndarray], queries: int, top_k: int, rng) -> dict:
+    targets = [int(rng.integers(len(chats))) for _ in range(queries)]
+    embeddings = []
+    for c in targets:
+        query = chats[c][rng.integers(len(chats[c]))] + 0.05 * rng.standard_normal(chats[c].shape[1]).astype(np.float32)
+        embeddings.append(query / np.linalg.norm(query))
+
+    start = time.perf_counter()
+    client = open_client(backend, path)
+    client.get_collection("document_chat0").query(query_embeddings=[embeddings[0].tolist()], n_results=top_k)
+    cold_start = time.perf_counter() - start
+
+    samples, recalls = [], []
+    for c, embedding in zip(targets, embeddings):
+        start = time.perf_counter()
+        result = client.get_collection(f"document_chat{c}").query(query_embeddings=[embedding.tolist()], n_results=top_k)
+        samples.append(time.perf_counter() - start)
+
+        exact = np.argsort(((chats[c] - embedding) ** 2).sum(axis=1), kind="stable")[:top_k]
+        recalls.append(len({f"chat{c}-{i}" for i in exact} & set(result["ids"][0])) / top_k)
+    return {
+        "cold_start_ms": round(cold_start * 1000, 3),
+        "query": percentiles(samples),
+        f"recall_at_{top_k}": round(float(np.mean(recalls)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--chunks-per-chat", type=int, default=500)
+    parser.add_argument("--topics", type=int, default=20, help="Topic centres per chat")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (ada-002 is 1536)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    chats = [make_chat(args.chunks_per_chat, args.dim, args.topics, rng) for _ in range(args.chats)]
+    report = {"config": vars(args), "results": []}
+    for backend in args.backends:
+        path = tempfile.mkdtemp(prefix=f"vectors_{backend}_")
+        try:
+            ingest_seconds = build(backend, path, chats)
+            result = run_queries(backend, path, chats, args.queries, args.top_k, np.random.default_rng(args.seed + 1))
+            result.update({
+                "backend": backend,
+                "chunks": args.chats * args.chunks_per_chat,
+                "ingest_seconds": round(ingest_seconds, 3),
+                "disk_bytes": dir_size(path),
+            })
+            report["results"].append(result)
+            print(f"{backend:>18}: ingest {ingest_seconds:.1f}s, query p50 {result['query']['p50_ms']}ms, "
+                  f"recall@{args.top_k} {result[f'recall_at_{args.top_k}']}, disk {result['disk_bytes'] / 1e6:.1f}MB", flush=True)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
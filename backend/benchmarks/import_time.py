@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for main.py.
+
+Imports main in fresh interpreters (so nothing is cached in-process), takes
+the median wall time, and checks it against import_budget.json next to this
+script. The same run also reports, from `python -X importtime`, the modules
+with the largest cumulative import time, and fails if any module the budget
+lists under "deferred_modules" (llama-index, chromadb, the OpenAI SDK, ...)
+was imported: those belong in initialise_services or the function that
+uses them, not at module level.
+
+Exits non-zero when over budget, so it can run in CI after a dependency or
+import change. After a deliberate change, record the new baseline with
+--update (the budget is the measured median plus --headroom).
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --top 20
+    python benchmarks/import_time.py --update --headroom 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+# Prints the wall time of `import main` and the top-level packages it loaded
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(" ".join(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def run_probe(workdir: str, importtime: bool = False) -> tuple[float, set[str], str]:
+    """Import main once in a new interpreter: (seconds, top-level modules loaded, -X importtime log)."""
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR, "PYTHONDONTWRITEBYTECODE": "1"}
+    # main.py only reads the key at import time; nothing is called with it
+    env.setdefault("OPENAI_API_KEY", "import-time-check")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE]
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+    lines = result.stdout.strip().splitlines()
+    return float(lines[-2]), set(lines[-1].split()), result.stderr
+
+
+def slowest_imports(log: str, top: int) -> list[dict]:
+    """Modules with the largest cumulative time from a -X importtime log."""
+    rows = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   <self us> | <cumulative us> | <indented module name>"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def load_budget() -> dict:
+    with open(BUDGET_PATH) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time (the median is used)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to report")
+    parser.add_argument("--update", action="store_true", help="Write the measured median (plus headroom) as the new budget")
+    parser.add_argument("--headroom", type=float, default=0.5, help="With --update: budget = median * (1 + headroom)")
+    args = parser.parse_args()
+
+    budget = load_budget()
+    # A scratch working directory: importing main must not need (or create) any local state
+    with tempfile.TemporaryDirectory(prefix="import_time_") as workdir:
+        # One untimed run first, so the timed runs see warm OS file caches
+        run_probe(workdir)
+        samples = [run_probe(workdir)[0] for _ in range(args.runs)]
+        _, loaded, log = run_probe(workdir, importtime=True)
+
+    median_ms = round(statistics.median(samples) * 1000, 1)
+    deferred = sorted(set(budget.get("deferred_modules", [])) & loaded)
+    report = {
+        "import_main_ms": {
+            "median": median_ms,
+            "min": round(min(samples) * 1000, 1),
+            "max": round(max(samples) * 1000, 1),
+            "budget": budget["import_main_ms"],
+        },
+        "deferred_modules_imported": deferred,
+        "slowest_imports": slowest_imports(log, args.top),
+        "python": sys.version.split()[0],
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.update:
+        budget["import_main_ms"] = round(median_ms * (1 + args.headroom))
+        budget["measured_ms"] = median_ms
+        budget["python"] = report["python"]
+        with open(BUDGET_PATH, "w") as f:
+            json.dump(budget, f, indent=2)
+            f.write("\n")
+        print(f"budget updated to {budget['import_main_ms']}ms", file=sys.stderr)
+
+    failures = []
+    if not args.update and median_ms > budget["import_main_ms"]:
+        failures.append(f"import main took {median_ms}ms (budget {budget['import_main_ms']}ms)")
+    if deferred:
+        failures.append(f"imported at module level but should be deferred: {', '.join(deferred)}")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+In-memory stand-in for the MongoDB collections main.py uses.
+
+Covers the subset of pymongo/Motor the backend issues - equality and
+$in/$nin/$ne/$exists/$lt/$lte/$gt/$gte/$or/$and filters, projections,
+sort/skip/limit/batch_size cursors, $set/$setOnInsert/$inc/$unset updates
+with upsert - so the benchmark can run without a database. It is not a
+general MongoDB emulator.
+"""
+
+import copy
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _compare(op: str, value, arg) -> bool:
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+        if op == "$gt":
+            return value > arg
+        return value >= arg
+    except TypeError:
+        return False
+
+
+def _matches_operator(op: str, value, arg) -> bool:
+    present = None if value is _MISSING else value
+    if op == "$in":
+        return present in arg
+    if op == "$nin":
+        return present not in arg
+    if op == "$ne":
+        return present != arg
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op in ("$lt", "$lte", "$gt", "$gte"):
+        return _compare(op, value, arg)
+    raise NotImplementedError(f"Operator {op} is not supported by the in-memory stand-in")
+
+
+def matches(doc: dict, query: dict | None) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            if not all(_matches_operator(op, value, arg) for op, arg in condition.items()):
+                return False
+        elif (None if value is _MISSING else value) != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: dict | None) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = {key for key, flag in projection.items() if flag and key != "_id"}
+    if include:
+        projected = {key: doc[key] for key in include if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            projected["_id"] = doc["_id"]
+        return projected
+    for key, flag in projection.items():
+        if not flag:
+            doc.pop(key, None)
+    return doc
+
+
+def _sort_key(value):
+    # Missing/None sort first, as in MongoDB; mixed types fall back to their type name
+    if value is _MISSING or value is None:
+        return (0, "", 0)
+    return (1, type(value).__name__, value)
+
+
+def _normalise_sort(key_or_list, direction=None) -> list[tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            doc.update(copy.deepcopy(fields))
+        elif op == "$setOnInsert":
+            continue
+        elif op == "$inc":
+            for key, amount in fields.items():
+                doc[key] = doc.get(key, 0) + amount
+        elif op == "$unset":
+            for key in fields:
+                doc.pop(key, None)
+        else:
+            raise NotImplementedError(f"Update operator {op} is not supported by the in-memory stand-in")
+
+
+class MemoryCollection:
+    """Synchronous (pymongo-style) collection. Thread-safe."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _select(self, query, sort=None) -> list[dict]:
+        with self._lock:
+            selected = [doc for doc in self._docs if matches(doc, query)]
+        for key, direction in reversed(sort or []):
+            selected.sort(key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+        return selected
+
+    def insert_one(self, document: dict):
+        document.setdefault("_id", ObjectId())
+        with self._lock:
+            self._docs.append(copy.deepcopy(document))
+        return SimpleNamespace(inserted_id=document["_id"], acknowledged=True)
+
+    def find(self, query: dict | None = None, projection: dict | None = None, sort=None) -> "MemoryCursor":
+        cursor = MemoryCursor(self, query, projection)
+        return cursor.sort(sort) if sort else cursor
+
+    def find_one(self, query: dict | None = None, projection: dict | None = None, sort=None) -> dict | None:
+        selected = self._select(query, _normalise_sort(sort) if sort else None)
+        return _project(selected[0], projection) if selected else None
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool):
+        with self._lock:
+            targets = [doc for doc in self._docs if matches(doc, query)]
+            if not many:
+                targets = targets[:1]
+            for doc in targets:
+                _apply_update(doc, update, inserting=False)
+            upserted_id = None
+            if not targets and upsert:
+                doc = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+                doc.setdefault("_id", ObjectId())
+                _apply_update(doc, update, inserting=True)
+                self._docs.append(doc)
+                upserted_id = doc["_id"]
+        return SimpleNamespace(matched_count=len(targets), modified_count=len(targets), upserted_id=upserted_id)
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query: dict, update: dict, upsert: bool = False):
+        return self._update(query, update, upsert, many=True)
+
+    def _delete(self, query: dict, many: bool):
+        with self._lock:
+            deleted = 0
+            kept = []
+            for doc in self._docs:
+                if matches(doc, query) and (many or not deleted):
+                    deleted += 1
+                else:
+                    kept.append(doc)
+            self._docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def delete_one(self, query: dict):
+        return self._delete(query, many=False)
+
+    def delete_many(self, query: dict):
+        return self._delete(query, many=True)
+
+    def count_documents(self, query: dict, limit: int = 0) -> int:
+        count = len(self._select(query))
+        return min(count, limit) if limit else count
+
+    def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    def distinct(self, key: str, query: dict | None = None) -> list:
+        values = []
+        for doc in self._select(query):
+            value = _get(doc, key)
+            if value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    def create_index(self, keys, **kwargs) -> str:
+        return "_".join(f"{key}_{direction}" for key, direction in _normalise_sort(keys))
+
+
+class MemoryCursor:
+    def __init__(self, collection: MemoryCollection, query: dict | None, projection: dict | None):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: list[tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _normalise_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _results(self) -> list[dict]:
+        selected = self._collection._select(self._query, self._sort)[self._skip:]
+        if self._limit:
+            selected = selected[:self._limit]
+        return [_project(doc, self._projection) for doc in selected]
+
+    def __iter__(self):
+        return iter(self._results())
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for doc in self._results():
+            yield doc
+
+
+class AsyncMemoryCollection:
+    """Motor-style view of a MemoryCollection: the same data, awaitable methods."""
+
+    def __init__(self, collection: MemoryCollection):
+        self.sync = collection
+
+    def find(self, *args, **kwargs) -> MemoryCursor:
+        return self.sync.find(*args, **kwargs)
+
+    async def find_one(self, *args, **kwargs):
+        return self.sync.find_one(*args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return self.sync.insert_one(*args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return self.sync.update_one(*args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return self.sync.update_many(*args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return self.sync.delete_one(*args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return self.sync.delete_many(*args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return self.sync.count_documents(*args, **kwargs)
+
+    async def estimated_document_count(self):
+        return self.sync.estimated_document_count()
+
+    async def distinct(self, *args, **kwargs):
+        return self.sync.distinct(*args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return self.sync.create_index(*args, **kwargs)
@@ -0,0 +1,228 @@
+"""
+Offline stand-ins for the external services, with configurable latency.
+
+- LatencyEmbedding: the deterministic hashing embeddings from
+  embedding_models, plus a simulated API round-trip.
+- FakeLLM: a llama-index LLM that waits, then answers with a fixed prefix
+  and a short echo of the prompt (streamed word by word when asked).
+- FakeWebSearch: mimics the Dappier tool's search_real_time_data_string.
+
+Each records its calls in a StageTimer so the benchmark can report them
+next to the backend's own stages.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Sequence
+
+import numpy as np
+from llama_index.core.base.llms.generic_utils import (
+    astream_completion_response_to_chat_response,
+    completion_response_to_chat_response,
+    stream_completion_response_to_chat_response,
+)
+from llama_index.core.base.llms.types import ChatMessage, CompletionResponse, LLMMetadata
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+from embedding_models import HashingEmbedding
+from embedding_providers import HASHING_EMBEDDING_DIM
+from scheduler import LLM_COMPLETION_TOKENS_ESTIMATE, RateLimiter, estimate_tokens
+
+
+def summarise(samples: list[float]) -> dict:
+    """Count, mean and p50/p95/p99 of durations in seconds, reported in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+class StageTimer:
+    """Durations per named stage, from any thread."""
+
+    def __init__(self):
+        self._samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage: str, fn: Callable) -> Callable:
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def report(self) -> dict:
+        with self._lock:
+            return {stage: summarise(samples) for stage, samples in sorted(self._samples.items())}
+
+
+class LatencyEmbedding(HashingEmbedding):
+    """Hashing embeddings behind a simulated API: `latency_ms` per request plus `per_text_ms` per input."""
+
+    _latency: float = PrivateAttr()
+    _per_text: float = PrivateAttr()
+    _timer: StageTimer = PrivateAttr()
+
+    def __init__(self, timer: StageTimer, latency_ms: float = 50.0, per_text_ms: float = 0.5,
+                 dim: int = HASHING_EMBEDDING_DIM, **kwargs: Any):
+        super().__init__(dim=dim, **kwargs)
+        self._latency = latency_ms / 1000.0
+        self._per_text = per_text_ms / 1000.0
+        self._timer = timer
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LatencyEmbedding"
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        time.sleep(self._latency + self._per_text * len(texts))
+        vectors = self._embed(texts)
+        self._timer.record("provider.embed_chunks", time.perf_counter() - start)
+        return vectors
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        start = time.perf_counter()
+        time.sleep(self._latency + self._per_text)
+        vector = self._embed([query])[0]
+        self._timer.record("provider.embed_query", time.perf_counter() - start)
+        return vector
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        start = time.perf_counter()
+        await asyncio.sleep(self._latency + self._per_text)
+        vector = self._embed([query])[0]
+        self._timer.record("provider.embed_query", time.perf_counter() - start)
+        return vector
+
+
+class FakeLLM(CustomLLM):
+    """Answers after `latency_ms`; streams at `stream_delay_ms` per word.
+
+    Async calls wait for `limiter` first, as ScheduledOpenAI's do.
+    """
+
+    latency_ms: float = 300.0
+    stream_delay_ms: float = 5.0
+
+    _timer: StageTimer = PrivateAttr()
+    _limiter: RateLimiter | None = PrivateAttr()
+
+    def __init__(self, timer: StageTimer, limiter: RateLimiter | None = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._timer = timer
+        self._limiter = limiter
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=16385, num_output=512, model_name="fake-llm")
+
+    @staticmethod
+    def _answer(prompt: str) -> str:
+        words = prompt.split()
+        return "📄 From the document: offline benchmark answer based on " + " ".join(words[-12:])
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        start = time.perf_counter()
+        time.sleep(self.latency_ms / 1000.0)
+        self._timer.record("provider.llm", time.perf_counter() - start)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        response = self.complete(prompt, formatted=formatted)
+        text = ""
+        for word in response.text.split(" "):
+            delta = word if not text else f" {word}"
+            text += delta
+            time.sleep(self.stream_delay_ms / 1000.0)
+            yield CompletionResponse(text=text, delta=delta)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self._limiter is not None:
+            await self._limiter.aacquire(estimate_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE)
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        self._timer.record("provider.llm", time.perf_counter() - start)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen():
+            response = await self.acomplete(prompt, formatted=formatted)
+            text = ""
+            for word in response.text.split(" "):
+                delta = word if not text else f" {word}"
+                text += delta
+                await asyncio.sleep(self.stream_delay_ms / 1000.0)
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return completion_response_to_chat_response(self.complete(self.messages_to_prompt(messages), formatted=True))
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return stream_completion_response_to_chat_response(self.stream_complete(self.messages_to_prompt(messages), formatted=True))
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return completion_response_to_chat_response(await self.acomplete(self.messages_to_prompt(messages), formatted=True))
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return astream_completion_response_to_chat_response(
+            await self.astream_complete(self.messages_to_prompt(messages), formatted=True)
+        )
+
+
+class FakeWebSearch:
+    """Stands in for the Dappier tool: blocks for `latency_ms`, then returns canned results."""
+
+    def __init__(self, timer: StageTimer, latency_ms: float = 800.0):
+        self.latency = latency_ms / 1000.0
+        self.timer = timer
+
+    def search_real_time_data_string(self, query: str) -> str:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        self.timer.record("provider.web_search", time.perf_counter() - start)
+        return f"Offline web results for: {query}"
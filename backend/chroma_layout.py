@@ -0,0 +1,112 @@
+"""
+How document chunks are laid out in Chroma.
+
+Two storage modes, chosen per upload with CHROMA_STORAGE_MODE:
+
+- "per_document" (default): every upload gets its own `document_{uuid}`
+  collection.
+- "shared": chunks go into one of CHROMA_SHARED_SHARDS `shared_chunks_{n}`
+  collections, tagged with `document_id`/`chat_id` metadata, and queries are
+  filtered with `where`. This keeps chroma.sqlite3 small when there are many
+  documents.
+
+Each `documents` entry records its `storage_mode` and, for shared storage,
+the `chunk_document_id` whose chunks it reads, so both layouts can be served
+side by side (e.g. during migration).
+"""
+
+import hashlib
+import os
+import time
+
+STORAGE_PER_DOCUMENT = "per_document"
+STORAGE_SHARED = "shared"
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_data")
+CHROMA_STORAGE_MODE = os.getenv("CHROMA_STORAGE_MODE", STORAGE_PER_DOCUMENT)
+CHROMA_SHARED_SHARDS = int(os.getenv("CHROMA_SHARED_SHARDS", "1"))
+SHARED_COLLECTION_PREFIX = "shared_chunks"
+
+# Chunk metadata used for filtering only; keep it out of embeddings and prompts
+FILTER_METADATA_KEYS = ["document_id", "chat_id", "indexed_at"]
+
+
+def per_document_collection_name(document_id: str) -> str:
+    return f"document_{document_id}"
+
+
+def shared_collection_name(document_id: str, shards: int = CHROMA_SHARED_SHARDS, namespace: str | None = None) -> str:
+    """`namespace` separates embedding models, whose vectors can't share a collection."""
+    shard = int(hashlib.sha1(document_id.encode("utf-8")).hexdigest()[:8], 16) % max(shards, 1)
+    prefix = f"{SHARED_COLLECTION_PREFIX}_{namespace}" if namespace else SHARED_COLLECTION_PREFIX
+    return f"{prefix}_{shard}"
+
+
+def collection_name_for(document_id: str, storage_mode: str = CHROMA_STORAGE_MODE, namespace: str | None = None) -> str:
+    if storage_mode == STORAGE_SHARED:
+        return shared_collection_name(document_id, namespace=namespace)
+    return per_document_collection_name(document_id)
+
+
+def tag_nodes(nodes, document_id: str, chat_id: str | None):
+    """Add the filter metadata shared-collection queries rely on.
+
+    `indexed_at` lets the reaper tell chunks still being ingested from orphans.
+    Vector stores write each node's ref_doc_id over the `document_id` key when
+    they serialise it (llama-index's node_to_metadata_dict), so the node's
+    source reference is pointed at `document_id` as well.
+    """
+    from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
+
+    indexed_at = int(time.time())
+    for node in nodes:
+        node.metadata["document_id"] = document_id
+        source = node.relationships.get(NodeRelationship.SOURCE)
+        if isinstance(source, RelatedNodeInfo):
+            source.node_id = document_id
+        else:
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=document_id)
+        node.metadata["indexed_at"] = indexed_at
+        if chat_id:
+            node.metadata["chat_id"] = chat_id
+        node.excluded_embed_metadata_keys = list(set(node.excluded_embed_metadata_keys + FILTER_METADATA_KEYS))
+        node.excluded_llm_metadata_keys = list(set(node.excluded_llm_metadata_keys + FILTER_METADATA_KEYS))
+    return nodes
+
+
+def retrieval_targets(doc_entries: list[dict]) -> dict[str, list[str] | None]:
+    """Map collection name -> document ids to filter on (None = whole collection)."""
+    targets: dict[str, list[str] | None] = {}
+    for entry in doc_entries:
+        name = entry["collection_name"]
+        if entry.get("storage_mode") == STORAGE_SHARED:
+            ids = targets.setdefault(name, [])
+            if ids is not None and entry["chunk_document_id"] not in ids:
+                ids.append(entry["chunk_document_id"])
+        else:
+            targets[name] = None
+    return targets
+
+
+def where_for(document_ids: list[str] | None) -> dict | None:
+    if not document_ids:
+        return None
+    if len(document_ids) == 1:
+        return {"document_id": document_ids[0]}
+    return {"document_id": {"$in": sorted(document_ids)}}
+
+
+def chunk_sets(doc_entries: list[dict]) -> dict[str, tuple[str, str | None]]:
+    """Map each distinct chunk set a chat reads to (collection name, document id filter).
+
+    A chunk set is keyed by its collection name for per-document storage and
+    by the tagged document id for shared storage.
+    """
+    sets = {}
+    for entry in doc_entries:
+        if entry.get("storage_mode") == STORAGE_SHARED:
+            sets[entry["chunk_document_id"]] = (entry["collection_name"], entry["chunk_document_id"])
+        else:
+            sets[entry["collection_name"]] = (entry["collection_name"], None)
+    return sets
+
@@ -0,0 +1,88 @@
+"""
+Bounded, TTL-aware cache of per-collection query objects.
+
+Hot chats reuse the Chroma collection handle and its ChromaVectorStore
+instead of looking them up on every question. Entries are dropped when they
+expire, when the cache is full (least recently used first), or explicitly
+via `invalidate` when a collection's documents change.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+COLLECTION_CACHE_SIZE = int(os.getenv("COLLECTION_CACHE_SIZE", "256"))
+COLLECTION_CACHE_TTL_SECONDS = float(os.getenv("COLLECTION_CACHE_TTL_SECONDS", "600"))
+
+
+class CollectionHandle:
+    def __init__(self, name: str, collection, vector_store, count: int):
+        self.name = name
+        self.collection = collection
+        self.vector_store = vector_store
+        self.count = count
+        self.loaded_at = time.monotonic()
+
+
+class CollectionCache:
+    def __init__(self, max_entries: int = COLLECTION_CACHE_SIZE, ttl_seconds: float = COLLECTION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, CollectionHandle] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str, loader: Callable[[str], CollectionHandle]) -> CollectionHandle:
+        """Return the cached handle for `name`, calling `loader(name)` on a miss."""
+        with self._lock:
+            handle = self._entries.get(name)
+            if handle is not None and time.monotonic() - handle.loaded_at > self.ttl_seconds:
+                del self._entries[name]
+                self.expirations += 1
+                handle = None
+            if handle is not None:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return handle
+            self.misses += 1
+
+        # Load outside the lock; a concurrent miss for the same name just loads twice
+        handle = loader(name)
+
+        with self._lock:
+            self._entries[name] = handle
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return handle
+
+    def invalidate(self, name: str):
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
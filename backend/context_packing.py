@@ -0,0 +1,173 @@
+"""
+Token-budgeted context packing for answer synthesis.
+
+Retrieval returns a wider pool of candidates (CONTEXT_CANDIDATES) than the
+prompt should carry. pack_context picks from it with maximal marginal
+relevance (MMR): each step takes the candidate that ranks high but is least
+like the chunks already picked, so repetitive documents don't fill the
+prompt with near-duplicates. Text that a picked chunk already contains is
+cut from the next one (the CHUNK_OVERLAP span shared by adjacent chunks, or
+a chunk repeated in full), and chunks are added until CONTEXT_TOKEN_BUDGET
+is used up. A long chunk that doesn't fit is skipped, so it can't push a
+shorter relevant one out.
+
+Tokens are counted locally with tiktoken (the encoding gpt-3.5-turbo uses),
+falling back to the ~4 characters/token estimate when it isn't installed.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from retrieval import SIMILARITY_TOP_K
+from scheduler import estimate_tokens
+
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+# Tokens of retrieved text (with the metadata the LLM sees) per prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Candidates retrieved for packing to choose from (SIMILARITY_TOP_K when packing is off)
+CONTEXT_CANDIDATES = max(SIMILARITY_TOP_K, int(os.getenv("CONTEXT_CANDIDATES", "8"))) if CONTEXT_PACKING_ENABLED else SIMILARITY_TOP_K
+# 1.0 ranks by relevance only; lower values favour chunks unlike those already picked
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Shorter shared spans between chunks are left alone
+CONTEXT_MIN_OVERLAP_CHARS = int(os.getenv("CONTEXT_MIN_OVERLAP_CHARS", "20"))
+CONTEXT_TOKENIZER_ENCODING = os.getenv("CONTEXT_TOKENIZER_ENCODING", "cl100k_base")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """The tiktoken encoding, loaded on first use (False if tiktoken isn't available)."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER_ENCODING)
+                except Exception as e:
+                    print(f"Warning: tiktoken unavailable ({e}); estimating context tokens from length")
+                    _encoding = False
+    return _encoding
+
+
+def token_count(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` that token_count puts at `max_tokens` or fewer."""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())[:max_tokens]
+        # Decoding can split a character, and the result may encode to more tokens
+        while tokens and token_count(encoding.decode(tokens)) > max_tokens:
+            tokens = tokens[:-1]
+        return encoding.decode(tokens)
+    # estimate_tokens counts len // 4 + 1
+    return text[:max(0, max_tokens - 1) * 4]
+
+
+def overlap_length(first: str, second: str, min_chars: int = CONTEXT_MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest end of `first` that `second` starts with (0 if under min_chars)."""
+    head = second[:min_chars]
+    if len(head) < min_chars:
+        return 0
+    # The earliest match is the longest overlap
+    start = first.find(head, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(head, start + 1)
+    return 0
+
+
+def strip_overlaps(text: str, kept: list[str], min_chars: int = CONTEXT_MIN_OVERLAP_CHARS) -> str | None:
+    """`text` without the spans it shares with the edges of `kept` chunks (None if nothing new is left)."""
+    for other in kept:
+        if text in other:
+            return None
+        cut = overlap_length(other, text, min_chars)
+        if cut:
+            text = text[cut:].lstrip()
+        cut = overlap_length(text, other, min_chars)
+        if cut:
+            text = text[:-cut].rstrip()
+        if len(text) < min_chars:
+            return None
+    return text
+
+
+def _similarities(embeddings: list) -> np.ndarray | None:
+    """Pairwise cosine similarity of the candidates' embeddings (None if any is missing)."""
+    if not embeddings or any(embedding is None for embedding in embeddings):
+        return None
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    return matrix @ matrix.T
+
+
+def _word_overlap(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def pack_context(nodes: list, budget: int = CONTEXT_TOKEN_BUDGET, mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> list:
+    """Choose and trim best-first `nodes` (NodeWithScore) to fit `budget` tokens.
+
+    Relevance is taken from the incoming order, which already reflects vector
+    distance, rank fusion or BM25, so the routing decision and the packed
+    context agree. Redundancy is the cosine similarity of the chunks'
+    embeddings when retrieval returned them, otherwise word overlap. Returns
+    copies of the chosen nodes in the order they were picked; the first is
+    truncated to the budget if even it doesn't fit on its own.
+    """
+    from llama_index.core.schema import MetadataMode, NodeWithScore
+
+    if not nodes:
+        return []
+    count = len(nodes)
+    relevance = [1.0 - position / count for position in range(count)]
+    similarity = _similarities([getattr(node.node, "embedding", None) for node in nodes])
+    words = None if similarity is not None else [set(node.node.get_content().lower().split()) for node in nodes]
+
+    def redundancy(candidate: int, chosen: list[int]) -> float:
+        if not chosen:
+            return 0.0
+        if similarity is not None:
+            return max(float(similarity[candidate, other]) for other in chosen)
+        return max(_word_overlap(words[candidate], words[other]) for other in chosen)
+
+    remaining = list(range(count))
+    chosen: list[int] = []
+    kept_texts: list[str] = []
+    packed = []
+    used = 0
+    while remaining and used < budget:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy(i, chosen))
+        remaining.remove(best)
+        source = nodes[best]
+        text = strip_overlaps(source.node.get_content(), kept_texts)
+        if text is None:
+            continue
+
+        node = source.node.copy()
+        node.set_content(text)
+        tokens = token_count(node.get_content(metadata_mode=MetadataMode.LLM))
+        if used + tokens > budget:
+            if packed:
+                # Something shorter further down may still fit
+                continue
+            node.set_content(truncate_to_tokens(text, max(1, budget - (tokens - token_count(text)))))
+            tokens = token_count(node.get_content(metadata_mode=MetadataMode.LLM))
+
+        chosen.append(best)
+        kept_texts.append(text)
+        packed.append(NodeWithScore(node=node, score=source.score))
+        used += tokens
+    return packed
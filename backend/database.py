@@ -0,0 +1,133 @@
+"""
+MongoDB access.
+
+Request handlers use the Motor (asyncio) client so Mongo round-trips never
+block the event loop. Code running on the ingestion worker threads uses the
+synchronous pymongo client against the same database. Both clients share the
+pool settings below.
+
+The clients are created on first use rather than at import, so importing the
+app opens no connections; `chats`, `documents`, ... resolve to the real
+collections the first time they are touched.
+"""
+
+import asyncio
+import os
+import threading
+
+MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+
+_client_options = {
+    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+    "minPoolSize": MONGO_MIN_POOL_SIZE,
+    "serverSelectionTimeoutMS": MONGO_TIMEOUT_MS,
+}
+
+_clients: dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(kind: str):
+    """The shared "async" (Motor) or "sync" (pymongo) client, created on first call."""
+    with _clients_lock:
+        client = _clients.get(kind)
+        if client is None:
+            if kind == "async":
+                from motor.motor_asyncio import AsyncIOMotorClient
+                client = AsyncIOMotorClient(MONGO_URI, **_client_options)
+            else:
+                from pymongo import MongoClient
+                client = MongoClient(MONGO_URI, **_client_options)
+            _clients[kind] = client
+        return client
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+class LazyCollection:
+    """Stands in for a collection until it is first used."""
+
+    def __init__(self, kind: str, name: str):
+        self._kind = kind
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        return getattr(get_client(self._kind).ai20labs[self._name], attr)
+
+
+chats = LazyCollection("async", "chats")
+documents = LazyCollection("async", "documents")  # Document metadata
+# One document per chat (_id = chat_id): latest message, message count, threshold.
+# Kept up to date on every message write so listing chats never scans `chats`.
+chat_summaries = LazyCollection("async", "chat_summaries")
+
+# For the ingestion worker threads, which are off the event loop already
+documents_sync = LazyCollection("sync", "documents")
+
+
+async def ping(timeout: float) -> bool:
+    """Whether MongoDB answers within `timeout` seconds (for the readiness probe)."""
+    try:
+        await asyncio.wait_for(get_client("async").admin.command("ping"), timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+
+async def create_indexes():
+    """Create the indexes the per-chat lookups rely on. Safe to run on every start."""
+    from pymongo import ASCENDING, DESCENDING
+
+    await chats.create_index([("chat_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)])
+    await chats.create_index([("timestamp", DESCENDING)])
+    await documents.create_index([("chat_id", ASCENDING), ("uploaded_at", DESCENDING)])
+    await documents.create_index([("uploaded_at", DESCENDING), ("document_id", DESCENDING)])
+    await documents.create_index([("document_id", ASCENDING)], unique=True)
+    await documents.create_index([("content_hash", ASCENDING)])
+    await documents.create_index([("collection_name", ASCENDING)])
+    # Reference counts for chunk sets in shared collections (deletes and the reaper)
+    await documents.create_index([("chunk_document_id", ASCENDING)])
+    await chat_summaries.create_index([("latest_timestamp", DESCENDING), ("_id", DESCENDING)])
+
+
+def summary_pipeline(match: dict | None = None) -> list[dict]:
+    """Aggregation that builds chat_summaries entries from messages (those matching `match`)."""
+    return ([{"$match": match}] if match else []) + [
+        {"$sort": {"timestamp": -1}},
+        {"$group": {
+            "_id": "$chat_id",
+            "latest_question": {"$first": "$question"},
+            "latest_answer": {"$first": "$answer"},
+            "latest_timestamp": {"$first": "$timestamp"},
+            "threshold": {"$first": "$threshold"},
+            "created_at": {"$last": "$timestamp"},
+            "message_count": {"$sum": 1}
+        }},
+        {"$merge": {"into": "chat_summaries", "whenMatched": "keepExisting"}}
+    ]
+
+
+async def backfill_chat_summaries():
+    """Build chat_summaries from existing messages the first time it is empty."""
+    if await chat_summaries.estimated_document_count() > 0:
+        return
+    if await chats.estimated_document_count() == 0:
+        return
+    print("Backfilling chat summaries from existing messages")
+    await chats.aggregate(summary_pipeline(), allowDiskUse=True).to_list(length=None)
+
+
+async def backfill_chat_summary(chat_id: str) -> bool:
+    """Build one chat's summary from its messages (for chats the backfill missed); False if it has none."""
+    if not await chats.find_one({"chat_id": chat_id}, {"_id": 1}):
+        return False
+    await chats.aggregate(summary_pipeline({"chat_id": chat_id})).to_list(length=None)
+    return True
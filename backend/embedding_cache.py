@@ -0,0 +1,191 @@
+"""
+Persistent on-disk cache of chunk embeddings.
+
+`CachedEmbedding` wraps the configured embed model so that chunks already
+embedded once (shared boilerplate, re-uploads of lightly edited files) are
+served from a local SQLite file instead of the embedding API. Entries are
+keyed by a hash of the normalised chunk text, the model name and the chunk
+settings, and the least recently used entries are evicted past a size limit.
+The embedded text leaves out where a chunk came from (file name, page; see
+ingestion.LOCATION_METADATA_KEYS), so a repeated chunk hits wherever it is.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+# Lives next to the Chroma files so it shares their persistent volume
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./chroma_data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+
+
+def normalise_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """SQLite-backed LRU map of embedding key -> float32 vector."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(text: str, namespace: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{normalise_text(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> list[list[float] | None]:
+        if not keys:
+            return []
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return results
+
+    def put_many(self, keys: list[str], vectors: list[list[float]]):
+        if not keys:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in zip(keys, vectors)]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                excess = self._count - self.max_entries
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,)
+                ).rowcount
+                self._count -= evicted
+                self.evictions += evicted
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embed model wrapper that serves text embeddings from an EmbeddingCache.
+
+    Query embeddings are passed straight through; only chunk/text embeddings
+    are cached.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _namespace: str = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, chunk_size: int, chunk_overlap: int, **kwargs: Any):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._cache = cache
+        self._namespace = f"{inner.model_name}:{chunk_size}:{chunk_overlap}"
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _lookup(self, texts: list[str]) -> tuple[list[str], list[list[float] | None]]:
+        keys = [EmbeddingCache.make_key(text, self._namespace) for text in texts]
+        return keys, self._cache.get_many(keys)
+
+    def _fill(self, texts: list[str], keys: list[str], cached: list[list[float] | None], computed: list[list[float]]) -> list[list[float]]:
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        self._cache.put_many([keys[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            cached[i] = vector
+        return cached
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._inner._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return await self._inner._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        keys, cached = self._lookup(texts)
+        missing = [texts[i] for i, vector in enumerate(cached) if vector is None]
+        computed = self._inner._get_text_embeddings(missing) if missing else []
+        return self._fill(texts, keys, cached, computed)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        keys, cached = await asyncio.to_thread(self._lookup, texts)
+        missing = [texts[i] for i, vector in enumerate(cached) if vector is None]
+        computed = await self._inner._aget_text_embeddings(missing) if missing else []
+        return await asyncio.to_thread(self._fill, texts, keys, cached, computed)
@@ -0,0 +1,135 @@
+"""
+The in-process embedding models behind EMBEDDING_PROVIDER=local and
+EMBEDDING_PROVIDER=hashing (see embedding_providers.py for configuration).
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from embedding_providers import PROVIDER_LOCAL
+
+
+class LocalEmbedding(BaseEmbedding):
+    """ONNX sentence-embedding model run in-process: mean pooling + L2 norm in NumPy."""
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: set = PrivateAttr()
+
+    def __init__(self, model_path: str, model_name: str, batch_size: int = 32, max_length: int = 256,
+                 threads: int = 0, **kwargs: Any):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ValueError("EMBEDDING_PROVIDER=local needs the onnxruntime and tokenizers packages.") from e
+
+        super().__init__(model_name=f"{PROVIDER_LOCAL}:{model_name}", embed_batch_size=batch_size, **kwargs)
+        tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=max_length)
+        tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._tokenizer = tokenizer
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.embed_batch_size):
+            encodings = self._tokenizer.encode_batch(texts[start:start + self.embed_batch_size])
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self._session.run(None, feeds)[0]  # (batch, tokens, dim)
+
+            # Mean over real tokens, then unit length, for the whole batch at once
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.astype(np.float32).tolist())
+        return vectors
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return (await asyncio.to_thread(self._embed, [query]))[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self._embed, texts)
+
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=65536)
+def _feature_hash(feature: str) -> int:
+    # blake2b rather than hash(): stable across processes and restarts
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEmbedding(BaseEmbedding):
+    """Signed feature hashing of words and adjacent word pairs into `dim` buckets."""
+
+    _dim: int = PrivateAttr()
+
+    def __init__(self, dim: int = 384, **kwargs: Any):
+        super().__init__(model_name=f"hashing-{dim}", embed_batch_size=256, **kwargs)
+        self._dim = dim
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            words = _WORD.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                h = _feature_hash(feature)
+                rows.append(row)
+                cols.append(h % self._dim)
+                signs.append(1.0 if h >> 63 else -1.0)
+        matrix = np.zeros((len(texts), self._dim), dtype=np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)), np.array(signs, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._embed([query])[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts)
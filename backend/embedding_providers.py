@@ -0,0 +1,88 @@
+"""
+Embedding providers, selected with EMBEDDING_PROVIDER.
+
+- "openai" (default): OpenAIEmbedding, EMBEDDING_MODEL defaults to
+  text-embedding-ada-002.
+- "local": a sentence-embedding model exported to ONNX, run in-process on
+  the CPU. LOCAL_EMBEDDING_MODEL_PATH must hold `model.onnx` and
+  `tokenizer.json` (e.g. all-MiniLM-L6-v2), so no network access is needed.
+  Needs the optional `onnxruntime` and `tokenizers` packages.
+- "hashing": deterministic feature hashing of words and word pairs. No model
+  and no network; meant for offline tests and benchmarks, not for quality.
+
+Every `documents` entry records the provider and model its vectors came from
+(`embedding_info`). Queries only search documents embedded by the running
+provider, and uploads only deduplicate against them, so vectors from
+different models are never compared.
+
+The model classes are in embedding_models.py and are only imported by
+create_embed_model, so reading this configuration doesn't import llama-index.
+"""
+
+import os
+import re
+
+PROVIDER_OPENAI = "openai"
+PROVIDER_LOCAL = "local"
+PROVIDER_HASHING = "hashing"
+
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "384"))
+DEFAULT_MODELS = {
+    PROVIDER_OPENAI: "text-embedding-ada-002",
+    PROVIDER_LOCAL: "all-MiniLM-L6-v2",
+    PROVIDER_HASHING: f"hashing-{HASHING_EMBEDDING_DIM}",
+}
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", PROVIDER_OPENAI).lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", DEFAULT_MODELS.get(EMBEDDING_PROVIDER, ""))
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv("LOCAL_EMBEDDING_MODEL_PATH", "./models/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", "256"))
+# 0 lets onnxruntime pick (one thread per physical core)
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))
+
+# What `documents` entries written before providers were configurable were embedded with
+LEGACY_EMBEDDING = {"embedding_provider": PROVIDER_OPENAI, "embedding_model": DEFAULT_MODELS[PROVIDER_OPENAI]}
+EMBEDDING_INFO = {"embedding_provider": EMBEDDING_PROVIDER, "embedding_model": EMBEDDING_MODEL}
+
+
+def embedding_info(entry: dict) -> dict:
+    """The provider/model a `documents` entry was embedded with."""
+    return {
+        "embedding_provider": entry.get("embedding_provider", LEGACY_EMBEDDING["embedding_provider"]),
+        "embedding_model": entry.get("embedding_model", LEGACY_EMBEDDING["embedding_model"]),
+    }
+
+
+def embedding_filter(info: dict = EMBEDDING_INFO) -> dict:
+    """Mongo filter for `documents` entries embedded with `info`."""
+    if info == LEGACY_EMBEDDING:
+        # Entries without the fields predate them and were embedded with the legacy model
+        return {key: {"$in": [value, None]} for key, value in info.items()}
+    return dict(info)
+
+
+def embedding_namespace(info: dict = EMBEDDING_INFO) -> str | None:
+    """Suffix that keeps shared Chroma collections single-model (None for the legacy model)."""
+    info = embedding_info(info)
+    if info == LEGACY_EMBEDDING:
+        return None
+    slug = re.sub(r"[^a-z0-9]+", "-", f"{info['embedding_provider']}-{info['embedding_model']}".lower())
+    return slug.strip("-")[:40]
+
+
+def create_embed_model(openai_api_key: str | None = None, max_retries: int = 10):
+    """The BaseEmbedding for EMBEDDING_PROVIDER."""
+    if EMBEDDING_PROVIDER == PROVIDER_OPENAI:
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        return OpenAIEmbedding(api_key=openai_api_key, model=EMBEDDING_MODEL, max_retries=max_retries)
+    if EMBEDDING_PROVIDER == PROVIDER_LOCAL:
+        from embedding_models import LocalEmbedding
+        return LocalEmbedding(
+            model_path=LOCAL_EMBEDDING_MODEL_PATH, model_name=EMBEDDING_MODEL, batch_size=LOCAL_EMBEDDING_BATCH_SIZE,
+            max_length=LOCAL_EMBEDDING_MAX_LENGTH, threads=LOCAL_EMBEDDING_THREADS
+        )
+    if EMBEDDING_PROVIDER == PROVIDER_HASHING:
+        from embedding_models import HashingEmbedding
+        return HashingEmbedding(dim=HASHING_EMBEDDING_DIM)
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{EMBEDDING_PROVIDER}' (expected openai, local or hashing).")
@@ -0,0 +1,603 @@
+"""
+In-process flat vector store, an alternative to Chroma for chunk collections.
+
+A chat's documents hold a few hundred to a few thousand chunks, where one
+exact scan in NumPy beats a round trip through Chroma's client, SQLite and
+HNSW layers. Each collection is a directory under FLAT_STORE_PATH:
+
+- vectors.bin: the embeddings, row-major, as FLAT_STORE_DTYPE (float16 by
+  default; int8 rows are scaled per row, with the scales in scales.bin)
+- sqnorms.bin: each row's exact squared norm, for L2 distances
+- exact.bin: float32 copies, to rerank the shortlist of a quantised store
+  exactly (FLAT_STORE_RERANK)
+- chunks.jsonl: id, text and metadata of each row
+- manifest.json: dimension, dtype, row count and collection metadata
+
+The files are memory-mapped, so only the rows a query touches are paged in
+and nothing is loaded at startup. Ingestion appends to them and replaces the
+manifest last, so a crash mid-batch leaves the previous rows intact; deletes
+rewrite the collection. A query is one matrix-vector product over the rows
+(those matching `where`, if given), a top-k by argpartition, and an exact
+float32 rerank of the best k * FLAT_STORE_RERANK_FACTOR. Distances are the
+ones Chroma reports (squared L2 unless the collection's `hnsw:space` says
+otherwise), so thresholds such as SEMANTIC_CACHE_MAX_DISTANCE carry over.
+
+FlatCollection implements the part of Chroma's Collection API the backend
+uses (add, upsert, get, query, delete, count), and VectorClient the client
+calls, serving each collection from the backend that holds it. New
+collections go to VECTOR_BACKEND; existing Chroma data keeps working
+without a migration.
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from chroma_layout import CHROMA_PATH
+
+BACKEND_CHROMA = "chroma"
+BACKEND_FLAT = "flat"
+
+# Where new collections are created: chroma or flat
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", BACKEND_CHROMA)
+FLAT_STORE_PATH = os.getenv("FLAT_STORE_PATH", os.path.join(CHROMA_PATH, "flat"))
+# Storage type of new flat collections: float32, float16 or int8
+FLAT_STORE_DTYPE = os.getenv("FLAT_STORE_DTYPE", "float16")
+# Keep float32 copies of quantised vectors (on disk, paged in per shortlist) and rerank with them
+FLAT_STORE_RERANK = os.getenv("FLAT_STORE_RERANK", "false").lower() == "true"
+# Shortlist size for the rerank, as a multiple of n_results
+FLAT_STORE_RERANK_FACTOR = int(os.getenv("FLAT_STORE_RERANK_FACTOR", "4"))
+# Rows converted to float32 per matmul, bounding the temporary array
+SCORE_BLOCK_ROWS = 65536
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]*$")
+_REWRITE_SUFFIX = ".rewrite"
+_RETIRED_SUFFIX = ".retired"
+# 2**(127 - 15): rebiases a float16 exponent placed in a float32
+_FLOAT16_REBIAS = np.float32(2.0 ** 112)
+
+
+def quantise(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """`vectors` (float32) in storage form, with per-row scales for int8."""
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(DTYPES[dtype]), None
+
+
+def _to_float32(block: np.ndarray) -> np.ndarray:
+    """`block` as float32; float16 is converted with integer ops, which NumPy vectorises where astype doesn't."""
+    if block.dtype != np.float16:
+        return block.astype(np.float32, copy=False)
+    # Sign to bit 31, exponent and mantissa to bits 13-30, then rescale: exact for finite values, subnormals included
+    bits = block.view(np.uint16).astype(np.uint32)
+    sign = bits & 0x8000
+    bits &= 0x7FFF
+    bits <<= 13
+    sign <<= 16
+    bits |= sign
+    values = bits.view(np.float32)
+    values *= _FLOAT16_REBIAS
+    return values
+
+
+def _matches(metadata: dict, where: dict) -> bool:
+    """Evaluate the subset of Chroma's `where` filters this backend uses."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, argument in condition.items():
+            if operator == "$eq":
+                ok = value == argument
+            elif operator == "$ne":
+                ok = value != argument
+            elif operator == "$in":
+                ok = value in argument
+            elif operator == "$nin":
+                ok = value not in argument
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                ok = {"$gt": value > argument, "$gte": value >= argument, "$lt": value < argument, "$lte": value <= argument}[operator]
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+            if not ok:
+                return False
+    return True
+
+
+def _map(path: str, dtype, shape: tuple) -> np.ndarray:
+    if not all(shape):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def _append(path: str, data: bytes, offset: int):
+    """Write `data` at `offset`, dropping whatever an interrupted earlier write left past it."""
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+
+
+def _write_json(path: str, value: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+class _Rows:
+    """A read-only view of a collection's files as of one manifest."""
+
+    def __init__(self, path: str, manifest: dict):
+        count, dim = manifest["count"], manifest["dim"] or 0
+        self.count = count
+        self.dim = dim
+        self.space = (manifest["metadata"] or {}).get("hnsw:space", "l2")
+        self.vectors = _map(os.path.join(path, "vectors.bin"), DTYPES[manifest["dtype"]], (count, dim))
+        self.scales = _map(os.path.join(path, "scales.bin"), np.float32, (count,)) if manifest["dtype"] == "int8" else None
+        self.sqnorms = _map(os.path.join(path, "sqnorms.bin"), np.float32, (count,))
+        self.exact = _map(os.path.join(path, "exact.bin"), np.float32, (count, dim)) if manifest["rerank"] else None
+
+        self.ids, self.documents, self.metadatas = [], [], []
+        if count:
+            with open(os.path.join(path, "chunks.jsonl"), "rb") as f:
+                data = f.read(manifest["chunks_bytes"])
+            for line in data.splitlines():
+                chunk = json.loads(line)
+                self.ids.append(chunk["id"])
+                self.documents.append(chunk["document"])
+                self.metadatas.append(chunk["metadata"])
+        self.positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        self._by_document = None
+
+    def by_document(self) -> dict[str, np.ndarray]:
+        """Row positions per `document_id`, for shared collections' filtered queries."""
+        if self._by_document is None:
+            groups: dict[str, list[int]] = {}
+            for position, metadata in enumerate(self.metadatas):
+                groups.setdefault((metadata or {}).get("document_id"), []).append(position)
+            self._by_document = {key: np.asarray(value, dtype=np.int64) for key, value in groups.items()}
+        return self._by_document
+
+    def select(self, where: dict | None) -> np.ndarray | None:
+        """Positions of the rows matching `where` (None means all of them)."""
+        if not where:
+            return None
+        if list(where) == ["document_id"]:
+            condition = where["document_id"]
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            if list(condition) in (["$eq"], ["$in"]):
+                wanted = [condition["$eq"]] if "$eq" in condition else condition["$in"]
+                groups = self.by_document()
+                parts = [groups[key] for key in wanted if key in groups]
+                return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        return np.asarray([p for p, metadata in enumerate(self.metadatas) if _matches(metadata or {}, where)], dtype=np.int64)
+
+    def embedding(self, position: int) -> list[float]:
+        if self.exact is not None:
+            return self.exact[position].tolist()
+        vector = _to_float32(self.vectors[position]).copy()
+        if self.scales is not None:
+            vector *= self.scales[position]
+        return vector.tolist()
+
+
+class FlatCollection:
+    """One flat collection; method names and result shapes follow chromadb's Collection."""
+
+    def __init__(self, path: str, name: str):
+        self.name = name
+        self.path = path
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._lock = threading.RLock()
+        self._rows: _Rows | None = None
+        self._version = None
+
+    @classmethod
+    def create(cls, path: str, name: str, metadata: dict | None = None, dtype: str = FLAT_STORE_DTYPE,
+               rerank: bool = FLAT_STORE_RERANK) -> "FlatCollection":
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported FLAT_STORE_DTYPE: {dtype} (expected one of {', '.join(DTYPES)})")
+        os.makedirs(path, exist_ok=True)
+        _write_json(os.path.join(path, "manifest.json"), {
+            "name": name,
+            "dim": None,
+            "dtype": dtype,
+            # float32 vectors are already exact
+            "rerank": rerank and dtype != "float32",
+            "count": 0,
+            "chunks_bytes": 0,
+            "metadata": metadata,
+            "created_at": int(time.time()),
+        })
+        return cls(path, name)
+
+    def _manifest(self) -> dict:
+        with open(self._manifest_path) as f:
+            return json.load(f)
+
+    def _snapshot(self) -> _Rows:
+        """The current rows, re-read only when another writer has replaced the manifest."""
+        with self._lock:
+            stat = os.stat(self._manifest_path)
+            version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if self._rows is None or version != self._version:
+                self._rows = _Rows(self.path, self._manifest())
+                self._version = version
+            return self._rows
+
+    @property
+    def metadata(self) -> dict | None:
+        return self._manifest()["metadata"]
+
+    def count(self) -> int:
+        return self._manifest()["count"]
+
+    def add(self, ids: list[str], embeddings=None, metadatas: list[dict] | None = None, documents: list[str] | None = None, **kwargs):
+        if embeddings is None:
+            raise ValueError("Flat collections store precomputed embeddings only")
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got an array of shape {vectors.shape}")
+        with self._lock:
+            manifest = self._manifest()
+            rows = self._snapshot()
+            dim = manifest["dim"] or vectors.shape[1]
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality {dim}")
+
+            # Like Chroma, ids that already exist are left as they are
+            seen = set(rows.positions)
+            keep = []
+            for index, chunk_id in enumerate(ids):
+                if chunk_id not in seen:
+                    seen.add(chunk_id)
+                    keep.append(index)
+            if not keep:
+                return
+            vectors = vectors[keep]
+            lines = b"".join(
+                json.dumps({
+                    "id": ids[index],
+                    "document": documents[index] if documents else None,
+                    "metadata": metadatas[index] if metadatas else None,
+                }).encode("utf-8") + b"\n"
+                for index in keep
+            )
+
+            count = manifest["count"]
+            stored, scales = quantise(vectors, manifest["dtype"])
+            _append(os.path.join(self.path, "vectors.bin"), stored.tobytes(), count * dim * stored.itemsize)
+            if scales is not None:
+                _append(os.path.join(self.path, "scales.bin"), scales.tobytes(), count * 4)
+            sqnorms = np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)
+            _append(os.path.join(self.path, "sqnorms.bin"), sqnorms.tobytes(), count * 4)
+            if manifest["rerank"]:
+                _append(os.path.join(self.path, "exact.bin"), vectors.tobytes(), count * dim * 4)
+            _append(os.path.join(self.path, "chunks.jsonl"), lines, manifest["chunks_bytes"])
+
+            manifest.update(dim=dim, count=count + len(keep), chunks_bytes=manifest["chunks_bytes"] + len(lines))
+            _write_json(self._manifest_path, manifest)
+
+    def upsert(self, ids: list[str], embeddings=None, metadatas: list[dict] | None = None, documents: list[str] | None = None, **kwargs):
+        with self._lock:
+            existing = [chunk_id for chunk_id in ids if chunk_id in self._snapshot().positions]
+            if existing:
+                self.delete(ids=existing)
+            self.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def get(self, ids: list[str] | None = None, where: dict | None = None, limit: int | None = None, offset: int | None = None,
+            include: list[str] = ("metadatas", "documents"), **kwargs) -> dict:
+        rows = self._snapshot()
+        if ids is not None:
+            wanted = {rows.positions[chunk_id] for chunk_id in ids if chunk_id in rows.positions}
+            positions = sorted(wanted)
+        else:
+            positions = range(rows.count)
+        if where:
+            positions = [p for p in positions if _matches(rows.metadatas[p] or {}, where)]
+        positions = list(positions)[offset or 0:]
+        if limit is not None:
+            positions = positions[:limit]
+        return {
+            "ids": [rows.ids[p] for p in positions],
+            "documents": [rows.documents[p] for p in positions] if "documents" in include else None,
+            "metadatas": [rows.metadatas[p] for p in positions] if "metadatas" in include else None,
+            "embeddings": [rows.embedding(p) for p in positions] if "embeddings" in include else None,
+        }
+
+    def _distances(self, dots: np.ndarray, sqnorms: np.ndarray, query: np.ndarray, space: str) -> np.ndarray:
+        if space == "ip":
+            return 1.0 - dots
+        if space == "cosine":
+            norms = np.sqrt(sqnorms) * float(np.linalg.norm(query))
+            return 1.0 - dots / np.where(norms == 0, 1.0, norms)
+        return np.maximum(sqnorms + float(query @ query) - 2.0 * dots, 0.0)
+
+    def _nearest(self, rows: _Rows, query: np.ndarray, k: int, selected: np.ndarray | None, space: str) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and distances of the `k` rows (of `selected`) closest to `query`, best first."""
+        total = rows.count if selected is None else len(selected)
+        if not total or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if query.shape[0] != rows.dim:
+            raise ValueError(f"Embedding dimension {query.shape[0]} does not match collection dimensionality {rows.dim}")
+
+        dots = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SCORE_BLOCK_ROWS):
+            index = slice(start, start + SCORE_BLOCK_ROWS) if selected is None else selected[start:start + SCORE_BLOCK_ROWS]
+            block = _to_float32(np.asarray(rows.vectors[index])) @ query
+            if rows.scales is not None:
+                block *= rows.scales[index]
+            dots[start:start + len(block)] = block
+        sqnorms = np.asarray(rows.sqnorms if selected is None else rows.sqnorms[selected])
+        distances = self._distances(dots, sqnorms, query, space)
+
+        shortlist_size = min(total, k * max(FLAT_STORE_RERANK_FACTOR, 1) if rows.exact is not None else k)
+        if shortlist_size < total:
+            shortlist = np.argpartition(distances, shortlist_size - 1)[:shortlist_size]
+        else:
+            shortlist = np.arange(total)
+        positions = shortlist if selected is None else selected[shortlist]
+        if rows.exact is not None:
+            exact = np.asarray(rows.exact[positions])
+            distances = self._distances(exact @ query, np.asarray(rows.sqnorms[positions]), query, space)
+        else:
+            distances = distances[shortlist]
+        order = np.argsort(distances, kind="stable")[:k]
+        return positions[order], distances[order]
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict | None = None,
+              include: list[str] = ("metadatas", "documents", "distances"), **kwargs) -> dict:
+        rows = self._snapshot()
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        selected = rows.select(where)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        for query in queries:
+            positions, distances = self._nearest(rows, query, n_results, selected, rows.space)
+            results["ids"].append([rows.ids[p] for p in positions])
+            results["documents"].append([rows.documents[p] for p in positions])
+            results["metadatas"].append([rows.metadatas[p] for p in positions])
+            results["distances"].append([float(d) for d in distances])
+            if "embeddings" in include:
+                results["embeddings"].append([rows.embedding(p) for p in positions])
+        return {key: value if key == "ids" or key in include else None for key, value in results.items()}
+
+    def delete(self, ids: list[str] | None = None, where: dict | None = None, **kwargs):
+        if ids is None and not where:
+            raise ValueError("You must provide either ids or where to delete")
+        with self._lock:
+            rows = self._snapshot()
+            doomed = set(range(rows.count)) if ids is None else {rows.positions[i] for i in ids if i in rows.positions}
+            if where:
+                doomed = {p for p in doomed if _matches(rows.metadatas[p] or {}, where)}
+            if doomed:
+                self._rewrite(rows, [p for p in range(rows.count) if p not in doomed])
+
+    def _rewrite(self, rows: _Rows, keep: list[int]):
+        """Rebuild the collection with only the rows at `keep`, then swap it in whole."""
+        manifest = self._manifest()
+        tmp_path = self.path + _REWRITE_SUFFIX
+        retired_path = self.path + _RETIRED_SUFFIX
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        index = np.asarray(keep, dtype=np.int64)
+        with open(os.path.join(tmp_path, "vectors.bin"), "wb") as f:
+            f.write(np.asarray(rows.vectors[index]).tobytes())
+        if rows.scales is not None:
+            with open(os.path.join(tmp_path, "scales.bin"), "wb") as f:
+                f.write(np.asarray(rows.scales[index]).tobytes())
+        with open(os.path.join(tmp_path, "sqnorms.bin"), "wb") as f:
+            f.write(np.asarray(rows.sqnorms[index]).tobytes())
+        if rows.exact is not None:
+            with open(os.path.join(tmp_path, "exact.bin"), "wb") as f:
+                f.write(np.asarray(rows.exact[index]).tobytes())
+        lines = b"".join(
+            json.dumps({"id": rows.ids[p], "document": rows.documents[p], "metadata": rows.metadatas[p]}).encode("utf-8") + b"\n"
+            for p in keep
+        )
+        with open(os.path.join(tmp_path, "chunks.jsonl"), "wb") as f:
+            f.write(lines)
+        manifest.update(count=len(keep), chunks_bytes=len(lines))
+        _write_json(os.path.join(tmp_path, "manifest.json"), manifest)
+
+        # Open memory maps keep reading the old files until they are released
+        os.rename(self.path, retired_path)
+        os.rename(tmp_path, self.path)
+        shutil.rmtree(retired_path, ignore_errors=True)
+        self._rows = None
+
+
+class FlatStoreClient:
+    """Flat collections under one directory; method names follow chromadb's client."""
+
+    def __init__(self, path: str = FLAT_STORE_PATH):
+        self.path = path
+        self._collections: dict[str, FlatCollection] = {}
+        self._lock = threading.Lock()
+
+    def _collection_path(self, name: str) -> str:
+        if not _COLLECTION_NAME.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+        path = os.path.join(self.path, name)
+        # A rewrite interrupted between its two renames
+        if not os.path.exists(path) and os.path.exists(path + _RETIRED_SUFFIX):
+            os.rename(path + _RETIRED_SUFFIX, path)
+        return path
+
+    def has_collection(self, name: str) -> bool:
+        return _COLLECTION_NAME.match(name) is not None and os.path.exists(os.path.join(self._collection_path(name), "manifest.json"))
+
+    def get_collection(self, name: str, **kwargs) -> FlatCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not self.has_collection(name):
+                    raise ValueError(f"Collection {name} does not exist.")
+                collection = self._collections[name] = FlatCollection(self._collection_path(name), name)
+            return collection
+
+    def get_or_create_collection(self, name: str, metadata: dict | None = None, **kwargs) -> FlatCollection:
+        with self._lock:
+            if name not in self._collections and not self.has_collection(name):
+                self._collections[name] = FlatCollection.create(self._collection_path(name), name, metadata)
+        return self.get_collection(name)
+
+    def create_collection(self, name: str, metadata: dict | None = None, **kwargs) -> FlatCollection:
+        if self.has_collection(name):
+            raise ValueError(f"Collection {name} already exists.")
+        return self.get_or_create_collection(name, metadata)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            if not self.has_collection(name):
+                raise ValueError(f"Collection {name} does not exist.")
+            self._collections.pop(name, None)
+            shutil.rmtree(self._collection_path(name))
+
+    def list_collections(self) -> list[FlatCollection]:
+        if not os.path.isdir(self.path):
+            return []
+        return [self.get_collection(name) for name in sorted(os.listdir(self.path)) if self.has_collection(name)]
+
+    def heartbeat(self) -> int:
+        os.makedirs(self.path, exist_ok=True)
+        return time.time_ns()
+
+
+class VectorClient:
+    """Routes collection calls to the flat store or Chroma, by where each collection lives.
+
+    A name found in the flat store is served from it; any other existing
+    collection from Chroma. New collections are created in VECTOR_BACKEND.
+    Chroma is only opened when a call needs it, so a flat-only deployment
+    never loads chromadb.
+    """
+
+    def __init__(self, chroma_path: str = CHROMA_PATH, flat_path: str = FLAT_STORE_PATH, backend: str = VECTOR_BACKEND):
+        if backend not in (BACKEND_CHROMA, BACKEND_FLAT):
+            raise ValueError(f"Unsupported VECTOR_BACKEND: {backend} (expected {BACKEND_CHROMA} or {BACKEND_FLAT})")
+        self.backend = backend
+        self.chroma_path = chroma_path
+        self.flat = FlatStoreClient(flat_path)
+        self._chroma = None
+        self._lock = threading.Lock()
+
+    @property
+    def chroma(self):
+        if self._chroma is None:
+            with self._lock:
+                if self._chroma is None:
+                    import chromadb
+                    self._chroma = chromadb.PersistentClient(path=self.chroma_path)
+        return self._chroma
+
+    def _chroma_exists(self) -> bool:
+        """Whether there is Chroma data to consult (always true once Chroma is open)."""
+        return self._chroma is not None or os.path.exists(os.path.join(self.chroma_path, "chroma.sqlite3"))
+
+    def get_collection(self, name: str, **kwargs):
+        if self.flat.has_collection(name):
+            return self.flat.get_collection(name)
+        if self.backend == BACKEND_FLAT and not self._chroma_exists():
+            raise ValueError(f"Collection {name} does not exist.")
+        return self.chroma.get_collection(name=name, **kwargs)
+
+    def get_or_create_collection(self, name: str, metadata: dict | None = None, **kwargs):
+        if self.flat.has_collection(name):
+            return self.flat.get_collection(name)
+        if self.backend == BACKEND_FLAT:
+            if self._chroma_exists():
+                try:
+                    return self.chroma.get_collection(name=name)
+                except ValueError:
+                    pass
+            return self.flat.get_or_create_collection(name, metadata=metadata)
+        return self.chroma.get_or_create_collection(name=name, metadata=metadata, **kwargs)
+
+    def delete_collection(self, name: str):
+        if self.flat.has_collection(name):
+            self.flat.delete_collection(name)
+        elif self.backend == BACKEND_FLAT and not self._chroma_exists():
+            raise ValueError(f"Collection {name} does not exist.")
+        else:
+            self.chroma.delete_collection(name=name)
+
+    def list_collections(self) -> list:
+        collections = self.flat.list_collections()
+        if self.backend == BACKEND_CHROMA or self._chroma_exists():
+            collections += self.chroma.list_collections()
+        return collections
+
+    def heartbeat(self) -> int:
+        beat = self.flat.heartbeat()
+        if self.backend == BACKEND_CHROMA or self._chroma_exists():
+            beat = self.chroma.heartbeat()
+        return beat
+
+
+class FlatVectorStore:
+    """The part of a llama-index vector store ingestion uses (add/delete), over a FlatCollection.
+
+    Nodes are stored the way ChromaVectorStore stores them (text as the
+    document, the serialised node in `_node_content`), so retrieval reads
+    both backends the same way.
+    """
+
+    stores_text = True
+
+    def __init__(self, collection: FlatCollection):
+        self._collection = collection
+
+    @property
+    def client(self) -> FlatCollection:
+        return self._collection
+
+    def add(self, nodes: list, **kwargs) -> list[str]:
+        from llama_index.core.schema import MetadataMode
+        from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+        if not nodes:
+            return []
+        metadatas = []
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=True)
+            metadatas.append({key: value for key, value in metadata.items() if value is not None})
+        ids = [node.node_id for node in nodes]
+        self._collection.add(
+            ids=ids,
+            embeddings=[node.get_embedding() for node in nodes],
+            metadatas=metadatas,
+            documents=[node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes],
+        )
+        return ids
+
+    def delete(self, ref_doc_id: str, **kwargs):
+        self._collection.delete(where={"document_id": ref_doc_id})
+
+
+def vector_store_for(collection):
+    """The llama-index vector store that writes to `collection`, whichever backend holds it."""
+    if isinstance(collection, FlatCollection):
+        return FlatVectorStore(collection)
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+    return ChromaVectorStore(chroma_collection=collection)
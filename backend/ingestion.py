@@ -0,0 +1,169 @@
+"""
+Document ingestion: load an uploaded file, split it into chunks, embed the
+chunks in batches and write them to a vector store.
+
+The pipeline is streamed end to end - page extraction -> SentenceSplitter ->
+embedding batches -> vector store writes - so only one page and a bounded
+number of chunk batches are held in memory no matter how long the document is.
+
+Runs inside the ingestion worker pool (see jobs.py), so everything here is
+synchronous on purpose.
+"""
+
+import os
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
+
+import fitz  # PyMuPDF
+from llama_index.core import Document, Settings
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from metrics import stage
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# How many chunk batches may wait for embedding while the next pages are parsed
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
+TEXT_BLOCK_CHARS = int(os.getenv("TEXT_BLOCK_CHARS", "20000"))
+# Where a chunk came from: shown to the LLM, but kept out of the embedded text so that the
+# same chunk on another page or in another file embeds (and hits the embedding cache) the same
+LOCATION_METADATA_KEYS = ["file_name", "source", "total_pages"]
+
+
+def iter_pdf_pages(file_location: str, filename: str) -> Iterator[Document]:
+    """Yield one Document per non-empty PDF page, opening pages lazily."""
+    with fitz.open(file_location) as pdf:
+        total_pages = len(pdf)
+        for page in pdf:
+            text = page.get_text()
+            if not text.strip():
+                continue
+            yield Document(
+                text=text,
+                metadata={"file_name": filename, "source": f"{page.number + 1}", "total_pages": total_pages},
+                excluded_embed_metadata_keys=list(LOCATION_METADATA_KEYS)
+            )
+
+
+def iter_text_blocks(file_location: str, filename: str) -> Iterator[Document]:
+    """Yield a plain-text file as Documents of roughly TEXT_BLOCK_CHARS, split on paragraph breaks."""
+    # Limit text content to reduce token consumption
+    MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "50000"))  # ~12,500 tokens (rough estimate)
+    remaining = MAX_TEXT_LENGTH
+    buffer = ""
+    block = 0
+    with open(file_location, 'r', encoding='utf-8') as f:
+        while remaining > 0:
+            data = f.read(min(TEXT_BLOCK_CHARS, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            buffer += data
+            cut = buffer.rfind("\n\n")
+            if cut <= 0 or remaining <= 0:
+                continue
+            yield Document(
+                text=buffer[:cut], metadata={"file_name": filename, "source": f"block {block + 1}"},
+                excluded_embed_metadata_keys=list(LOCATION_METADATA_KEYS)
+            )
+            block += 1
+            buffer = buffer[cut:]
+        if remaining <= 0 and f.read(1):
+            print(f"Warning: Text file truncated to {MAX_TEXT_LENGTH} characters to reduce token consumption")
+    if buffer.strip():
+        yield Document(
+            text=buffer, metadata={"file_name": filename, "source": f"block {block + 1}"},
+            excluded_embed_metadata_keys=list(LOCATION_METADATA_KEYS)
+        )
+
+
+def iter_documents(file_location: str, content_type: str, filename: str) -> Iterator[Document]:
+    if content_type == "application/pdf":
+        return iter_pdf_pages(file_location, filename)
+    elif content_type == "text/plain":
+        return iter_text_blocks(file_location, filename)
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+
+def iter_node_batches(documents_iter: Iterable[Document], on_document: Callable[[Document], None] | None = None) -> Iterator[list[BaseNode]]:
+    """Split documents one at a time and regroup the chunks into EMBED_BATCH_SIZE batches."""
+    node_parser = Settings.node_parser
+    batch: list[BaseNode] = []
+    for document in documents_iter:
+        if on_document:
+            on_document(document)
+        for node in node_parser.get_nodes_from_documents([document]):
+            batch.append(node)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _prefetch(batches: Iterator[list[BaseNode]], depth: int) -> Iterator[list[BaseNode]]:
+    """Run `batches` on a helper thread so parsing overlaps with embedding.
+
+    The queue is bounded, so at most `depth` batches are buffered.
+    """
+    done = object()
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """Queue `item` unless the consumer has stopped; False once it has."""
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            # Release the parser (and its open PDF) even when the consumer stops early
+            close = getattr(batches, "close", None)
+            if close:
+                close()
+
+    producer = threading.Thread(target=produce, name="ingest-parse", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def embed_and_store(node_batches: Iterable[list[BaseNode]], vector_store, on_progress: Callable[[int], None] | None = None) -> int:
+    """Embed each batch of nodes and add it to `vector_store`.
+
+    `on_progress(n)` is called after each batch with the number of chunks stored so far.
+    """
+    embed_model = Settings.embed_model
+    stored = 0
+    for batch in _prefetch(iter(node_batches), INGEST_QUEUE_DEPTH):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        with stage("ingest_embed"):
+            embeddings = embed_model.get_text_embedding_batch(texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        with stage("ingest_vector_store"):
+            vector_store.add(batch)
+        stored += len(batch)
+        if on_progress:
+            on_progress(stored)
+    return stored
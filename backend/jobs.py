@@ -0,0 +1,153 @@
+"""
+Background ingestion jobs for document uploads.
+
+`/upload/` hands the chunk-and-embed work to a bounded thread pool and
+returns a job id straight away; `/jobs/{job_id}` reports progress.
+"""
+
+import asyncio
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+MAX_TRACKED_JOBS = int(os.getenv("MAX_TRACKED_JOBS", "500"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class IngestionJob:
+    def __init__(self, filename: str, content_type: str, chat_id: str | None, document_id: str, collection_name: str, content_hash: str | None = None):
+        self.job_id = str(uuid.uuid4())
+        self.filename = filename
+        self.content_type = content_type
+        self.chat_id = chat_id
+        self.document_id = document_id
+        self.collection_name = collection_name
+        self.content_hash = content_hash
+        self.storage_mode = "per_document"
+        self.deduplicated_from: str | None = None
+        self.status = JOB_QUEUED
+        self.stage = "queued"
+        self.pages_parsed = 0
+        self.pages_total = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.error: str | None = None
+        self.error_code: int | None = None
+        self.created_at = datetime.utcnow()
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "filename": self.filename,
+            "chat_id": self.chat_id,
+            "document_id": self.document_id,
+            "collection_name": self.collection_name,
+            "deduplicated_from": self.deduplicated_from,
+            "progress": {
+                "pages_parsed": self.pages_parsed,
+                "pages_total": self.pages_total,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+            },
+            "error": self.error,
+            "error_code": self.error_code,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobManager:
+    """Runs ingestion jobs on a fixed-size thread pool and remembers recent ones."""
+
+    def __init__(self, max_workers: int = INGESTION_WORKERS, max_tracked: int = MAX_TRACKED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        # Pending tasks by job id, for jobs that must start after another finishes
+        self._tasks_by_job: dict[str, asyncio.Task] = {}
+        self.max_workers = max_workers
+        self.max_tracked = max_tracked
+
+    def create(self, filename: str, content_type: str, chat_id: str | None, document_id: str, collection_name: str, content_hash: str | None = None) -> IngestionJob:
+        job = IngestionJob(filename, content_type, chat_id, document_id, collection_name, content_hash)
+        self._jobs[job.job_id] = job
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def submit(self, job: IngestionJob, fn, *args, after: IngestionJob | None = None) -> asyncio.Task:
+        """Schedule `fn(job, *args)` on the worker pool without blocking the caller.
+
+        With `after`, the job goes to the pool only once that job has finished.
+        The wait happens on the event loop, so a waiting job never holds a
+        worker thread (and can't starve the job it waits for).
+        """
+        waits_for = self._tasks_by_job.get(after.job_id) if after is not None else None
+        task = asyncio.create_task(self._run(job, fn, *args, waits_for=waits_for))
+        self._tasks.add(task)
+        self._tasks_by_job[job.job_id] = task
+
+        def forget(done: asyncio.Task):
+            self._tasks.discard(done)
+            self._tasks_by_job.pop(job.job_id, None)
+
+        task.add_done_callback(forget)
+        return task
+
+    async def _run(self, job: IngestionJob, fn, *args, waits_for: asyncio.Task | None = None):
+        loop = asyncio.get_running_loop()
+        if waits_for is not None:
+            job.stage = "waiting"
+            # asyncio.wait doesn't raise if the other job's task failed
+            await asyncio.wait([waits_for])
+
+        def run_in_worker():
+            job.status = JOB_RUNNING
+            job.started_at = datetime.utcnow()
+            try:
+                fn(job, *args)
+                job.status = JOB_COMPLETED
+                job.stage = "done"
+            except Exception as e:
+                print(f"Ingestion job {job.job_id} failed: {e}")
+                job.status = JOB_FAILED
+                if job.error is None:
+                    job.error = str(e)
+            finally:
+                job.finished_at = datetime.utcnow()
+
+        await loop.run_in_executor(self._executor, run_in_worker)
+
+    def active(self) -> list[IngestionJob]:
+        """Jobs that are queued or running."""
+        return [job for job in list(self._jobs.values()) if job.status in (JOB_QUEUED, JOB_RUNNING)]
+
+    def stats(self) -> dict:
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_COMPLETED: 0, JOB_FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"workers": self.max_workers, "tracked": len(self._jobs), **counts}
+
+    def _evict_finished(self):
+        # Only forget finished jobs; queued/running ones must stay visible
+        if len(self._jobs) <= self.max_tracked:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_tracked:
+                break
+            if self._jobs[job_id].status in (JOB_COMPLETED, JOB_FAILED):
+                del self._jobs[job_id]
@@ -0,0 +1,223 @@
+"""
+BM25 lexical index over document chunks.
+
+Dense retrieval misses exact identifiers (part numbers, error codes, names),
+so every chunk set also gets a small inverted index built from the same
+SentenceSplitter chunks at upload time. Indexes are stored as gzipped JSON
+in LEXICAL_INDEX_DIR, next to the Chroma data, one file per chunk set: the
+collection for per-document storage, the document id for shared storage
+(the same keys the answer cache uses, see chroma_layout.chunk_sets).
+"""
+
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, NamedTuple
+
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+# Candidates each ranking (vector, BM25) contributes to reciprocal-rank fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+# Answer from BM25 alone, skipping the query embedding, when an identifier in
+# the question appears verbatim in the best lexical hit
+LEXICAL_SHORTCUT_ENABLED = os.getenv("LEXICAL_SHORTCUT_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./chroma_data/lexical")
+LEXICAL_CACHE_SIZE = int(os.getenv("LEXICAL_CACHE_SIZE", "256"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Words joined by - _ . / : # stay one token ("xj-200", "v2.1", "rfc/7231")
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:#][a-z0-9]+)*")
+_JOINERS = re.compile(r"[-_./:#]")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can did do does for from had has have how i if in into is it its me "
+    "my of on or our so than that the their them then there these they this to was we were what when "
+    "where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            # Also index the parts, so "xj-200" matches a question about "XJ 200"
+            tokens.extend(part for part in _JOINERS.split(token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+def identifier_terms(text: str) -> set[str]:
+    """Tokens that look like identifiers: part numbers, codes, versions.
+
+    A token counts if it has a digit plus a letter or joiner ("a113", "xj-200",
+    "10.2.1"); plain numbers and words do not.
+    """
+    terms = set()
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) < 3 or not any(c.isdigit() for c in token):
+            continue
+        if any(c.isalpha() for c in token) or not token.isalnum():
+            terms.add(token)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over one chunk set. Build with `add`, then `search`."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.node_ids: list[str] = []
+        self.doc_lens: list[int] = []
+        # term -> {chunk position: term frequency}
+        self.postings: dict[str, dict[int, int]] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def add(self, node_id: str, text: str):
+        terms = Counter(tokenize(text))
+        position = len(self.node_ids)
+        self.node_ids.append(node_id)
+        length = sum(terms.values())
+        self.doc_lens.append(length)
+        self._total_len += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[position] = tf
+
+    def search(self, terms: Iterable[str], top_n: int) -> list[tuple[str, float]]:
+        """Return up to `top_n` (node_id, score) pairs, best first."""
+        count = len(self.node_ids)
+        if not count:
+            return []
+        avg_len = self._total_len / count or 1.0
+        scores: dict[int, float] = {}
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for position, tf in posting.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lens[position] / avg_len)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / norm
+        best = heapq.nlargest(top_n, scores.items(), key=lambda item: item[1])
+        return [(self.node_ids[position], score) for position, score in best]
+
+    def contains_all(self, node_id: str, terms: Iterable[str]) -> bool:
+        position = self.node_ids.index(node_id)
+        return all(position in self.postings.get(term, {}) for term in terms)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": 1,
+            "k1": self.k1,
+            "b": self.b,
+            "node_ids": self.node_ids,
+            "doc_lens": self.doc_lens,
+            "postings": {term: list(posting.items()) for term, posting in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls(k1=data.get("k1", BM25_K1), b=data.get("b", BM25_B))
+        index.node_ids = data["node_ids"]
+        index.doc_lens = data["doc_lens"]
+        index.postings = {term: dict(posting) for term, posting in data["postings"].items()}
+        index._total_len = sum(index.doc_lens)
+        return index
+
+
+class LexicalHit(NamedTuple):
+    key: str  # chunk set
+    collection_name: str
+    node_id: str
+    score: float
+
+
+def index_path(key: str) -> str:
+    return os.path.join(LEXICAL_INDEX_DIR, f"{key}.json.gz")
+
+
+class LexicalIndexStore:
+    """Persisted BM25 indexes with a bounded in-memory LRU in front."""
+
+    def __init__(self, max_entries: int = LEXICAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, BM25Index] = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+
+    def get(self, key: str, loader: Callable[[str], Iterable[tuple[str, str]]] | None = None) -> BM25Index | None:
+        """Return the index for `key`, reading it from disk on a miss.
+
+        Chunk sets indexed before lexical search existed have no file; if
+        `loader(key)` is given it must yield their (node_id, text) pairs, and
+        the index is built and saved from those.
+        """
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        path = index_path(key)
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                index = BM25Index.from_dict(json.load(f))
+        elif loader is not None:
+            index = BM25Index()
+            for node_id, text in loader(key):
+                index.add(node_id, text or "")
+            self.builds += 1
+            self.save(key, index)
+            return index
+        else:
+            return None
+
+        self._remember(key, index)
+        return index
+
+    def save(self, key: str, index: BM25Index):
+        path = index_path(key)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(index.to_dict(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        self._remember(key, index)
+
+    def _remember(self, key: str, index: BM25Index):
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
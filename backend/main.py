@@ -1,43 +1,84 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Query
-import numpy as np
 import os
-import uvicorn
 from dotenv import load_dotenv
 import asyncio
+import importlib
+import json
+import threading
+import time
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Document
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.storage.storage_context import StorageContext
-from llama_index.vector_stores.chroma import ChromaVectorStore 
-from llama_index.readers.file import PyMuPDFReader
-from llama_index.core import Settings
+# llama-index, chromadb, dappier and the OpenAI SDK are imported when the
+# services are first built (initialise_services), not here: importing this
+# module stays fast and doesn't need those services to be reachable
 
-from dappier import Dappier
-
-from pymongo import MongoClient
 import uuid
 from datetime import datetime
-
-import chromadb
+from bson import ObjectId
 
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+from scheduler import (
+    EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+    SCHEDULER_ENABLED, RateLimiter, is_quota_error, is_rate_limit_error
+)
+from embedding_providers import (
+    EMBEDDING_INFO, EMBEDDING_PROVIDER, PROVIDER_HASHING, PROVIDER_OPENAI,
+    create_embed_model, embedding_filter, embedding_info, embedding_namespace
+)
+from jobs import JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, IngestionJob, JobManager
+from retrieval import (
+    SIMILARITY_TOP_K, build_synthesizer, fetch_nodes, merge_top_k, query_collection,
+    reciprocal_rank_fusion, response_text, stream_synthesis
+)
+from lexical_index import (
+    HYBRID_CANDIDATES, HYBRID_SEARCH_ENABLED, LEXICAL_SHORTCUT_ENABLED,
+    BM25Index, LexicalHit, LexicalIndexStore, identifier_terms, tokenize
+)
+from collection_cache import CollectionCache, CollectionHandle
+from answer_cache import SemanticAnswerCache, SEMANTIC_CACHE_ENABLED
+from context_packing import CONTEXT_CANDIDATES, CONTEXT_PACKING_ENABLED, pack_context
+from web_search import WebResultCache, normalise_question, search_web, DOCUMENT_ANSWER_TIMEOUT_SECONDS
+from single_flight import FlightAbandoned, SingleFlight
+from uploads import spool_upload
+from chroma_layout import (
+    CHROMA_PATH, CHROMA_STORAGE_MODE, STORAGE_PER_DOCUMENT, STORAGE_SHARED,
+    chunk_sets, collection_name_for, retrieval_targets, tag_nodes, where_for
+)
+from database import (
+    chats, chat_summaries, documents, documents_sync, create_indexes, backfill_chat_summaries, backfill_chat_summary,
+    close_clients, ping
+)
+from flat_store import VectorClient, vector_store_for
+from reaper import REAPER_INTERVAL_SECONDS, describe as describe_reap, reap, release_documents, release_lock
+from pagination import encode_cursor, after_filter, ndjson_lines
+from metrics import (
+    METRICS_ENABLED, QUERY_TIMINGS_DEFAULT, MetricFamily, count_fallback, count_route, create_token_handler,
+    observe_http_request, observe_stage, render as render_metrics, stage, timed, track_request
+)
+
 # Fix CORS origins definition
 # Allow all origins for now (for development; restrict in production)
 ALLOWED_ORIGINS = ["*"]
 
-MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-mongo = MongoClient(MONGO_URI)
-db = mongo.ai20labs
-chats = db.chats 
-documents = db.documents  # New collection for document metadata
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here blocks: the server accepts connections straight away and /readyz
+    # reports when it can serve, so a slow or unreachable dependency doesn't stop startup
+    start_startup_tasks()
+    reaper_task = asyncio.create_task(run_reaper()) if REAPER_INTERVAL_SECONDS > 0 else None
+    yield
+    for task in (startup_task, reaper_task):
+        if task and not task.done():
+            task.cancel()
+    close_clients()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Use ALLOWED_ORIGINS directly as a list
 app.add_middleware(
@@ -50,45 +91,195 @@ app.add_middleware(
     max_age=86400,  # Cache preflight requests for 24 hours
 )
 
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template, not the raw path, so chat ids don't each become a series
+    route = request.scope.get("route")
+    observe_http_request(request.method, route.path if route else "unmatched", response.status_code, time.perf_counter() - start)
+    return response
+
+# Configurable chunk size for token optimization
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "512"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "10"))
+# Build the models and clients in the background at startup, so the first request doesn't wait for them
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+
 current_document_id: str | None = None
+# Set by initialise_services
 chroma_client = None
+dappier_tool = None
+embedding_cache = None
+embedding_scheduler = None
+services_ready = False
+startup_error: str | None = None
+_services_lock = threading.Lock()
+startup_task: asyncio.Task | None = None
+
+ingestion_jobs = JobManager()
+collection_cache = CollectionCache()
+answer_cache = SemanticAnswerCache() if SEMANTIC_CACHE_ENABLED else None
+web_cache = WebResultCache()
+# Shared by every upload and question, so the process as a whole stays inside the provider's limits
+embed_limiter = RateLimiter("embedding", EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE)
+llm_limiter = RateLimiter("llm", LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+lexical_indexes = LexicalIndexStore() if HYBRID_SEARCH_ENABLED else None
+# Identical questions over the same documents, asked at the same time, share one answer
+query_flights = SingleFlight()
+# content_hash -> job currently embedding those bytes, so concurrent duplicates can wait for it
+ingesting_hashes: dict[str, IngestionJob] = {}
 chroma_collection_name = "document_qa_collection"
 
-try:
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables.")
 
-    Settings.llm = OpenAI(model="gpt-3.5-turbo", api_key=openai_api_key)
-    Settings.embed_model = OpenAIEmbedding(api_key=openai_api_key, model="text-embedding-ada-002")
-    # Configurable chunk size for token optimization
-    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "512"))
-    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "10"))
-    Settings.node_parser = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+def initialise_services():
+    """Build the LLM, embedding model, ChromaDB client and Dappier tool, once.
 
-    # Use local ChromaDB storage
-    chroma_client = chromadb.PersistentClient(path="./chroma_data")
+    Runs on a worker thread, from the startup warm-up or the first request
+    that needs them; raises (and records `startup_error`) if they can't be built,
+    and the next caller tries again.
+    """
+    global chroma_client, dappier_tool, embedding_cache, embedding_scheduler, services_ready, startup_error
 
+    with _services_lock:
+        if services_ready:
+            return
+        started = time.perf_counter()
+        try:
+            from llama_index.core import Settings
+            from llama_index.core.callbacks import CallbackManager
+            from llama_index.core.node_parser import SentenceSplitter
+            from embedding_cache import CachedEmbedding, EmbeddingCache, EMBEDDING_CACHE_ENABLED
+
+            openai_api_key = os.getenv("OPENAI_API_KEY")
+            if not openai_api_key:
+                raise ValueError("OPENAI_API_KEY not found in environment variables.")
+
+            # Counts LLM and embedding tokens for /metrics and per-request timings
+            Settings.callback_manager = CallbackManager([create_token_handler()])
+            if SCHEDULER_ENABLED:
+                from scheduled_models import ScheduledOpenAI
+                # Retries happen in the scheduler, not in the OpenAI client as well
+                Settings.llm = ScheduledOpenAI(llm_limiter, model="gpt-3.5-turbo", api_key=openai_api_key, max_retries=0)
+            else:
+                from llama_index.llms.openai import OpenAI
+                Settings.llm = OpenAI(model="gpt-3.5-turbo", api_key=openai_api_key)
+            Settings.node_parser = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+            if SCHEDULER_ENABLED and EMBEDDING_PROVIDER == PROVIDER_OPENAI:
+                from scheduled_models import ScheduledEmbedding
+                embedding_scheduler = ScheduledEmbedding(create_embed_model(openai_api_key, max_retries=0), embed_limiter)
+                Settings.embed_model = embedding_scheduler
+            else:
+                Settings.embed_model = create_embed_model(openai_api_key)
+            print(f"Embedding with {EMBEDDING_INFO['embedding_provider']}:{EMBEDDING_INFO['embedding_model']}")
+            # Hashing embeddings are cheaper to recompute than to look up
+            if EMBEDDING_CACHE_ENABLED and EMBEDDING_PROVIDER != PROVIDER_HASHING:
+                # Chunks embedded before (shared boilerplate, re-uploads) are served from disk
+                embedding_cache = EmbeddingCache()
+                Settings.embed_model = CachedEmbedding(Settings.embed_model, embedding_cache, CHUNK_SIZE, CHUNK_OVERLAP)
+
+            # Local vector storage: new collections go to VECTOR_BACKEND (Chroma or the flat store)
+            chroma_client = VectorClient(chroma_path=CHROMA_PATH)
+
+            try:
+                from dappier import Dappier
+                dappier_tool = Dappier(api_key=openai_api_key)
+                print("Dappier tool initialized successfully for web search")
+            except Exception as e:
+                print(f"Warning: Dappier tool initialization failed: {e}")
+                dappier_tool = None
+
+        except Exception as e:
+            startup_error = f"{type(e).__name__}: {e}"
+            print(f"Service initialization failed: {startup_error}")
+            raise
+
+        services_ready = True
+        startup_error = None
+        print(f"Services initialized in {time.perf_counter() - started:.2f}s")
+
+
+async def ensure_services():
+    """Initialise the services if that hasn't happened yet (503 if they can't be)."""
+    if services_ready:
+        return
     try:
-        if openai_api_key:
-            dappier_tool = Dappier(api_key=openai_api_key)
-            print("Dappier tool initialized successfully for web search")
-        else:
-            print("Warning: OpenAI API key not available, web search disabled")
-            dappier_tool = None
+        await asyncio.to_thread(initialise_services)
     except Exception as e:
-        print(f"Warning: Dappier tool initialization failed: {e}")
-        dappier_tool = None
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {startup_error or str(e)}")
+
+
+def warm_up():
+    initialise_services()
+    # Pulls in the response-synthesis modules and builds both synthesizers before the first question
+    get_synthesizer(DOCUMENT_SYSTEM_PROMPT)
+    get_synthesizer(WEB_SYSTEM_PROMPT)
+    # PDF parsing and the node parser
+    importlib.import_module("ingestion")
+
+
+async def ensure_indexes():
+    try:
+        await create_indexes()
+        await backfill_chat_summaries()
+    except Exception as e:
+        # The app can still serve requests; lookups are just slower without indexes
+        print(f"Warning: MongoDB index creation failed: {e}")
+
+
+async def run_startup_tasks(warm: bool):
+    if warm:
+        try:
+            await asyncio.to_thread(warm_up)
+        except Exception as e:
+            print(f"Warning: warm-up failed: {e}")
+    await ensure_indexes()
+
+
+def start_startup_tasks(warm: bool = STARTUP_WARMUP):
+    """Run index creation (and warm-up) in the background, unless a run is still going."""
+    global startup_task
+    if startup_task is None or startup_task.done():
+        startup_task = asyncio.create_task(run_startup_tasks(warm))
+
 
-except ValueError as e:
-    print(f"Configuration Error: {e}")
-except Exception as e:
-    print(f"An unexpected error occurred during Llamaindex initialization: {e}")
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving. Checks no dependencies."""
+    return {"status": "ok"}
 
-if chroma_client is None:
-    raise RuntimeError("ChromaDB client failed to initialize. Check your logs and environment variables.")
 
+@app.get("/readyz")
+async def readyz():
+    """Readiness: MongoDB answers and the models/ChromaDB are built (or will be, on first use)."""
+    mongo_ok = await ping(READINESS_TIMEOUT_SECONDS)
+    chroma_ok = None
+    if services_ready:
+        services = "ready"
+        try:
+            await asyncio.wait_for(asyncio.to_thread(chroma_client.heartbeat), timeout=READINESS_TIMEOUT_SECONDS)
+            chroma_ok = True
+        except Exception:
+            chroma_ok = False
+    elif startup_error:
+        services = "failed"
+        if STARTUP_WARMUP:
+            # Try again in the background; a later probe will see the outcome
+            start_startup_tasks()
+    else:
+        services = "initializing" if STARTUP_WARMUP else "lazy"
 
+    ready = mongo_ok and chroma_ok is not False and services in ("ready", "lazy")
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "ready": ready,
+        "mongodb": "ok" if mongo_ok else "unreachable",
+        "chromadb": None if chroma_ok is None else ("ok" if chroma_ok else "unreachable"),
+        "services": services,
+        "error": startup_error,
+    })
 
 
 @app.get("/")
@@ -99,214 +290,313 @@ async def read_root():
 
 
 
-@app.post("/upload/")
-async def upload_document(file: UploadFile = File(...), chat_id: str = Query(None, description="Chat ID to associate with this document")):
-    
-    global chroma_client, current_document_id
-    
-    if not chroma_client:
-        raise HTTPException(status_code=500, detail="ChromaDB client not initialized")
-    if not Settings.llm or not Settings.embed_model:
-        raise HTTPException(status_code=500, detail="Llamaindex LLM or Embed Model not initialized. Check API Key.")
-    
-    if file.content_type not in ["application/pdf", "text/plain"]:
-        raise HTTPException(status_code=400, detail="Unsupported file type")
-    
-    # Configurable limits to reduce token consumption
-    MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", "5")) * 1024 * 1024  # Default 5MB
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"File too large. Maximum size is 5MB. Your file is {len(content) / (1024*1024):.1f}MB"
-        )
-    
-    file_location = f"temp_{file.filename}"
+def describe_ingestion_error(error: Exception) -> tuple[int, str]:
+    error_message = str(error)
+    if is_quota_error(error) or "quota" in error_message.lower():
+        return 429, "OpenAI API quota exceeded. Please check your billing or try again later."
+    elif is_rate_limit_error(error) or "rate limit" in error_message.lower():
+        return 429, "OpenAI API rate limit exceeded. Please wait a moment and try again."
+    return 500, f"Error processing document: {error_message}"
+
+
+def find_indexed_document(content_hash: str) -> dict | None:
+    """Return an already indexed document with the same bytes, chunk settings and embedding model, if any."""
+    return documents_sync.find_one(
+        {
+            "content_hash": content_hash,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            **embedding_filter()
+        },
+        sort=[("uploaded_at", -1)]
+    )
+
+
+def link_indexed_document(job: IngestionJob) -> bool:
+    """Attach an existing collection to `job`'s chat instead of embedding the file again.
+
+    Returns False if no indexed copy is left. The lookup and the insert
+    hold release_lock, so deleting the copy's last other entry can't drop
+    its chunks in between.
+    """
+    global current_document_id
+
+    job.stage = "linking"
+    with release_lock:
+        source = find_indexed_document(job.content_hash)
+        if not source:
+            return False
+        job.storage_mode = source.get("storage_mode", STORAGE_PER_DOCUMENT)
+        job.collection_name = source["collection_name"]
+        job.deduplicated_from = source["document_id"]
+        job.pages_total = job.pages_parsed = source.get("page_count", 0)
+        job.chunks_total = job.chunks_embedded = source.get("chunk_count", 0)
+
+        documents_sync.insert_one({
+            "document_id": job.document_id,
+            "filename": job.filename,
+            "content_type": job.content_type,
+            "collection_name": source["collection_name"],
+            "uploaded_at": datetime.utcnow(),
+            "chat_id": job.chat_id,
+            "page_count": job.pages_total,
+            "chunk_count": job.chunks_total,
+            "content_hash": job.content_hash,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "storage_mode": job.storage_mode,
+            # Shared collections are filtered by the id the chunks were tagged with
+            "chunk_document_id": source.get("chunk_document_id", source["document_id"]),
+            **embedding_info(source),
+            "deduplicated_from": source["document_id"]
+        })
+
+    if not job.chat_id:
+        current_document_id = job.document_id
+    return True
+
+
+def ingest_document(job: IngestionJob, file_location: str, deduplicate: bool = False):
+    """Runs on the ingestion worker pool: parse, chunk, embed and record one upload.
+
+    With `deduplicate`, the same bytes are indexed already (or were being
+    indexed: the job manager starts this job only after that one finishes),
+    so link that collection rather than embedding the file twice. If the
+    indexed copy was deleted meanwhile, the file is embedded after all.
+    """
+    from llama_index.core import Document
+    from ingestion import iter_documents, iter_node_batches, embed_and_store
+
+    global current_document_id
+
     try:
-        # Content already read above for size check
-        def write_file():
-            with open(file_location, "wb") as f:
-                f.write(content)
-        await asyncio.to_thread(write_file)
-        
-        documents_list = []
-        if file.content_type == "application/pdf":
-            reader = PyMuPDFReader()
-            docs_from_pdf = await asyncio.to_thread(reader.load_data, file_location)
-            
-            # Limit PDF pages to reduce token consumption
-            MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "20"))
-            if len(docs_from_pdf) > MAX_PDF_PAGES:
-                docs_from_pdf = docs_from_pdf[:MAX_PDF_PAGES]
-                print(f"Warning: PDF truncated to first {MAX_PDF_PAGES} pages to reduce token consumption")
-            
-            documents_list.extend(docs_from_pdf)
-        elif file.content_type == "text/plain":
-            def read_text_file():
-                with open(file_location, 'r', encoding='utf-8') as f:
-                    return f.read()
-            text_content = await asyncio.to_thread(read_text_file)
-            
-            # Limit text content to reduce token consumption
-            MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "50000"))  # ~12,500 tokens (rough estimate)
-            if len(text_content) > MAX_TEXT_LENGTH:
-                text_content = text_content[:MAX_TEXT_LENGTH]
-                print(f"Warning: Text file truncated to {MAX_TEXT_LENGTH} characters to reduce token consumption")
-            
-            documents_list.append(Document(text=text_content, id_=file.filename))
-        
-        if not documents_list:
-            raise HTTPException(status_code=500, detail="Failed to load document content. Document might be empty or unreadable.")
-        
-        document_id = str(uuid.uuid4())
-        collection_name = f"document_{document_id}"
-        
-        chroma_collection = chroma_client.get_or_create_collection(collection_name)
-        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-        
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        
-        document_index = VectorStoreIndex.from_documents(
-            documents_list,
-            storage_context=storage_context,
-            show_progress=True
+        if deduplicate:
+            if link_indexed_document(job):
+                return
+            job.collection_name = collection_name_for(job.document_id, namespace=embedding_namespace())
+
+        job.stage = "embedding"
+        shared = job.storage_mode == STORAGE_SHARED
+        # The creation time tells the reaper a collection without a documents entry is still being filled
+        chroma_collection = chroma_client.get_or_create_collection(
+            job.collection_name, metadata=None if shared else {"created_at": int(time.time())}
         )
-        
+        vector_store = vector_store_for(chroma_collection)
+        chunk_set = job.document_id if shared else job.collection_name
+        lexical_index = BM25Index() if lexical_indexes else None
+
+        # Pages are parsed, split and embedded as a stream; nothing holds the whole document
+        def on_document(document: Document):
+            job.pages_parsed += 1
+            job.pages_total = document.metadata.get("total_pages", job.pages_total)
+
+        def count_chunks(batches):
+            for batch in batches:
+                job.chunks_total += len(batch)
+                if shared:
+                    tag_nodes(batch, job.document_id, job.chat_id)
+                if lexical_index is not None:
+                    for node in batch:
+                        lexical_index.add(node.node_id, node.get_content())
+                yield batch
+
+        def on_progress(stored: int):
+            job.chunks_embedded = stored
+
+        documents_iter = iter_documents(file_location, job.content_type, job.filename)
+        node_batches = count_chunks(iter_node_batches(documents_iter, on_document))
+        embed_and_store(node_batches, vector_store, on_progress)
+        if lexical_index is not None:
+            lexical_indexes.save(chunk_set, lexical_index)
+        invalidate_collection(job.collection_name, chunk_set)
+
+        if job.chunks_embedded == 0:
+            raise ValueError("Failed to load document content. Document might be empty or unreadable.")
+
+        job.stage = "saving"
         document_metadata = {
-            "document_id": document_id,
-            "filename": file.filename,
-            "content_type": file.content_type,
-            "collection_name": collection_name,
+            "document_id": job.document_id,
+            "filename": job.filename,
+            "content_type": job.content_type,
+            "collection_name": job.collection_name,
             "uploaded_at": datetime.utcnow(),
-            "chat_id": chat_id,
-            "chunk_count": len(documents_list)
+            "chat_id": job.chat_id,
+            "page_count": job.pages_total or job.pages_parsed,
+            "chunk_count": job.chunks_total,
+            "content_hash": job.content_hash,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "storage_mode": job.storage_mode,
+            "chunk_document_id": job.document_id,
+            **EMBEDDING_INFO
         }
-        
-        documents.insert_one(document_metadata)
-        
-        if not chat_id:
-            current_document_id = document_id
 
-        return JSONResponse(content={
-            "message": f"Successfully processed '{file.filename}' and stored in collection '{collection_name}'.",
-            "document_id": document_id,
-            "collection_name": collection_name
-        })
-        
+        with stage("ingest_persist"):
+            documents_sync.insert_one(document_metadata)
+
+        if not job.chat_id:
+            current_document_id = job.document_id
+
     except Exception as e:
         print(f"Error during document upload and processing: {e}")
-        error_message = str(e)
-        
-        if "insufficient_quota" in error_message or "quota" in error_message.lower():
-            raise HTTPException(
-                status_code=429, 
-                detail="OpenAI API quota exceeded. Please check your billing or try again later."
-            )
-        elif "rate limit" in error_message.lower():
-            raise HTTPException(
-                status_code=429, 
-                detail="OpenAI API rate limit exceeded. Please wait a moment and try again."
-            )
-        else:
-            raise HTTPException(status_code=500, detail=f"Error processing document: {error_message}")
+        job.error_code, job.error = describe_ingestion_error(e)
+        if job.storage_mode == STORAGE_SHARED and job.chunks_embedded:
+            # Don't leave half a document behind in a shared collection
+            try:
+                chroma_client.get_collection(job.collection_name).delete(where={"document_id": job.document_id})
+            except Exception as cleanup_error:
+                print(f"Warning: could not remove partial chunks for {job.document_id}: {cleanup_error}")
+        raise
     finally:
+        if ingesting_hashes.get(job.content_hash) is job:
+            del ingesting_hashes[job.content_hash]
         if os.path.exists(file_location):
             os.remove(file_location)
-            
-@app.post("/query/")
-async def query_document(question_payload: dict, threshold: float = Query(0.3, description="Minimum similarity to answer"), use_web_search: bool = Query(False, description="Enable web search fallback")):
-    global chroma_client, dappier_tool
 
-    user_question = question_payload.get("question")
-    chat_id = question_payload.get("chat_id")
-    
-    if not user_question:
-        raise HTTPException(status_code=400, detail="Question is required in the request body.")
 
-    if not chat_id:
-        raise HTTPException(status_code=400, detail="Chat ID is required to determine which document to query.")
+# The body is parsed by hand in spool_upload, so describe the form for /docs
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
 
-    try:
-        chat_document = documents.find_one({"chat_id": chat_id})
-        if not chat_document:
-            return JSONResponse(content={"answer": "No document is associated with this chat. Please upload a document first."})
-        
-        collection_name = chat_document["collection_name"]
-        
-        collection = chroma_client.get_collection(collection_name)
-        
-        if collection.count() == 0:
-            return JSONResponse({"answer": "No documents have been indexed for this chat. Please upload a document first."})
-        
-        embedding_model = Settings.embed_model
-        q_embed = embedding_model.get_text_embedding(user_question)
-        
-        results = collection.query(
-            query_embeddings=[q_embed],
-            n_results=1,
-            include=["distances"]
-        )
-        
-        if not results or len(results) == 0:
-            return JSONResponse({"answer": "No relevant content found in the document."})
-            
-        dist = results["distances"][0][0]
 
-        use_web_fallback = False
-        web_search_reason = ""
-        
-        if use_web_search and dappier_tool:
-            if dist > threshold:
-                use_web_fallback = True
-                web_search_reason = f"Document similarity ({dist:.3f}) below threshold ({threshold})"
-            elif any(keyword in user_question.lower() for keyword in [
-                "latest", "current", "recent", "today", "now", "update", "news", 
-                "2024", "2025", "this year", "this month", "this week"
-            ]):
-                if dist < 0.8:
-                    use_web_fallback = True
-                    web_search_reason = "Question asks for current/recent information"
-                else:
-                    use_web_fallback = False
-                    web_search_reason = "Question not relevant to document content"
-            else:
-                if dist > 0.7:
-                    use_web_fallback = False
-                    web_search_reason = "Question not relevant to document content"
-                else:
-                    use_web_fallback = True
-                    web_search_reason = "Document similarity low, attempting web search"
-        
-        if dist > threshold and not use_web_fallback:
-            answer = f"I couldn't find relevant information in the document for this question. (Similarity: {dist:.3f}, Threshold: {threshold})"
-            await store_chat_message(chat_id, user_question, answer, dist, threshold, web_search_used=False)
-            return JSONResponse({
-                "answer": answer,
-                "debug_dist": dist,
-                "threshold": threshold,
-                "web_search_used": False,
-                "web_search_reason": web_search_reason
-            })
-
-        # 5) Create query engine with appropriate tools
-        vector_store = ChromaVectorStore(chroma_collection=collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        
-        # Recreate the index for this document
-        document_index = VectorStoreIndex.from_documents(
-            [],  # Empty list since documents are already in ChromaDB
-            storage_context=storage_context
-        )
-        
-        # Configure query engine based on whether web search is needed
-        if use_web_fallback:
-            # Enhanced system prompt for web search
-            system_prompt = f"""
+@app.post("/upload/", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def upload_document(request: Request, chat_id: str = Query(None, description="Chat ID to associate with this document")):
+    # Models and ChromaDB are built on first use if the warm-up hasn't done it yet
+    await ensure_services()
+
+    # Streams the body to a unique temp file, enforcing MAX_FILE_SIZE_MB as it goes
+    upload = await spool_upload(request, allowed_types=["application/pdf", "text/plain"])
+
+    document_id = str(uuid.uuid4())
+    collection_name = collection_name_for(document_id, namespace=embedding_namespace())
+
+    # Identical bytes already indexed (or being indexed) are linked, not re-embedded
+    source_job = ingesting_hashes.get(upload.content_hash)
+    source = None
+    if source_job is None:
+        source = await asyncio.to_thread(find_indexed_document, upload.content_hash)
+
+    # The file is kept until the job links the copy: it is embedded if the copy is deleted first
+    job = ingestion_jobs.create(
+        upload.filename, upload.content_type, chat_id, document_id,
+        source["collection_name"] if source else collection_name, upload.content_hash
+    )
+    job.storage_mode = CHROMA_STORAGE_MODE
+    if source is None and source_job is None:
+        ingesting_hashes[upload.content_hash] = job
+    # Chunking and embedding happen on the worker pool so queries keep flowing
+    ingestion_jobs.submit(job, ingest_document, upload.path, source is not None or source_job is not None, after=source_job)
+
+    return JSONResponse(status_code=202, content={
+        "message": f"Accepted '{upload.filename}' for processing into collection '{job.collection_name}'.",
+        "job_id": job.job_id,
+        "status": job.status,
+        "document_id": document_id,
+        "collection_name": job.collection_name,
+        "deduplicated": source is not None or source_job is not None
+    })
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return JSONResponse({
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "collection_cache": collection_cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "web_cache": web_cache.stats(),
+        "lexical_index": lexical_indexes.stats() if lexical_indexes else None,
+        "query_flights": query_flights.stats(),
+        "rate_limits": {
+            "embedding": embed_limiter.stats(),
+            "llm": llm_limiter.stats(),
+            "embedding_batches": embedding_scheduler.stats() if embedding_scheduler else None
+        },
+        "ingestion_jobs": ingestion_jobs.stats()
+    })
+
+
+def cache_metric_families() -> list[MetricFamily]:
+    """Hit/miss counters the caches already keep, in Prometheus form."""
+    caches = {
+        "embedding": embedding_cache.stats() if embedding_cache else None,
+        "collection": collection_cache.stats(),
+        "answer": answer_cache.stats() if answer_cache else None,
+        "web": web_cache.stats(),
+        "lexical_index": lexical_indexes.stats() if lexical_indexes else None,
+    }
+    web = caches["web"]
+    flights = query_flights.stats()
+    jobs = ingestion_jobs.stats()
+    return [
+        MetricFamily("docqa_cache_hits_total", "counter", "Cache hits, by cache.",
+                     [({"cache": name}, stats["hits"]) for name, stats in caches.items() if stats]),
+        MetricFamily("docqa_cache_misses_total", "counter", "Cache misses, by cache.",
+                     [({"cache": name}, stats["misses"]) for name, stats in caches.items() if stats]),
+        MetricFamily("docqa_web_search_failures_total", "counter", "Web searches that timed out or failed.",
+                     [({"reason": "timeout"}, web["timeouts"]), ({"reason": "error"}, web["errors"])]),
+        MetricFamily("docqa_coalesced_queries_total", "counter", "Questions answered by joining an identical in-flight question.",
+                     [({}, flights["followers"])]),
+        MetricFamily("docqa_queries_in_flight", "gauge", "Distinct questions being answered right now.",
+                     [({}, flights["in_flight"])]),
+        MetricFamily("docqa_ingestion_jobs", "gauge", "Tracked ingestion jobs, by status.",
+                     [({"status": status}, jobs[status]) for status in (JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED)]),
+    ]
+
+
+@app.get("/metrics")
+async def get_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false)")
+    return Response(render_metrics(cache_metric_families()), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JSONResponse(job.to_dict())
+
+# System prompts are templates filled per question ({dist}, {threshold}, ...),
+# so one synthesizer per prompt can be built once and reused
+
+# Standard system prompt for document-only
+DOCUMENT_SYSTEM_PROMPT = """
+You are a document Q&A assistant.
+
+INSTRUCTIONS:
+1. Answer questions based ONLY on the uploaded document content
+2. Document similarity score: {dist} (threshold: {threshold})
+3. If the document doesn't contain the answer, say so clearly
+4. Be concise and accurate
+5. Always start your response with "📄 From the document:"
+
+RESPONSE FORMAT:
+"📄 From the document: [answer]"
+
+If no relevant information is found:
+"I couldn't find relevant information in the document for this question."
+"""
+
+# Enhanced system prompt for web search
+WEB_SYSTEM_PROMPT = """
 You are a document Q&A assistant with web search capabilities.
 
 INSTRUCTIONS:
 1. The user has uploaded a document that you should reference first
-2. Document similarity score: {dist:.3f} (threshold: {threshold})
+2. Document similarity score: {dist} (threshold: {threshold})
 3. Web search is enabled because: {web_search_reason}
 4. COMBINE document knowledge with web information when relevant
 5. Always cite your sources clearly
@@ -319,36 +609,85 @@ RESPONSE FORMAT:
 
 COST CONTROL: Use web search efficiently and be concise.
 """
-            
-            query_engine = document_index.as_query_engine(
-                response_mode="compact",
-                similarity_top_k=3,
-                system_prompt=system_prompt
-            )
-            
-            # Perform web search separately and combine results
-            try:
-                web_results = await asyncio.to_thread(
-                    dappier_tool.search_real_time_data_string,
-                    user_question
-                )
-                
-                # Combine document and web search results
-                document_response = await query_engine.aquery(user_question)
-                
-                # Try to get the text from the response object
-                if hasattr(document_response, 'response'):
-                    document_answer = str(document_response.response)
-                elif hasattr(document_response, 'text'):
-                    document_answer = str(document_response.text)
-                elif hasattr(document_response, 'message'):
-                    document_answer = str(document_response.message)
-                else:
-                    document_answer = str(document_response)
-                    
-                if web_results and len(web_results) > 0:
-                    # web_results is a string, so we can use it directly
-                    combined_prompt = f"""
+
+_synthesizers: dict[str, object] = {}
+
+
+def get_synthesizer(system_prompt: str):
+    synthesizer = _synthesizers.get(system_prompt)
+    if synthesizer is None:
+        synthesizer = _synthesizers[system_prompt] = build_synthesizer(system_prompt)
+    return synthesizer
+
+
+def invalidate_collection(collection_name: str, cache_key: str | None = None):
+    """Drop everything cached for a collection whose documents changed.
+
+    `cache_key` is what answers were cached under: the collection name for
+    per-document storage, the document id for shared collections.
+    """
+    collection_cache.invalidate(collection_name)
+    if answer_cache:
+        answer_cache.invalidate(cache_key or collection_name)
+
+
+def forget_chunk_sets(released: list[tuple[str, str]]):
+    """Drop cached handles, answers and BM25 indexes of chunk sets that were deleted."""
+    for collection_name, key in released:
+        invalidate_collection(collection_name, key)
+        if lexical_indexes:
+            lexical_indexes.invalidate(key)
+
+
+async def release_chat_documents(query: dict) -> tuple[int, int]:
+    """Delete the documents matching `query`, with the chunk sets only they used.
+
+    Returns (documents deleted, chunk sets dropped).
+    """
+    entries = await documents.find(
+        query, {"_id": 0, "document_id": 1, "collection_name": 1, "storage_mode": 1, "chunk_document_id": 1}
+    ).to_list(length=None)
+    if not entries:
+        return 0, 0
+    await ensure_services()
+    released = await asyncio.to_thread(release_documents, chroma_client, documents_sync, entries)
+    forget_chunk_sets(released)
+    return len(entries), len(released)
+
+
+def reap_storage(dry_run: bool = False) -> dict:
+    """Run the reaper against this process's clients, sparing ingestions in progress."""
+    active = set()
+    for job in ingestion_jobs.active():
+        active.update((job.collection_name, job.document_id))
+    report = reap(chroma_client, documents_sync, dry_run=dry_run, active=active)
+    forget_chunk_sets(report["released"])
+    return report
+
+
+async def run_reaper():
+    """Reap orphaned storage every REAPER_INTERVAL_SECONDS (the first run one interval after startup)."""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+        if not services_ready:
+            continue
+        try:
+            report = await asyncio.to_thread(reap_storage)
+            print(f"Storage reaper: {describe_reap(report)} in {report['seconds']}s")
+        except Exception as e:
+            print(f"Warning: storage reaper failed: {e}")
+
+
+def load_collection_handle(collection_name: str) -> CollectionHandle:
+    collection = chroma_client.get_collection(collection_name)
+    return CollectionHandle(collection_name, collection, vector_store_for(collection), collection.count())
+
+
+DOCUMENT_PREFIX = "📄 From the document:"
+
+
+def build_combined_prompt(question: str, document_answer: str, web_results: str) -> str:
+    return f"""
 You are answering a question about a document with additional web information.
 
 Document answer: {document_answer}
@@ -362,96 +701,474 @@ Please provide a comprehensive answer that clearly indicates the sources:
 4. Be concise and accurate
 5. Always cite your sources clearly
 
-Question: {user_question}
+Question: {question}
 """
-                    
-                    # Get final response using LLM
-                    llm = Settings.llm
-                    final_response = await llm.acomplete(combined_prompt)
-                    
-                    # Try to get the text from the response object
-                    if hasattr(final_response, 'response'):
-                        answer = str(final_response.response)
-                    elif hasattr(final_response, 'text'):
-                        answer = str(final_response.text)
-                    elif hasattr(final_response, 'message'):
-                        answer = str(final_response.message)
-                    else:
-                        answer = str(final_response)
-                        
-                else:
-                    # No web results found, use document answer with clear indication
-                    if document_answer and document_answer.strip():
-                        answer = f"📄 From the document: {document_answer}"
-                    else:
-                        answer = "I couldn't find relevant information in the document or through web search."
-                    
-            except Exception as web_error:
-                print(f"Web search failed: {web_error}")
-                # Fallback to document-only response
-                response = await query_engine.aquery(user_question)
-                
-                # Try to get the text from the response object
-                if hasattr(response, 'response'):
-                    answer = str(response.response)
-                elif hasattr(response, 'text'):
-                    answer = str(response.text)
-                elif hasattr(response, 'message'):
-                    answer = str(response.message)
-                else:
-                    answer = str(response)
-                    
+
+
+class QueryPlan:
+    """Everything decided about a question before the answer is generated."""
+
+    def __init__(self, chat_id: str, question: str, threshold: float, web_enabled: bool):
+        self.chat_id = chat_id
+        self.question = question
+        self.threshold = threshold
+        self.web_enabled = web_enabled
+        self.targets: dict[str, list[str] | None] = {}
+        self.chunk_sets: dict[str, tuple[str, str | None]] = {}
+        self.q_embed: list[float] | None = None
+        self.nodes = []
+        self.dist: float | None = None
+        # "vector", "hybrid" (vector + BM25 fused) or "lexical" (exact match, no embedding)
+        self.retrieval = "vector"
+        self.use_web_fallback = False
+        self.web_search_reason = ""
+        # Set when the question was answered without synthesis (no document, cache hit, below threshold)
+        self.result: dict | None = None
+        # The answer to record in chat history, once there is one
+        self.answer: str | None = None
+
+    @property
+    def cache_key(self) -> str:
+        # Answers depend on every document in the chat
+        return "|".join(sorted(self.chunk_sets))
+
+    @property
+    def flight_key(self) -> tuple:
+        return (self.cache_key, normalise_question(self.question), self.threshold, self.web_enabled)
+
+    @property
+    def system_prompt(self) -> str:
+        return WEB_SYSTEM_PROMPT if self.use_web_fallback else DOCUMENT_SYSTEM_PROMPT
+
+    @property
+    def prompt_vars(self) -> dict:
+        prompt_vars = {"dist": f"{self.dist:.3f}", "threshold": str(self.threshold)}
+        if self.use_web_fallback:
+            prompt_vars["web_search_reason"] = self.web_search_reason
+        return prompt_vars
+
+    def route(self) -> dict:
+        if self.result is not None:
+            route = "cached" if self.result.get("cached") else "none"
         else:
-            # Standard system prompt for document-only
-            system_prompt = f"""
-You are a document Q&A assistant.
+            route = "web" if self.use_web_fallback else "document"
+        return {
+            "route": route,
+            "web_search_used": self.use_web_fallback,
+            "web_search_reason": self.web_search_reason or None,
+            "retrieval": self.retrieval,
+            "debug_dist": self.dist,
+            "threshold": self.threshold
+        }
 
-INSTRUCTIONS:
-1. Answer questions based ONLY on the uploaded document content
-2. Document similarity score: {dist:.3f} (threshold: {threshold})
-3. If the document doesn't contain the answer, say so clearly
-4. Be concise and accurate
-5. Always start your response with "📄 From the document:"
+    def response(self, answer: str) -> dict:
+        return {
+            "answer": answer,
+            "web_search_used": self.use_web_fallback,
+            "web_search_reason": self.web_search_reason if self.use_web_fallback else None,
+            "retrieval": self.retrieval,
+            "debug_dist": self.dist,
+            "threshold": self.threshold
+        }
 
-RESPONSE FORMAT:
-"📄 From the document: [answer]"
 
-If no relevant information is found:
-"I couldn't find relevant information in the document for this question."
-"""
-            
-            query_engine = document_index.as_query_engine(
-                response_mode="compact",
-                similarity_top_k=3,
-                system_prompt=system_prompt
-            )
-            
-            response = await query_engine.aquery(user_question)
-            
-            # Try to get the text from the response object
-            if hasattr(response, 'response'):
-                answer = str(response.response)
-            elif hasattr(response, 'text'):
-                answer = str(response.text)
-            elif hasattr(response, 'message'):
-                answer = str(response.message)
-            else:
-                answer = str(response)
-            
-            # Ensure the answer has the proper format
-            if not answer.startswith("📄 From the document:"):
-                answer = f"📄 From the document: {answer}"
-        
-        # Store the chat message with web search info
-        await store_chat_message(chat_id, user_question, answer, dist, threshold, web_search_used=use_web_fallback)
+async def retrieve_from_collections(targets: dict[str, list[str] | None], q_embed: list[float], top_k: int = SIMILARITY_TOP_K) -> list:
+    """Query every collection concurrently and merge the hits into one global top-k by distance.
+
+    `targets` maps collection name -> document ids to filter on (None for a
+    per-document collection that is searched whole).
+    """
+    def retrieve(collection_name: str):
+        handle = collection_cache.get(collection_name, load_collection_handle)
+        return query_collection(
+            handle.collection, q_embed, top_k, where=where_for(targets[collection_name]), with_embeddings=CONTEXT_PACKING_ENABLED
+        )
+
+    collection_names = list(targets)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(retrieve, name) for name in collection_names),
+        return_exceptions=True
+    )
+
+    per_collection = []
+    for name, result in zip(collection_names, results):
+        if isinstance(result, BaseException):
+            print(f"Warning: retrieval from collection {name} failed: {result}")
+            continue
+        per_collection.append(result)
+    if not per_collection and results:
+        # Every collection failed; surface the first error
+        raise results[0]
+    return merge_top_k(per_collection, top_k)
+
+
+def lexical_search(sets: dict[str, tuple[str, str | None]], question: str, top_n: int = HYBRID_CANDIDATES) -> list[LexicalHit]:
+    """BM25 over every chunk set in the chat, best first.
+
+    Each set has its own index, so scores are only roughly comparable across
+    documents; fusion only looks at the ranks.
+    """
+    terms = tokenize(question)
+    if not terms:
+        return []
+
+    hits = []
+    for key, (collection_name, document_id) in sets.items():
+        def stored_chunks(_key: str, collection_name=collection_name, document_id=document_id):
+            # Chunk sets uploaded before lexical search existed are indexed from Chroma once
+            collection = collection_cache.get(collection_name, load_collection_handle).collection
+            rows = collection.get(where=where_for([document_id] if document_id else None), include=["documents"])
+            return zip(rows["ids"], rows["documents"])
+
+        try:
+            index = lexical_indexes.get(key, stored_chunks)
+        except Exception as e:
+            print(f"Warning: lexical search in {key} failed: {e}")
+            continue
+        hits.extend(LexicalHit(key, collection_name, node_id, score) for node_id, score in index.search(terms, top_n))
+    hits.sort(key=lambda hit: hit.score, reverse=True)
+    return hits[:top_n]
+
+
+def is_exact_match(hits: list[LexicalHit], question: str) -> bool:
+    """True when the question names identifiers and the best hit contains all of them."""
+    identifiers = identifier_terms(question)
+    if not identifiers or not hits:
+        return False
+    index = lexical_indexes.get(hits[0].key)
+    return index is not None and index.contains_all(hits[0].node_id, identifiers)
+
+
+async def fetch_lexical_nodes(hits: list[LexicalHit]) -> list:
+    """Load the chunks behind lexical hits, keeping their order."""
+    def fetch(collection_name: str, node_ids: list[str]):
+        collection = collection_cache.get(collection_name, load_collection_handle).collection
+        return fetch_nodes(collection, node_ids, with_embeddings=CONTEXT_PACKING_ENABLED)
+
+    grouped: dict[str, list[str]] = {}
+    for hit in hits:
+        grouped.setdefault(hit.collection_name, []).append(hit.node_id)
+    results = await asyncio.gather(*(asyncio.to_thread(fetch, name, ids) for name, ids in grouped.items()))
+    by_id = {node.node.node_id: node for nodes in results for node in nodes}
+    return [by_id[hit.node_id] for hit in hits if hit.node_id in by_id]
+
+
+async def fuse_rankings(vector_nodes: list, lexical_hits: list[LexicalHit]) -> list:
+    """Reciprocal-rank fusion of the vector and BM25 candidates, cut to CONTEXT_CANDIDATES."""
+    by_id = {node.node.node_id: node for node in vector_nodes}
+    fused = reciprocal_rank_fusion([
+        [node.node.node_id for node in vector_nodes],
+        [hit.node_id for hit in lexical_hits]
+    ])[:CONTEXT_CANDIDATES]
+    missing = [hit for hit in lexical_hits if hit.node_id in fused and hit.node_id not in by_id]
+    for node in await fetch_lexical_nodes(missing):
+        by_id[node.node.node_id] = node
+    return [by_id[node_id] for node_id in fused if node_id in by_id]
+
+
+def validate_question(question_payload: dict) -> tuple[str, str]:
+    user_question = question_payload.get("question")
+    chat_id = question_payload.get("chat_id")
+    
+    if not user_question:
+        raise HTTPException(status_code=400, detail="Question is required in the request body.")
+
+    if not chat_id:
+        raise HTTPException(status_code=400, detail="Chat ID is required to determine which document to query.")
+
+    return chat_id, user_question
+
+
+async def resolve_documents(chat_id: str, user_question: str, threshold: float, use_web_search: bool) -> QueryPlan:
+    """Start a plan with the chat's searchable documents (sets `result` if there are none)."""
+    plan = QueryPlan(chat_id, user_question, threshold, bool(use_web_search and dappier_tool))
+
+    with stage("document_lookup"):
+        chat_docs = await documents.find(
+            {"chat_id": chat_id},
+            {"_id": 0, "collection_name": 1, "storage_mode": 1, "chunk_document_id": 1, "embedding_provider": 1, "embedding_model": 1}
+        ).to_list(length=None)
+    if not chat_docs:
+        plan.result = {"answer": "No document is associated with this chat. Please upload a document first."}
+        return plan
+
+    # Vectors from another embedding model aren't comparable with this question's embedding
+    compatible_docs = [doc for doc in chat_docs if embedding_info(doc) == EMBEDDING_INFO]
+    if not compatible_docs:
+        other = embedding_info(chat_docs[0])
+        plan.result = {"answer": (
+            f"This chat's documents were indexed with {other['embedding_provider']}:{other['embedding_model']}, "
+            f"but the server now embeds with {EMBEDDING_INFO['embedding_provider']}:{EMBEDDING_INFO['embedding_model']}. "
+            "Please upload them again."
+        )}
+        return plan
+    if len(compatible_docs) < len(chat_docs):
+        print(f"Warning: chat {chat_id} has {len(chat_docs) - len(compatible_docs)} document(s) from another embedding model; skipping them")
+
+    plan.targets = retrieval_targets(compatible_docs)
+    plan.chunk_sets = chunk_sets(compatible_docs)
+    return plan
+
+
+async def plan_query(plan: QueryPlan) -> QueryPlan:
+    """Embed, retrieve and make the document/web routing decision for a question.
+
+    Touches nothing chat-specific, so one run can serve every coalesced request.
+    """
+    from llama_index.core import Settings
+
+    user_question = plan.question
+    threshold = plan.threshold
+
+    # BM25 is local and cheap, so it runs before deciding whether to embed at all
+    lexical_hits = []
+    if lexical_indexes:
+        with stage("lexical_search"):
+            lexical_hits = await asyncio.to_thread(lexical_search, plan.chunk_sets, user_question)
+
+    if LEXICAL_SHORTCUT_ENABLED and lexical_hits and await asyncio.to_thread(is_exact_match, lexical_hits, user_question):
+        # An identifier from the question is in the best chunk verbatim: treat it as a
+        # perfect match and skip the embedding round-trip (and the semantic cache with it)
+        plan.retrieval = "lexical"
+        with stage("lexical_fetch"):
+            retrieved_nodes = plan.nodes = await fetch_lexical_nodes(lexical_hits[:CONTEXT_CANDIDATES])
+        vector_dist = 0.0
+    else:
+        # Embed once, retrieve once: the same candidates drive routing and synthesis
+        with stage("embed_query"):
+            q_embed = plan.q_embed = await Settings.embed_model.aget_query_embedding(user_question)
+
+        if answer_cache:
+            with stage("answer_cache_lookup"):
+                cached = answer_cache.lookup(plan.cache_key, q_embed, threshold, plan.web_enabled)
+            if cached:
+                plan.dist = cached.dist
+                plan.use_web_fallback = cached.web_search_used
+                plan.web_search_reason = cached.web_search_reason or ""
+                plan.answer = cached.answer
+                plan.result = {**plan.response(cached.answer), "cached": True}
+                return plan
+
+        top_k = max(HYBRID_CANDIDATES, CONTEXT_CANDIDATES) if lexical_hits else CONTEXT_CANDIDATES
+        with stage("vector_search"):
+            retrieved_nodes = plan.nodes = await retrieve_from_collections(plan.targets, q_embed, top_k)
+        # Routing still uses the closest vector distance; fusion only reorders the context
+        vector_dist = retrieved_nodes[0].score if retrieved_nodes else None
+        if retrieved_nodes and lexical_hits:
+            plan.retrieval = "hybrid"
+            with stage("fusion"):
+                retrieved_nodes = plan.nodes = await fuse_rankings(retrieved_nodes, lexical_hits)
+    
+    if not retrieved_nodes:
+        plan.result = {"answer": "No documents have been indexed for this chat. Please upload a document first."}
+        return plan
         
-        return JSONResponse({
+    dist = plan.dist = vector_dist
+
+    use_web_fallback = False
+    web_search_reason = ""
+    
+    if plan.web_enabled:
+        if dist > threshold:
+            use_web_fallback = True
+            web_search_reason = f"Document similarity ({dist:.3f}) below threshold ({threshold})"
+        elif any(keyword in user_question.lower() for keyword in [
+            "latest", "current", "recent", "today", "now", "update", "news", 
+            "2024", "2025", "this year", "this month", "this week"
+        ]):
+            if dist < 0.8:
+                use_web_fallback = True
+                web_search_reason = "Question asks for current/recent information"
+            else:
+                use_web_fallback = False
+                web_search_reason = "Question not relevant to document content"
+        else:
+            if dist > 0.7:
+                use_web_fallback = False
+                web_search_reason = "Question not relevant to document content"
+            else:
+                use_web_fallback = True
+                web_search_reason = "Document similarity low, attempting web search"
+
+    plan.use_web_fallback = use_web_fallback
+    plan.web_search_reason = web_search_reason
+    if use_web_fallback:
+        count_fallback("web_search")
+    
+    if dist > threshold and not use_web_fallback:
+        count_fallback("below_threshold")
+        answer = f"I couldn't find relevant information in the document for this question. (Similarity: {dist:.3f}, Threshold: {threshold})"
+        plan.answer = answer
+        plan.result = {
             "answer": answer,
-            "web_search_used": use_web_fallback,
-            "web_search_reason": web_search_reason if use_web_fallback else None,
             "debug_dist": dist,
-            "threshold": threshold
-        })
+            "threshold": threshold,
+            "web_search_used": False,
+            "web_search_reason": web_search_reason
+        }
+    elif CONTEXT_PACKING_ENABLED:
+        # Routing saw every candidate; the prompt only gets what fits the token budget
+        with stage("context_packing"):
+            plan.nodes = await asyncio.to_thread(pack_context, plan.nodes)
+
+    return plan
+
+
+async def gather_web_and_document(plan: QueryPlan) -> tuple[str | None, str]:
+    """Search the web and synthesize the document answer concurrently.
+
+    Each side has its own timeout, so a slow search degrades to document-only.
+    """
+    synthesizer = get_synthesizer(plan.system_prompt)
+    web_results, document_response = await asyncio.gather(
+        timed("web_search", search_web(dappier_tool, plan.question, web_cache)),
+        timed("synthesis", asyncio.wait_for(
+            synthesizer.asynthesize(plan.question, nodes=plan.nodes, **plan.prompt_vars),
+            timeout=DOCUMENT_ANSWER_TIMEOUT_SECONDS
+        )),
+        return_exceptions=True
+    )
+
+    if isinstance(document_response, BaseException):
+        print(f"Document synthesis failed: {document_response!r}")
+        if not web_results:
+            raise document_response
+        count_fallback("web_only")
+        return web_results, ""
+    return web_results, response_text(document_response)
+
+
+def document_only_answer(document_answer: str) -> str:
+    # No web results found, use document answer with clear indication
+    count_fallback("document_only")
+    if document_answer and document_answer.strip():
+        return f"{DOCUMENT_PREFIX} {document_answer}"
+    return "I couldn't find relevant information in the document or through web search."
+
+
+async def generate_answer(plan: QueryPlan) -> str:
+    from llama_index.core import Settings
+
+    if plan.use_web_fallback:
+        web_results, document_answer = await gather_web_and_document(plan)
+        if web_results:
+            # Get final response using LLM
+            with stage("combine"):
+                final_response = await Settings.llm.acomplete(build_combined_prompt(plan.question, document_answer, web_results))
+            return response_text(final_response)
+        return document_only_answer(document_answer)
+
+    synthesizer = get_synthesizer(plan.system_prompt)
+    with stage("synthesis"):
+        response = await synthesizer.asynthesize(plan.question, nodes=plan.nodes, **plan.prompt_vars)
+    answer = response_text(response)
+    
+    # Ensure the answer has the proper format
+    if not answer.startswith(DOCUMENT_PREFIX):
+        answer = f"{DOCUMENT_PREFIX} {answer}"
+    return answer
+
+
+async def stream_answer(plan: QueryPlan):
+    """Yield the answer as text deltas while the LLM produces them."""
+    from llama_index.core import Settings
+
+    if plan.use_web_fallback:
+        web_results, document_answer = await gather_web_and_document(plan)
+        if web_results:
+            with stage("combine"):
+                response_gen = await Settings.llm.astream_complete(build_combined_prompt(plan.question, document_answer, web_results))
+                async for chunk in response_gen:
+                    if chunk.delta:
+                        yield chunk.delta
+        else:
+            yield document_only_answer(document_answer)
+        return
+
+    # Hold back the first few characters until we know whether the model used the prefix
+    head = ""
+    prefix_checked = False
+    synthesis_started = time.perf_counter()
+    async for delta in stream_synthesis(plan.system_prompt, plan.question, plan.nodes, **plan.prompt_vars):
+        if prefix_checked:
+            yield delta
+            continue
+        head += delta
+        if len(head) >= len(DOCUMENT_PREFIX):
+            prefix_checked = True
+            yield head if head.startswith(DOCUMENT_PREFIX) else f"{DOCUMENT_PREFIX} {head}"
+    observe_stage("synthesis", time.perf_counter() - synthesis_started)
+    if not prefix_checked:
+        yield head if head.startswith(DOCUMENT_PREFIX) else f"{DOCUMENT_PREFIX} {head}"
+
+
+def finish_query(plan: QueryPlan, answer: str):
+    plan.answer = answer
+    if answer_cache and plan.q_embed is not None:
+        answer_cache.store(
+            plan.cache_key, plan.question, plan.q_embed, answer, plan.dist, plan.threshold,
+            use_web_search=plan.web_enabled,
+            web_search_used=plan.use_web_fallback,
+            web_search_reason=plan.web_search_reason if plan.use_web_fallback else None
+        )
+
+
+async def answer_plan(plan: QueryPlan) -> QueryPlan:
+    """Route and answer a resolved plan, without writing chat history."""
+    await plan_query(plan)
+    if plan.result is None:
+        finish_query(plan, await generate_answer(plan))
+    return plan
+
+
+async def record_answer(chat_id: str, question: str, plan: QueryPlan):
+    """Store the answer in this chat's history (each coalesced request stores its own)."""
+    if plan.answer is not None:
+        # Store the chat message with web search info
+        with stage("persistence"):
+            await store_chat_message(chat_id, question, plan.answer, plan.dist, plan.threshold, web_search_used=plan.use_web_fallback)
+
+
+def response_body(plan: QueryPlan) -> dict:
+    return plan.result if plan.result is not None else plan.response(plan.answer)
+
+
+def count_answer(plan: QueryPlan):
+    count_route(plan.route()["route"], plan.retrieval)
+
+
+@app.post("/query/")
+async def query_document(
+    question_payload: dict,
+    threshold: float = Query(0.3, description="Minimum similarity to answer"),
+    use_web_search: bool = Query(False, description="Enable web search fallback"),
+    timings: bool = Query(QUERY_TIMINGS_DEFAULT, description="Include a per-stage timing breakdown in the response")
+):
+    chat_id, user_question = validate_question(question_payload)
+    await ensure_services()
+    request_timings = track_request() if timings else None
+
+    try:
+        plan = await resolve_documents(chat_id, user_question, threshold, use_web_search)
+        if plan.result is not None:
+            count_answer(plan)
+            body = plan.result
+        else:
+            flight_started = time.perf_counter()
+            answered, coalesced = await query_flights.run(plan.flight_key, lambda: answer_plan(plan))
+            if coalesced:
+                # The stages ran in the leading request; this one only waited
+                observe_stage("coalesced_wait", time.perf_counter() - flight_started)
+            await record_answer(chat_id, user_question, answered)
+            count_answer(answered)
+
+            body = response_body(answered)
+            if coalesced:
+                body = {**body, "coalesced": True}
+
+        if request_timings is not None:
+            body = {**body, "timings": request_timings.report()}
+        return JSONResponse(body)
 
     except Exception as e:
         print(f"Error during document query: {e}")
@@ -459,6 +1176,104 @@ If no relevant information is found:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error querying document: {str(e)}")
 
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+async def query_document_stream(question_payload: dict, threshold: float = Query(0.3, description="Minimum similarity to answer"), use_web_search: bool = Query(False, description="Enable web search fallback")):
+    """Server-sent events version of /query/.
+
+    Emits a `route` event with the routing decision, `token` events as the
+    answer is generated, then `done` with the same body /query/ would return
+    (or `error`). The finished message is stored like any other.
+
+    If the same question is already being answered by /query/, the stream
+    waits for that answer and sends it as a single token.
+    """
+    chat_id, user_question = validate_question(question_payload)
+    await ensure_services()
+
+    try:
+        plan = await resolve_documents(chat_id, user_question, threshold, use_web_search)
+        flight = query_flights.join(plan.flight_key) if plan.result is None else None
+        if plan.result is None and flight is None:
+            await plan_query(plan)
+    except Exception as e:
+        print(f"Error during document query: {e}")
+        raise HTTPException(status_code=500, detail=f"Error querying document: {str(e)}")
+
+    async def coalesced_events():
+        try:
+            try:
+                answered = await flight
+            except FlightAbandoned:
+                # The request answering it went away; answer it here (or join whoever took over)
+                answered, _ = await query_flights.run(plan.flight_key, lambda: answer_plan(plan))
+            await record_answer(chat_id, user_question, answered)
+        except Exception as e:
+            print(f"Error during streamed document query: {e}")
+            yield sse_event("error", {"detail": f"Error querying document: {str(e)}"})
+            return
+        count_answer(answered)
+        yield sse_event("route", answered.route())
+        if answered.result is None:
+            yield sse_event("token", {"delta": answered.answer})
+        yield sse_event("done", {**response_body(answered), "coalesced": True})
+
+    async def events():
+        count_answer(plan)
+        yield sse_event("route", plan.route())
+        if plan.result is not None:
+            await record_answer(chat_id, user_question, plan)
+            yield sse_event("done", plan.result)
+            return
+
+        parts = []
+        try:
+            async for delta in stream_answer(plan):
+                parts.append(delta)
+                yield sse_event("token", {"delta": delta})
+            finish_query(plan, "".join(parts))
+            await record_answer(chat_id, user_question, plan)
+            yield sse_event("done", plan.response(plan.answer))
+        except Exception as e:
+            print(f"Error during streamed document query: {e}")
+            yield sse_event("error", {"detail": f"Error querying document: {str(e)}"})
+
+    return StreamingResponse(
+        coalesced_events() if flight is not None else events(),
+        media_type="text/event-stream",
+        # Stop proxies (nginx in production) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+DEFAULT_THRESHOLD = 0.5
+CHATS_PAGE_SIZE = int(os.getenv("CHATS_PAGE_SIZE", "100"))
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "500"))
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "200"))
+NDJSON_BATCH_SIZE = int(os.getenv("NDJSON_BATCH_SIZE", "100"))
+
+
+async def record_chat_summary(chat_message: dict):
+    """Fold one new message into its chat's summary document."""
+    await chat_summaries.update_one(
+        {"_id": chat_message["chat_id"]},
+        {
+            "$set": {
+                "latest_question": chat_message["question"],
+                "latest_answer": chat_message["answer"],
+                "latest_timestamp": chat_message["timestamp"],
+                "threshold": chat_message["threshold"]
+            },
+            "$inc": {"message_count": 1},
+            "$setOnInsert": {"created_at": chat_message["created_at"]}
+        },
+        upsert=True
+    )
+
+
 async def store_chat_message(chat_id: str, question: str, answer: str, distance: float, threshold: float, web_search_used: bool = False):
     try:
         if not chat_id:
@@ -475,7 +1290,8 @@ async def store_chat_message(chat_id: str, question: str, answer: str, distance:
             "created_at": datetime.utcnow()
         }
         
-        chats.insert_one(chat_message)
+        await chats.insert_one(chat_message)
+        await record_chat_summary(chat_message)
         
     except Exception as e:
         print(f"Error storing chat message: {e}")
@@ -487,12 +1303,13 @@ async def create_empty_chat_session(chat_id: str):
             "question": "Chat started",
             "answer": "Ready to ask questions about your document",
             "distance": 0.0,
-            "threshold": 0.5,
+            "threshold": DEFAULT_THRESHOLD,
             "timestamp": datetime.utcnow(),
             "created_at": datetime.utcnow()
         }
         
-        chats.insert_one(empty_message)
+        await chats.insert_one(empty_message)
+        await record_chat_summary(empty_message)
         
     except Exception as e:
         print(f"Error creating empty chat session: {e}")
@@ -500,18 +1317,29 @@ async def create_empty_chat_session(chat_id: str):
 @app.post("/chats/{chat_id}/threshold")
 async def update_chat_threshold(chat_id: str, threshold_data: dict):
     try:
-        new_threshold = threshold_data.get("threshold", 0.5)
+        new_threshold = threshold_data.get("threshold", DEFAULT_THRESHOLD)
         
-        result = chats.update_many(
-            {"chat_id": chat_id},
+        # The threshold lives on the chat summary, not on every message
+        result = await chat_summaries.update_one(
+            {"_id": chat_id},
             {"$set": {"threshold": new_threshold}}
         )
+        if result.matched_count == 0:
+            # Messages from before summaries existed that the startup backfill missed
+            if not await backfill_chat_summary(chat_id):
+                raise HTTPException(status_code=404, detail=f"Chat {chat_id} not found")
+            result = await chat_summaries.update_one(
+                {"_id": chat_id},
+                {"$set": {"threshold": new_threshold}}
+            )
         
         return JSONResponse({
             "message": f"Threshold updated to {new_threshold} for chat {chat_id}",
             "updated_count": result.modified_count
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error updating chat threshold: {e}")
         raise HTTPException(status_code=500, detail=f"Error updating chat threshold: {str(e)}")
@@ -519,29 +1347,49 @@ async def update_chat_threshold(chat_id: str, threshold_data: dict):
 @app.get("/chats/{chat_id}/threshold")
 async def get_chat_threshold(chat_id: str):
     try:
-        latest_message = chats.find_one(
-            {"chat_id": chat_id},
-            sort=[("timestamp", -1)]
-        )
+        summary = await chat_summaries.find_one({"_id": chat_id}, {"threshold": 1})
         
-        if not latest_message:
-            return JSONResponse({"threshold": 0.5})
+        if not summary:
+            return JSONResponse({"threshold": DEFAULT_THRESHOLD})
         
-        return JSONResponse({"threshold": latest_message.get("threshold", 0.5)})
+        return JSONResponse({"threshold": summary.get("threshold", DEFAULT_THRESHOLD)})
         
     except Exception as e:
         print(f"Error getting chat threshold: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting chat threshold: {str(e)}")
 
+def message_cursor(message: dict) -> str:
+    return encode_cursor(message["timestamp"], message["_id"])
+
+
+def document_cursor(doc: dict) -> str:
+    return encode_cursor(doc["uploaded_at"], doc["document_id"])
+
+
 @app.get("/chats/{chat_id}/messages")
-async def get_chat_messages(chat_id: str):
+async def get_chat_messages(
+    chat_id: str,
+    after: str = Query(None, description="Cursor from a previous page's next_cursor"),
+    limit: int = Query(None, ge=1, le=5000, description=f"Page size (default {MESSAGES_PAGE_SIZE}; unlimited for ndjson)"),
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
     try:
-        messages = list(chats.find(
-            {"chat_id": chat_id},
-            {"_id": 0}
-        ).sort("timestamp", 1))
+        query = {"chat_id": chat_id}
+        if after:
+            query.update(after_filter("timestamp", "_id", after, descending=False, id_parser=ObjectId))
+        cursor = chats.find(query).sort([("timestamp", 1), ("_id", 1)])
+
+        if response_format == "ndjson":
+            if limit:
+                cursor = cursor.limit(limit)
+            return StreamingResponse(ndjson_lines(cursor.batch_size(NDJSON_BATCH_SIZE), message_cursor), media_type="application/x-ndjson")
+
+        limit = limit or MESSAGES_PAGE_SIZE
+        messages = await cursor.limit(limit).to_list(length=limit)
+        next_cursor = message_cursor(messages[-1]) if len(messages) == limit else None
         
         for message in messages:
+            message.pop("_id", None)
             if isinstance(message.get("timestamp"), datetime):
                 message["timestamp"] = message["timestamp"].isoformat()
             if isinstance(message.get("created_at"), datetime):
@@ -549,9 +1397,12 @@ async def get_chat_messages(chat_id: str):
         
         return JSONResponse({
             "chat_id": chat_id,
-            "messages": messages
+            "messages": messages,
+            "next_cursor": next_cursor
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error retrieving chat messages: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving chat messages: {str(e)}")
@@ -577,15 +1428,22 @@ async def delete_chat(chat_id: str):
     try:
         print(f"Deleting chat_id: {chat_id}")
         
-        result = chats.delete_many({"chat_id": chat_id})
+        result = await chats.delete_many({"chat_id": chat_id})
+        await chat_summaries.delete_one({"_id": chat_id})
+        # The chat's documents go too, and their vectors once no other chat shares them
+        documents_deleted, chunk_sets_dropped = await release_chat_documents({"chat_id": chat_id})
         
-        print(f"Deleted {result.deleted_count} messages for chat_id: {chat_id}")
+        print(f"Deleted {result.deleted_count} messages and {documents_deleted} documents for chat_id: {chat_id}")
         
         return JSONResponse({
             "message": f"Chat session deleted successfully. Removed {result.deleted_count} messages.",
-            "deleted_count": result.deleted_count
+            "deleted_count": result.deleted_count,
+            "documents_deleted": documents_deleted,
+            "chunk_sets_dropped": chunk_sets_dropped
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting chat: {e}")
         raise HTTPException(status_code=500, detail=f"Error deleting chat: {str(e)}")
@@ -595,44 +1453,52 @@ async def delete_all_chats():
     try:
         print("Deleting all chats")
         
-        result = chats.delete_many({})
+        result = await chats.delete_many({})
+        await chat_summaries.delete_many({})
+        # Documents uploaded without a chat aren't part of any chat, so they stay
+        documents_deleted, chunk_sets_dropped = await release_chat_documents({"chat_id": {"$ne": None}})
         
-        print(f"Deleted {result.deleted_count} messages from all chats")
+        print(f"Deleted {result.deleted_count} messages and {documents_deleted} documents from all chats")
         
         return JSONResponse({
             "message": f"All chat sessions deleted successfully. Removed {result.deleted_count} messages.",
-            "deleted_count": result.deleted_count
+            "deleted_count": result.deleted_count,
+            "documents_deleted": documents_deleted,
+            "chunk_sets_dropped": chunk_sets_dropped
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting all chats: {e}")
         raise HTTPException(status_code=500, detail=f"Error deleting all chats: {str(e)}")
 
 @app.get("/chats/")
-async def get_chats():
+async def get_chats(after: str = Query(None, description="Cursor from a previous page's next_cursor"), limit: int = Query(CHATS_PAGE_SIZE, ge=1, le=500)):
     try:
-        pipeline = [
-            {"$sort": {"timestamp": -1}},
-            {"$group": {
-                "_id": "$chat_id",
-                "latest_question": {"$first": "$question"},
-                "latest_answer": {"$first": "$answer"},
-                "latest_timestamp": {"$first": "$timestamp"},
-                "message_count": {"$sum": 1}
-            }},
-            {"$sort": {"latest_timestamp": -1}}
-        ]
-        
-        chat_sessions = list(chats.aggregate(pipeline))
+        query = after_filter("latest_timestamp", "_id", after) if after else {}
+        chat_sessions = await chat_summaries.find(query).sort(
+            [("latest_timestamp", -1), ("_id", -1)]
+        ).limit(limit).to_list(length=limit)
+
+        next_cursor = None
+        if len(chat_sessions) == limit:
+            last = chat_sessions[-1]
+            next_cursor = encode_cursor(last["latest_timestamp"], last["_id"])
         
         for session in chat_sessions:
             if isinstance(session.get("latest_timestamp"), datetime):
                 session["latest_timestamp"] = session["latest_timestamp"].isoformat()
+            if isinstance(session.get("created_at"), datetime):
+                session["created_at"] = session["created_at"].isoformat()
         
         return JSONResponse({
-            "chats": chat_sessions
+            "chats": chat_sessions,
+            "next_cursor": next_cursor
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error retrieving chats: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving chats: {str(e)}")
@@ -640,10 +1506,10 @@ async def get_chats():
 @app.get("/chats/{chat_id}/documents")
 async def get_chat_documents(chat_id: str):
     try:
-        chat_docs = list(documents.find(
+        chat_docs = await documents.find(
             {"chat_id": chat_id},
             {"_id": 0}
-        ).sort("uploaded_at", -1))
+        ).sort("uploaded_at", -1).to_list(length=None)
         
         for doc in chat_docs:
             if isinstance(doc.get("uploaded_at"), datetime):
@@ -659,24 +1525,39 @@ async def get_chat_documents(chat_id: str):
         raise HTTPException(status_code=500, detail=f"Error retrieving chat documents: {str(e)}")
 
 @app.get("/documents/")
-async def get_all_documents():
+async def get_all_documents(
+    after: str = Query(None, description="Cursor from a previous page's next_cursor"),
+    limit: int = Query(None, ge=1, le=5000, description=f"Page size (default {DOCUMENTS_PAGE_SIZE}; unlimited for ndjson)"),
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
     try:
-        all_docs = list(documents.find(
-            {},
-            {"_id": 0}
-        ).sort("uploaded_at", -1))
+        query = after_filter("uploaded_at", "document_id", after) if after else {}
+        cursor = documents.find(query, {"_id": 0}).sort([("uploaded_at", -1), ("document_id", -1)])
+
+        if response_format == "ndjson":
+            if limit:
+                cursor = cursor.limit(limit)
+            return StreamingResponse(ndjson_lines(cursor.batch_size(NDJSON_BATCH_SIZE), document_cursor), media_type="application/x-ndjson")
+
+        limit = limit or DOCUMENTS_PAGE_SIZE
+        all_docs = await cursor.limit(limit).to_list(length=limit)
+        next_cursor = document_cursor(all_docs[-1]) if len(all_docs) == limit else None
         
         for doc in all_docs:
             if isinstance(doc.get("uploaded_at"), datetime):
                 doc["uploaded_at"] = doc["uploaded_at"].isoformat()
         
         return JSONResponse({
-            "documents": all_docs
+            "documents": all_docs,
+            "next_cursor": next_cursor
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error retrieving documents: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving documents: {str(e)}")
     
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+Per-stage latency, token and routing metrics, exposed in Prometheus text
+format at /metrics.
+
+Pipeline stages are timed with `stage("name")` (or `observe_stage` for a
+duration measured elsewhere) into one histogram labelled by stage. LLM and
+embedding tokens are counted by a llama-index callback handler
+(create_token_handler), so every
+call through Settings.llm / Settings.embed_model is covered: LLM counts come
+from the provider's reported usage when present, otherwise from the same
+~4 characters/token estimate the scheduler uses.
+
+When a request calls `track_request()`, the stages and tokens of that request
+(including work done in worker threads via asyncio.to_thread) are also
+collected into a RequestTimings that /query/ can return with its answer.
+
+Kept dependency-free: the handful of metric types needed are implemented
+here rather than pulling in prometheus_client.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, NamedTuple
+
+from scheduler import estimate_tokens
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Whether /query/ includes a per-request timing breakdown when the request doesn't say
+QUERY_TIMINGS_DEFAULT = os.getenv("QUERY_TIMINGS_DEFAULT", "false").lower() == "true"
+
+# Seconds; the long tail is for LLM calls and whole-document ingestion
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricFamily(NamedTuple):
+    """A metric computed at scrape time (e.g. from a cache's stats())."""
+    name: str
+    kind: str  # "counter" or "gauge"
+    help: str
+    samples: list[tuple[dict, float]]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples:
+            names = tuple(labels)
+            lines.append(f"{self.name}{_labels(names, tuple(labels[n] for n in names))} {_number(value)}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # label values -> [per-bucket counts, sum, count]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("docqa_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+HTTP_REQUEST_SECONDS = Histogram(
+    "docqa_http_request_seconds", "Time from request to response headers, per route.", ("method", "route", "status")
+)
+TOKENS = Counter("docqa_tokens_total", "Tokens sent to/received from the model providers.", ("model", "kind"))
+ROUTES = Counter("docqa_query_routes_total", "Answered questions by route and retrieval mode.", ("route", "retrieval"))
+FALLBACKS = Counter("docqa_fallbacks_total", "Answers that fell back from the normal path, by kind.", ("kind",))
+_METRICS = (STAGE_SECONDS, HTTP_REQUEST_SECONDS, TOKENS, ROUTES, FALLBACKS)
+
+
+class RequestTimings:
+    """Stage durations and token counts for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.tokens: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_tokens(self, key: str, count: int):
+        with self._lock:
+            self.tokens[key] = self.tokens.get(key, 0) + count
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+                "tokens": dict(self.tokens),
+            }
+
+
+_current_request: ContextVar[RequestTimings | None] = ContextVar("current_request", default=None)
+
+
+def track_request() -> RequestTimings:
+    """Collect this request's stages and tokens (for the rest of the calling task)."""
+    timings = RequestTimings()
+    _current_request.set(timings)
+    return timings
+
+
+def observe_stage(name: str, seconds: float):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _current_request.get()
+    if timings is not None:
+        timings.add_stage(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+async def timed(name: str, awaitable):
+    """Await `awaitable` as stage `name` (for work run concurrently with asyncio.gather)."""
+    with stage(name):
+        return await awaitable
+
+
+def count_tokens(model: str, kind: str, count: int):
+    if METRICS_ENABLED:
+        TOKENS.inc(count, model=model, kind=kind)
+    timings = _current_request.get()
+    if timings is not None:
+        timings.add_tokens(f"{model}_{kind}", count)
+
+
+def count_route(route: str, retrieval: str):
+    if METRICS_ENABLED:
+        ROUTES.inc(route=route, retrieval=retrieval)
+
+
+def count_fallback(kind: str):
+    if METRICS_ENABLED:
+        FALLBACKS.inc(kind=kind)
+
+
+def observe_http_request(method: str, route: str, status: int, seconds: float):
+    if METRICS_ENABLED:
+        HTTP_REQUEST_SECONDS.observe(seconds, method=method, route=route, status=str(status))
+
+
+def _reported_usage(response) -> tuple[int, int] | None:
+    """(prompt, completion) tokens from an OpenAI-style `usage` on the raw response, if any."""
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None
+    read = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    prompt, completion = read("prompt_tokens"), read("completion_tokens")
+    if prompt is None or completion is None:
+        return None
+    return int(prompt), int(completion)
+
+
+def _response_text(response) -> str:
+    message = getattr(response, "message", None)
+    if message is not None:
+        return message.content or ""
+    return getattr(response, "text", "") or ""
+
+
+def create_token_handler():
+    """A llama-index callback handler that feeds count_tokens for LLM and embedding calls.
+
+    Defined on first use so importing this module doesn't import llama-index.
+    """
+    from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+    from llama_index.core.callbacks.schema import CBEventType, EventPayload
+
+    class TokenMetricsHandler(BaseCallbackHandler):
+        def __init__(self):
+            super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+        def on_event_start(self, event_type: CBEventType, payload: dict[str, Any] | None = None,
+                           event_id: str = "", parent_id: str = "", **kwargs: Any) -> str:
+            return event_id
+
+        def on_event_end(self, event_type: CBEventType, payload: dict[str, Any] | None = None,
+                         event_id: str = "", **kwargs: Any) -> None:
+            if not payload:
+                return
+            if event_type == CBEventType.EMBEDDING:
+                # Counted as submitted: embedding-cache hits are included
+                chunks = payload.get(EventPayload.CHUNKS) or []
+                count_tokens("embedding", "input", sum(estimate_tokens(chunk) for chunk in chunks))
+            elif event_type == CBEventType.LLM:
+                response = payload.get(EventPayload.COMPLETION) or payload.get(EventPayload.RESPONSE)
+                if response is None:
+                    return
+                usage = _reported_usage(response)
+                if usage is None:
+                    messages = payload.get(EventPayload.MESSAGES)
+                    prompt = payload.get(EventPayload.PROMPT) or "\n".join(str(m.content or "") for m in messages or [])
+                    usage = (estimate_tokens(prompt), estimate_tokens(_response_text(response)))
+                count_tokens("llm", "prompt", usage[0])
+                count_tokens("llm", "completion", usage[1])
+
+        def start_trace(self, trace_id: str | None = None) -> None:
+            pass
+
+        def end_trace(self, trace_id: str | None = None, trace_map: dict[str, list[str]] | None = None) -> None:
+            pass
+
+    return TokenMetricsHandler()
+
+
+def render(extra: list[MetricFamily] = ()) -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for family in extra:
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Migrate per-document Chroma collections into shared, metadata-filtered ones.
+
+Copies the stored chunks (text, metadata and existing embeddings - nothing is
+re-embedded) of every `document_{uuid}` collection referenced by the
+`documents` metadata into `shared_chunks_{n}`, tags them with `document_id`,
+then points the matching `documents` entries at the shared collection.
+
+Safe to re-run: already migrated entries are skipped. A running backend picks
+up the new layout once its cached collection handles expire
+(COLLECTION_CACHE_TTL_SECONDS), so prefer running it while the backend is stopped.
+
+Usage:
+    python migrate_chroma_layout.py --dry-run
+    python migrate_chroma_layout.py --shards 4 --delete-old
+"""
+
+import argparse
+import os
+
+import chromadb
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+from chroma_layout import CHROMA_PATH, STORAGE_SHARED, shared_collection_name
+from embedding_providers import embedding_namespace
+
+COPY_BATCH_SIZE = 500
+
+
+def copy_collection(source, target, document_id: str, chat_id: str | None) -> int:
+    """Copy all chunks of `source` into `target` in batches; returns the chunk count."""
+    copied = 0
+    offset = 0
+    while True:
+        batch = source.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=COPY_BATCH_SIZE,
+            offset=offset
+        )
+        ids = batch["ids"]
+        if not ids:
+            break
+        metadatas = []
+        for metadata in batch["metadatas"]:
+            metadata = dict(metadata or {})
+            metadata["document_id"] = document_id
+            if chat_id:
+                metadata["chat_id"] = chat_id
+            metadatas.append(metadata)
+        target.upsert(
+            ids=ids,
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=metadatas
+        )
+        copied += len(ids)
+        offset += len(ids)
+    return copied
+
+
+def migrate(shards: int, delete_old: bool, dry_run: bool, chroma_path: str):
+    mongo = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"))
+    documents = mongo.ai20labs.documents
+    chroma_client = chromadb.PersistentClient(path=chroma_path)
+
+    existing = {collection.name for collection in chroma_client.list_collections()}
+    # One source collection can back several documents entries (deduplicated uploads)
+    collection_names = documents.distinct("collection_name", {"storage_mode": {"$ne": STORAGE_SHARED}})
+
+    migrated = skipped = total_chunks = 0
+    for collection_name in collection_names:
+        if collection_name not in existing:
+            print(f"Skipping {collection_name}: collection not found in Chroma")
+            skipped += 1
+            continue
+
+        owner = documents.find_one(
+            {"collection_name": collection_name, "deduplicated_from": {"$exists": False}},
+            sort=[("uploaded_at", 1)]
+        ) or documents.find_one({"collection_name": collection_name}, sort=[("uploaded_at", 1)])
+        # Chunks are tagged with the id of the upload that created the collection
+        chunk_document_id = owner["document_id"]
+        # Keep each embedding model in its own shared collections
+        target_name = shared_collection_name(chunk_document_id, shards, embedding_namespace(owner))
+
+        if dry_run:
+            print(f"Would move {collection_name} -> {target_name} (document {chunk_document_id})")
+            migrated += 1
+            continue
+
+        source = chroma_client.get_collection(collection_name)
+        target = chroma_client.get_or_create_collection(target_name)
+        copied = copy_collection(source, target, chunk_document_id, owner.get("chat_id"))
+        total_chunks += copied
+
+        documents.update_many(
+            {"collection_name": collection_name},
+            {"$set": {
+                "collection_name": target_name,
+                "storage_mode": STORAGE_SHARED,
+                "chunk_document_id": chunk_document_id
+            }}
+        )
+
+        if delete_old:
+            chroma_client.delete_collection(collection_name)
+
+        print(f"Moved {copied} chunks from {collection_name} to {target_name}")
+        migrated += 1
+
+    print(f"Done: {migrated} collections migrated, {skipped} skipped, {total_chunks} chunks copied")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move per-document Chroma collections into shared collections.")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("CHROMA_SHARED_SHARDS", "1")), help="Number of shared collections")
+    parser.add_argument("--delete-old", action="store_true", help="Delete each per-document collection after copying it")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be moved")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH, help="Chroma PersistentClient directory")
+    args = parser.parse_args()
+    migrate(args.shards, args.delete_old, args.dry_run, args.chroma_path)
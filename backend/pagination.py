@@ -0,0 +1,62 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last item on a page (a timestamp and a
+tie-breaking id), so the next page is an indexed range query instead of a
+skip over everything already returned.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+
+def encode_cursor(timestamp: datetime, item_id) -> str:
+    raw = f"{timestamp.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, item_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(timestamp), item_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def after_filter(time_field: str, id_field: str, cursor: str, descending: bool = True, id_parser=str) -> dict:
+    """Mongo filter for items strictly after `cursor` in (time_field, id_field) order.
+
+    `id_parser` turns the cursor's id back into the stored type (e.g. ObjectId).
+    """
+    timestamp, item_id = decode_cursor(cursor)
+    try:
+        item_id = id_parser(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {time_field: {op: timestamp}},
+        {time_field: timestamp, id_field: {op: item_id}},
+    ]}
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def ndjson_lines(cursor, make_cursor):
+    """Serialise documents one per line as they come off a Motor cursor.
+
+    Each line carries a `cursor` field that can be passed back as `after`
+    to resume from that document.
+    """
+    async for doc in cursor:
+        doc["cursor"] = make_cursor(doc)
+        doc.pop("_id", None)
+        yield json.dumps(doc, default=json_default) + "\n"
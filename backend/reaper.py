@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Garbage collection for document storage.
+
+Deleting a chat deletes its `documents` entries through release_documents,
+which also drops each chunk set no remaining entry reads. Deduplicated
+uploads and shared collections mean one chunk set can back several entries,
+so a chunk set goes only with its last reference; release_lock keeps a
+deduplicated upload from linking one as it is dropped. A chunk set is a whole
+`document_{uuid}` collection for per-document storage, or the chunks tagged
+with one document id in a shared collection. Its BM25 index file goes with
+it.
+
+reap() cleans up whatever is left behind anyway: data from before cascading
+deletes, crashed ingestions, or failed uploads. It reconciles the
+`documents` metadata against Chroma (and the flat store, see
+flat_store.py), then:
+
+- removes entries whose chunks no longer exist (they can't be queried),
+  and optionally entries whose chat was deleted (--chatless-documents)
+- drops `document_*` collections and shared-collection chunks that no
+  entry references
+- removes lexical index files for chunk sets that no longer exist and
+  stale `temp_*` upload spool files
+- offline only: removes HNSW segment directories Chroma no longer knows
+  about and VACUUMs chroma.sqlite3, so the freed pages go back to the
+  filesystem
+
+It reports what it removed and the bytes reclaimed on disk. Nothing newer
+than REAPER_GRACE_SECONDS is touched: ingestion writes chunks before their
+`documents` entry, and the timestamps on new collections and chunks tell
+the reaper those are still in flight.
+
+Removing an entry is unrecoverable, and a wrong CHROMA_PATH or an empty
+volume makes every entry look stale. So no stale entries are removed when
+the vector store lists no collections at all, or when more than
+REAPER_MAX_STALE_FRACTION of the entries would go, unless forced (--force).
+
+With REAPER_INTERVAL_SECONDS set, the backend runs reap() that often
+through its own Chroma client, never forced and skipping the offline steps: deleting segment directories or
+rebuilding chroma.sqlite3 under a live PersistentClient can fail on a
+locked database or corrupt the store. Those steps run from this CLI, which
+needs the backend stopped (nothing else may have the Chroma directory
+open); with the backend running, pass --online to skip them:
+
+    python reaper.py --dry-run
+    python reaper.py --chatless-documents --vacuum always
+    python reaper.py --online
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from chroma_layout import CHROMA_PATH, SHARED_COLLECTION_PREFIX, STORAGE_SHARED, chunk_sets
+from flat_store import FLAT_STORE_PATH, VectorClient
+from lexical_index import LEXICAL_INDEX_DIR, index_path
+from uploads import UPLOAD_SPOOL_DIR
+
+# How often the backend reaps; 0 (the default) turns the background reaper off
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "0"))
+REAPER_GRACE_SECONDS = float(os.getenv("REAPER_GRACE_SECONDS", "3600"))
+# Above this share of `documents` entries looking stale, none are removed unless forced
+REAPER_MAX_STALE_FRACTION = float(os.getenv("REAPER_MAX_STALE_FRACTION", "0.5"))
+# Offline runs only: "auto" vacuums after something was removed from Chroma; "always" or "never"
+REAPER_VACUUM = os.getenv("REAPER_VACUUM", "auto")
+REAPER_CHATLESS_DOCUMENTS = os.getenv("REAPER_CHATLESS_DOCUMENTS", "false").lower() == "true"
+
+PER_DOCUMENT_PREFIX = "document_"
+SCAN_BATCH_SIZE = 1000
+LEXICAL_SUFFIX = ".json.gz"
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+# Held from deleting entries to dropping their chunk sets; hold it to add an entry that reads an existing chunk set
+release_lock = threading.Lock()
+_ENTRY_FIELDS = {"_id": 0, "document_id": 1, "collection_name": 1, "storage_mode": 1, "chunk_document_id": 1, "chat_id": 1, "uploaded_at": 1}
+
+
+def _disk_usage(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _measured_usage(paths: list[str]) -> int:
+    """Bytes under `paths`, counting nested ones (lexical indexes in the Chroma directory) once."""
+    roots = sorted({os.path.abspath(path) for path in paths if os.path.exists(path)})
+    outer = [root for root in roots if not any(root != other and root.startswith(other + os.sep) for other in roots)]
+    return sum(_disk_usage(root) for root in outer)
+
+
+def _remove_file(path: str) -> int:
+    """Delete a file or directory; returns the bytes it held (0 if it was already gone)."""
+    try:
+        size = _disk_usage(path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _older_than(timestamp: float | None, cutoff: float) -> bool:
+    # Data from before timestamps were recorded is old by definition
+    return timestamp is None or float(timestamp) < cutoff
+
+
+def drop_chunk_set(chroma_client, collection_name: str, document_id: str | None) -> int:
+    """Delete one chunk set's vectors; returns the number of chunks removed.
+
+    `document_id` is None for a per-document collection (dropped whole),
+    otherwise the tag of the chunks to delete from a shared collection.
+    """
+    try:
+        collection = chroma_client.get_collection(collection_name)
+    except Exception:
+        return 0
+    if document_id is None:
+        count = collection.count()
+        chroma_client.delete_collection(collection_name)
+        return count
+    ids = collection.get(where={"document_id": document_id}, include=[])["ids"]
+    if ids:
+        collection.delete(ids=ids)
+    return len(ids)
+
+
+def release_documents(chroma_client, documents_sync, entries: list[dict]) -> list[tuple[str, str]]:
+    """Delete `entries` from `documents`, then every chunk set no other entry still reads.
+
+    Returns (collection name, chunk set key) for each chunk set dropped, so
+    the caller can invalidate what it cached for them.
+    """
+    if not entries:
+        return []
+    released = []
+    with release_lock:
+        documents_sync.delete_many({"document_id": {"$in": [entry["document_id"] for entry in entries]}})
+        for key, (collection_name, document_id) in chunk_sets(entries).items():
+            query = {"collection_name": collection_name}
+            if document_id:
+                query["chunk_document_id"] = document_id
+            if documents_sync.count_documents(query, limit=1):
+                continue
+            drop_chunk_set(chroma_client, collection_name, document_id)
+            _remove_file(index_path(key))
+            released.append((collection_name, key))
+    return released
+
+
+def _scan_shared_collection(collection) -> dict[str, list]:
+    """Tagged document id -> [chunk count, newest indexed_at] for one shared collection."""
+    tagged: dict[str, list] = {}
+    offset = 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=SCAN_BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            break
+        for metadata in batch["metadatas"]:
+            metadata = metadata or {}
+            entry = tagged.setdefault(metadata.get("document_id"), [0, None])
+            entry[0] += 1
+            indexed_at = metadata.get("indexed_at")
+            if indexed_at is not None and (entry[1] is None or indexed_at > entry[1]):
+                entry[1] = indexed_at
+        offset += len(batch["ids"])
+    return tagged
+
+
+def _live_chat_ids(documents_sync) -> set:
+    # Every chat has a summary from its first message until it is deleted
+    return {row["_id"] for row in documents_sync.database.chat_summaries.find({}, {"_id": 1})}
+
+
+def _known_segments(chroma_path: str) -> set[str] | None:
+    try:
+        connection = sqlite3.connect(f"file:{os.path.join(chroma_path, 'chroma.sqlite3')}?mode=ro", uri=True)
+        try:
+            return {row[0] for row in connection.execute("SELECT id FROM segments")}
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Warning: could not read Chroma segments, leaving segment directories alone: {e}")
+        return None
+
+
+def vacuum_chroma(chroma_path: str = CHROMA_PATH):
+    """Rebuild chroma.sqlite3 without its free pages (needs a moment with no writers)."""
+    connection = sqlite3.connect(os.path.join(chroma_path, "chroma.sqlite3"), timeout=30, isolation_level=None)
+    try:
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+
+def reap(chroma_client, documents_sync, chroma_path: str = CHROMA_PATH, grace_seconds: float = REAPER_GRACE_SECONDS,
+         vacuum: str = REAPER_VACUUM, chatless_documents: bool = REAPER_CHATLESS_DOCUMENTS,
+         dry_run: bool = False, active: set[str] = frozenset(), offline: bool = False,
+         max_stale_fraction: float = REAPER_MAX_STALE_FRACTION, force: bool = False) -> dict:
+    """Reconcile `documents` with Chroma and remove everything orphaned; returns a report.
+
+    `active` holds the collection names and document ids of ingestions in
+    progress in this process, which are left alone whatever their age.
+    `offline` also removes unknown segment directories and vacuums; only set
+    it when no other process has the Chroma directory open. `force` removes
+    stale entries even when that looks like a misconfigured store (see the
+    module docstring); the report's `refused` says why they were kept.
+    """
+    started = time.perf_counter()
+    cutoff = time.time() - grace_seconds
+    measured = [chroma_path, FLAT_STORE_PATH, LEXICAL_INDEX_DIR, UPLOAD_SPOOL_DIR]
+    bytes_before = _measured_usage(measured)
+    report = {
+        "dry_run": dry_run,
+        "documents_removed": 0,
+        "chunk_sets_released": 0,
+        "collections_dropped": 0,
+        "shared_chunks_deleted": 0,
+        "lexical_indexes_removed": 0,
+        "temp_files_removed": 0,
+        "segment_dirs_removed": 0,
+        "file_bytes_removed": 0,
+        "vacuumed": False,
+        "refused": None,
+        "released": [],
+    }
+
+    # Read the metadata before Chroma: chunks written after this are covered by the grace period
+    entries = list(documents_sync.find({}, _ENTRY_FIELDS))
+    collections = {collection.name: collection for collection in chroma_client.list_collections()}
+    shared = {
+        name: _scan_shared_collection(collection)
+        for name, collection in collections.items() if name.startswith(SHARED_COLLECTION_PREFIX)
+    }
+
+    # Entries whose chunks are gone can't answer anything
+    uploaded_before = datetime.utcfromtimestamp(cutoff)
+    settled = [
+        entry for entry in entries
+        if (entry.get("uploaded_at") is None or entry["uploaded_at"] < uploaded_before)
+        and entry["document_id"] not in active and entry["collection_name"] not in active
+    ]
+    stale = [
+        entry for entry in settled
+        if entry["collection_name"] not in collections
+        or (entry.get("storage_mode") == STORAGE_SHARED and entry["chunk_document_id"] not in shared.get(entry["collection_name"], {}))
+    ]
+    if chatless_documents:
+        live_chats = _live_chat_ids(documents_sync)
+        stale += [entry for entry in settled if entry.get("chat_id") and entry["chat_id"] not in live_chats]
+    stale = list({entry["document_id"]: entry for entry in stale}.values())
+
+    # A wrong path or an empty volume makes every entry look stale; don't delete the lot on that evidence
+    if stale and not force:
+        if not collections:
+            report["refused"] = f"the vector store lists no collections but `documents` has {len(entries)} entries"
+        elif len(stale) > max_stale_fraction * len(entries):
+            report["refused"] = (
+                f"{len(stale)} of {len(entries)} documents look stale, more than "
+                f"{max_stale_fraction:.0%}; check CHROMA_PATH, then rerun with --force"
+            )
+        if report["refused"]:
+            print(f"Warning: storage reaper kept all documents: {report['refused']}")
+            stale = []
+    removed_ids = {entry["document_id"] for entry in stale}
+    referenced = chunk_sets([entry for entry in entries if entry["document_id"] not in removed_ids])
+    # Chunk sets of the stale entries are released with them, not swept below
+    stale_keys = set(chunk_sets(stale))
+    report["documents_removed"] = len(stale)
+    if dry_run:
+        report["chunk_sets_released"] = len(stale_keys - set(referenced))
+    elif stale:
+        report["released"] = release_documents(chroma_client, documents_sync, stale)
+        report["chunk_sets_released"] = len(report["released"])
+
+    per_document_refs = {collection_name for collection_name, document_id in referenced.values() if document_id is None}
+    shared_refs = {(collection_name, document_id) for collection_name, document_id in referenced.values() if document_id}
+
+    for name, collection in collections.items():
+        if not name.startswith(PER_DOCUMENT_PREFIX) or name in per_document_refs or name in active or name in stale_keys:
+            continue
+        if not _older_than((collection.metadata or {}).get("created_at"), cutoff):
+            continue
+        if not dry_run:
+            drop_chunk_set(chroma_client, name, None)
+            report["released"].append((name, name))
+        report["collections_dropped"] += 1
+
+    for name, tagged in shared.items():
+        for document_id, (count, indexed_at) in tagged.items():
+            if document_id is None or (name, document_id) in shared_refs or document_id in active or document_id in stale_keys:
+                continue
+            if not _older_than(indexed_at, cutoff):
+                continue
+            if not dry_run:
+                drop_chunk_set(chroma_client, name, document_id)
+                report["released"].append((name, document_id))
+            report["shared_chunks_deleted"] += count
+
+    live_keys = set(referenced) | set(active)
+    if os.path.isdir(LEXICAL_INDEX_DIR):
+        for filename in os.listdir(LEXICAL_INDEX_DIR):
+            path = os.path.join(LEXICAL_INDEX_DIR, filename)
+            # Interrupted saves leave .tmp files behind
+            key = filename[:-len(LEXICAL_SUFFIX)] if filename.endswith(LEXICAL_SUFFIX) else None
+            if key in live_keys or os.path.getmtime(path) >= cutoff:
+                continue
+            report["file_bytes_removed"] += _disk_usage(path) if dry_run else _remove_file(path)
+            report["lexical_indexes_removed"] += 1
+
+    if os.path.isdir(UPLOAD_SPOOL_DIR):
+        for filename in os.listdir(UPLOAD_SPOOL_DIR):
+            path = os.path.join(UPLOAD_SPOOL_DIR, filename)
+            if not filename.startswith("temp_") or os.path.getmtime(path) >= cutoff:
+                continue
+            report["file_bytes_removed"] += _disk_usage(path) if dry_run else _remove_file(path)
+            report["temp_files_removed"] += 1
+
+    if offline and os.path.isdir(chroma_path):
+        # List directories before reading segments: a segment's row is written before its directory
+        candidates = [
+            name for name in os.listdir(chroma_path)
+            if _SEGMENT_DIR.match(name) and os.path.isdir(os.path.join(chroma_path, name))
+        ]
+        segments = _known_segments(chroma_path) if candidates else set()
+        for name in candidates if segments is not None else []:
+            path = os.path.join(chroma_path, name)
+            if name in segments or os.path.getmtime(path) >= cutoff:
+                continue
+            report["file_bytes_removed"] += _disk_usage(path) if dry_run else _remove_file(path)
+            report["segment_dirs_removed"] += 1
+
+    chroma_changed = report["released"] or report["collections_dropped"] or report["shared_chunks_deleted"]
+    # A flat-store-only deployment has no chroma.sqlite3
+    has_sqlite = os.path.exists(os.path.join(chroma_path, "chroma.sqlite3"))
+    if offline and not dry_run and has_sqlite and (vacuum == "always" or (vacuum == "auto" and chroma_changed)):
+        try:
+            vacuum_chroma(chroma_path)
+            report["vacuumed"] = True
+        except sqlite3.Error as e:
+            print(f"Warning: could not vacuum Chroma: {e}")
+
+    report["bytes_reclaimed"] = max(0, bytes_before - _measured_usage(measured)) if not dry_run else None
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def describe(report: dict) -> str:
+    action = "Would remove" if report["dry_run"] else "Removed"
+    reclaimed = "" if report["bytes_reclaimed"] is None else f", reclaimed {report['bytes_reclaimed'] / 1e6:.1f} MB"
+    refused = f" (kept stale documents: {report['refused']})" if report["refused"] else ""
+    return (
+        f"{action} {report['documents_removed']} stale documents ({report['chunk_sets_released']} chunk sets), "
+        f"{report['collections_dropped']} orphaned collections, "
+        f"{report['shared_chunks_deleted']} shared chunks, {report['lexical_indexes_removed']} lexical indexes, "
+        f"{report['temp_files_removed']} temp files, {report['segment_dirs_removed']} segment directories{reclaimed}{refused}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove orphaned Chroma data, lexical indexes and upload temp files.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    parser.add_argument("--grace-seconds", type=float, default=REAPER_GRACE_SECONDS, help="Leave anything newer than this alone")
+    parser.add_argument("--vacuum", choices=["auto", "always", "never"], default=REAPER_VACUUM)
+    parser.add_argument("--online", action="store_true",
+                        help="The backend is running: skip removing segment directories and vacuuming")
+    parser.add_argument("--chatless-documents", action="store_true", default=REAPER_CHATLESS_DOCUMENTS,
+                        help="Also remove documents whose chat no longer exists")
+    parser.add_argument("--force", action="store_true",
+                        help="Remove stale documents even if the store is empty or more than REAPER_MAX_STALE_FRACTION are stale")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH, help="Chroma PersistentClient directory")
+    args = parser.parse_args()
+
+    from database import close_clients, documents_sync
+
+    try:
+        report = reap(
+            VectorClient(chroma_path=args.chroma_path), documents_sync, chroma_path=args.chroma_path,
+            grace_seconds=args.grace_seconds, vacuum=args.vacuum, chatless_documents=args.chatless_documents,
+            dry_run=args.dry_run, offline=not args.online, force=args.force
+        )
+    finally:
+        close_clients()
+    print(json.dumps(report, indent=2, default=str))
+    print(describe(report))
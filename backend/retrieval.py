@@ -0,0 +1,159 @@
+"""
+Retrieval and answer synthesis helpers for query_document.
+
+The question is embedded once and a single top-k Chroma query returns both
+the distances used for the threshold/web-fallback decision and the chunks
+handed to the response synthesizer.
+
+llama-index is imported inside the functions that need it, so main.py can
+import this module without paying for llama-index at startup.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from llama_index.core.prompts import ChatPromptTemplate
+    from llama_index.core.schema import NodeWithScore
+
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "3"))
+# Constant in reciprocal-rank fusion: 1 / (RRF_K + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def _to_node(node_id: str, text: str, metadata: dict | None, embedding=None):
+    from llama_index.core.schema import TextNode
+    from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+    try:
+        node = metadata_dict_to_node(metadata or {})
+        node.set_content(text)
+    except Exception:
+        node = TextNode(id_=node_id, text=text or "", metadata=metadata or {})
+    if embedding is not None:
+        node.embedding = [float(value) for value in embedding]
+    return node
+
+
+def query_collection(collection, query_embedding: list[float], top_k: int = SIMILARITY_TOP_K, where: dict | None = None,
+                     with_embeddings: bool = False) -> list[NodeWithScore]:
+    """Run one Chroma query and return the chunks closest first.
+
+    `NodeWithScore.score` holds the raw Chroma distance (lower is closer), so
+    the best match's score can be compared against the chat threshold directly.
+    `where` filters chunk metadata (used for shared collections).
+    `with_embeddings` also loads each chunk's vector onto `node.embedding`.
+    """
+    from llama_index.core.schema import NodeWithScore
+
+    query_kwargs = {"where": where} if where else {}
+    include = ["documents", "metadatas", "distances"] + (["embeddings"] if with_embeddings else [])
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=top_k,
+        include=include,
+        **query_kwargs
+    )
+    if not results or not results.get("ids") or not results["ids"][0]:
+        return []
+
+    embeddings = results["embeddings"][0] if with_embeddings else [None] * len(results["ids"][0])
+    return [
+        NodeWithScore(node=_to_node(node_id, text, metadata, embedding), score=distance)
+        for node_id, text, metadata, distance, embedding in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0], embeddings
+        )
+    ]
+
+
+def fetch_nodes(collection, node_ids: list[str], with_embeddings: bool = False) -> list[NodeWithScore]:
+    """Load chunks by id (for lexical hits that the vector query did not return).
+
+    These have no distance, so `score` is None.
+    """
+    from llama_index.core.schema import NodeWithScore
+
+    if not node_ids:
+        return []
+    include = ["documents", "metadatas"] + (["embeddings"] if with_embeddings else [])
+    results = collection.get(ids=node_ids, include=include)
+    embeddings = results["embeddings"] if with_embeddings else [None] * len(results["ids"])
+    by_id = {
+        node_id: NodeWithScore(node=_to_node(node_id, text, metadata, embedding), score=None)
+        for node_id, text, metadata, embedding in zip(results["ids"], results["documents"], results["metadatas"], embeddings)
+    }
+    return [by_id[node_id] for node_id in node_ids if node_id in by_id]
+
+
+def merge_top_k(results: list[list[NodeWithScore]], top_k: int = SIMILARITY_TOP_K) -> list[NodeWithScore]:
+    """Merge per-collection results (scores are distances) into one closest-first top-k."""
+    merged = [node for nodes in results for node in nodes]
+    merged.sort(key=lambda node: node.score)
+    return merged[:top_k]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """Fuse several best-first id rankings; ids ranked high in any list come first."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def build_qa_template(system_prompt: str) -> ChatPromptTemplate:
+    from llama_index.core.llms import ChatMessage, MessageRole
+    from llama_index.core.prompts import ChatPromptTemplate
+    from llama_index.core.prompts.default_prompts import DEFAULT_TEXT_QA_PROMPT_TMPL
+
+    return ChatPromptTemplate([
+        ChatMessage(role=MessageRole.SYSTEM, content=system_prompt),
+        ChatMessage(role=MessageRole.USER, content=DEFAULT_TEXT_QA_PROMPT_TMPL),
+    ])
+
+
+def build_synthesizer(system_prompt: str):
+    """A compact-mode response synthesizer whose QA prompt carries `system_prompt`.
+
+    `system_prompt` may contain template variables; pass their values as
+    keyword arguments to `asynthesize`.
+    """
+    from llama_index.core import get_response_synthesizer
+
+    return get_response_synthesizer(response_mode="compact", text_qa_template=build_qa_template(system_prompt))
+
+
+def format_context(nodes: list[NodeWithScore]) -> str:
+    from llama_index.core.schema import MetadataMode
+
+    return "\n\n".join(node.node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes)
+
+
+async def stream_synthesis(system_prompt: str, question: str, nodes: list[NodeWithScore], **prompt_vars):
+    """Stream an answer over the retrieved chunks as text deltas.
+
+    Uses the same QA prompt as build_synthesizer, with all chunks packed into
+    a single call (top-k chunks fit one context window).
+    """
+    from llama_index.core import Settings
+
+    messages = build_qa_template(system_prompt).format_messages(
+        context_str=format_context(nodes), query_str=question, **prompt_vars
+    )
+    response_gen = await Settings.llm.astream_chat(messages)
+    async for chunk in response_gen:
+        if chunk.delta:
+            yield chunk.delta
+
+
+def response_text(response) -> str:
+    # Try to get the text from the response object
+    if hasattr(response, 'response'):
+        return str(response.response)
+    elif hasattr(response, 'text'):
+        return str(response.text)
+    elif hasattr(response, 'message'):
+        return str(response.message)
+    return str(response)
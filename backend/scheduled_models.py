@@ -0,0 +1,196 @@
+"""
+llama-index model wrappers that route provider calls through the scheduler
+(see scheduler.py): ScheduledEmbedding rate-limits, retries and coalesces
+embedding requests, ScheduledOpenAI does the same for async LLM calls.
+
+Imported when the models are built, not when the app is.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI
+
+from scheduler import (
+    EMBED_COALESCE_MS, EMBED_DISPATCH_CONCURRENCY, EMBED_REQUEST_MAX_INPUTS, LLM_COMPLETION_TOKENS_ESTIMATE,
+    RateLimiter, acall_with_retry, call_with_retry, estimate_tokens, stream_with_retry
+)
+
+
+class _PendingTexts:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.tokens = sum(estimate_tokens(text) for text in texts)
+        self.result: list[list[float]] | None = None
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+
+class ScheduledEmbedding(BaseEmbedding):
+    """Embed model wrapper that rate-limits, retries and coalesces requests to `inner`."""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _limiter: RateLimiter = PrivateAttr()
+    _queue: queue.Queue = PrivateAttr()
+    _slots: threading.Semaphore = PrivateAttr()
+    _pool: ThreadPoolExecutor = PrivateAttr()
+    _max_inputs: int = PrivateAttr()
+    _linger: float = PrivateAttr()
+    _counters: dict = PrivateAttr()
+    _counters_lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, limiter: RateLimiter, max_inputs: int = EMBED_REQUEST_MAX_INPUTS,
+                 coalesce_ms: float = EMBED_COALESCE_MS, concurrency: int = EMBED_DISPATCH_CONCURRENCY, **kwargs: Any):
+        # Callers hand over whole chunk batches; this class decides the request size
+        super().__init__(model_name=inner.model_name, embed_batch_size=max_inputs, **kwargs)
+        self._inner = inner
+        self._limiter = limiter
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed-dispatch")
+        self._max_inputs = max_inputs
+        self._linger = coalesce_ms / 1000.0
+        self._counters = {"batches": 0, "texts": 0, "coalesced_batches": 0}
+        # Dispatcher threads update the counters concurrently
+        self._counters_lock = threading.Lock()
+        threading.Thread(target=self._collect, name="embed-coalesce", daemon=True).start()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _collect(self):
+        """Group queued texts into requests of up to `max_inputs`, one per free dispatcher."""
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            # While every dispatcher is busy, more uploads' chunks pile up for the next batch
+            self._slots.acquire()
+            batch = [first]
+            size = len(first.texts)
+            deadline = time.monotonic() + self._linger
+            while size < self._max_inputs:
+                try:
+                    pending = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if size + len(pending.texts) > self._max_inputs:
+                    carry = pending
+                    break
+                batch.append(pending)
+                size += len(pending.texts)
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list[_PendingTexts]):
+        try:
+            texts = [text for pending in batch for text in pending.texts]
+            tokens = sum(pending.tokens for pending in batch)
+            vectors = call_with_retry(self._limiter, tokens, lambda: self._inner._get_text_embeddings(texts))
+            offset = 0
+            for pending in batch:
+                pending.result = vectors[offset:offset + len(pending.texts)]
+                offset += len(pending.texts)
+            with self._counters_lock:
+                self._counters["batches"] += 1
+                self._counters["texts"] += len(texts)
+                if len(batch) > 1:
+                    self._counters["coalesced_batches"] += 1
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+            self._slots.release()
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        parts = [_PendingTexts(texts[i:i + self._max_inputs]) for i in range(0, len(texts), self._max_inputs)]
+        for part in parts:
+            self._queue.put(part)
+        vectors = []
+        for part in parts:
+            part.done.wait()
+            if part.error is not None:
+                raise part.error
+            vectors.extend(part.result)
+        return vectors
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return call_with_retry(self._limiter, estimate_tokens(query), lambda: self._inner._get_query_embedding(query))
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return await acall_with_retry(self._limiter, estimate_tokens(query), lambda: self._inner._aget_query_embedding(query))
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {**counters, "queued": self._queue.qsize(), "max_inputs": self._max_inputs}
+
+
+class ScheduledOpenAI(OpenAI):
+    """OpenAI LLM whose async calls go through a RateLimiter with retries.
+
+    Construct it with max_retries=0 so the client's own retries don't stack
+    on top of these.
+    """
+
+    _limiter: RateLimiter = PrivateAttr()
+
+    def __init__(self, limiter: RateLimiter, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._limiter = limiter
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledOpenAI"
+
+    def _budget(self, prompt_text: str) -> int:
+        return estimate_tokens(prompt_text) + (self.max_tokens or LLM_COMPLETION_TOKENS_ESTIMATE)
+
+    def _chat_budget(self, messages: Sequence[ChatMessage]) -> int:
+        return self._budget("".join(str(message.content or "") for message in messages))
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await acall_with_retry(
+            self._limiter, self._chat_budget(messages),
+            lambda: super(ScheduledOpenAI, self).achat(messages, **kwargs)
+        )
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return stream_with_retry(
+            self._limiter, self._chat_budget(messages),
+            lambda: super(ScheduledOpenAI, self).astream_chat(messages, **kwargs)
+        )
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await acall_with_retry(
+            self._limiter, self._budget(prompt),
+            lambda: super(ScheduledOpenAI, self).acomplete(prompt, formatted=formatted, **kwargs)
+        )
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return stream_with_retry(
+            self._limiter, self._budget(prompt),
+            lambda: super(ScheduledOpenAI, self).astream_complete(prompt, formatted=formatted, **kwargs)
+        )
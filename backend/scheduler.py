@@ -0,0 +1,232 @@
+"""
+Process-wide scheduling of embedding and LLM API requests.
+
+Every embedding request and every async call to Settings.llm passes through
+a RateLimiter (token buckets on requests and tokens per minute) and is
+retried with jittered exponential backoff on rate limits, timeouts and 5xx
+errors. A 429 pauses the whole limiter, so concurrent callers back off
+together instead of each hitting the API again.
+
+Chunk embeddings from concurrent uploads are coalesced: ScheduledEmbedding
+queues them and dispatches full batches of up to EMBED_REQUEST_MAX_INPUTS
+texts. Query embeddings skip the queue because they are latency-sensitive.
+
+The llama-index wrappers (ScheduledEmbedding, ScheduledOpenAI) live in
+scheduled_models.py, so importing the limiter doesn't import llama-index.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+# Provider limits per minute; 0 = no client-side limit (retries still apply)
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "0"))
+EMBED_TOKENS_PER_MINUTE = float(os.getenv("EMBED_TOKENS_PER_MINUTE", "0"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# Completion tokens reserved per LLM call, on top of the prompt estimate
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "512"))
+
+EMBED_REQUEST_MAX_INPUTS = int(os.getenv("EMBED_REQUEST_MAX_INPUTS", "512"))
+# How long a partial batch waits for chunks from other uploads
+EMBED_COALESCE_MS = float(os.getenv("EMBED_COALESCE_MS", "20"))
+EMBED_DISPATCH_CONCURRENCY = int(os.getenv("EMBED_DISPATCH_CONCURRENCY", "2"))
+
+SCHEDULER_MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", "6"))
+SCHEDULER_BACKOFF_BASE_SECONDS = float(os.getenv("SCHEDULER_BACKOFF_BASE_SECONDS", "1"))
+SCHEDULER_BACKOFF_MAX_SECONDS = float(os.getenv("SCHEDULER_BACKOFF_MAX_SECONDS", "60"))
+
+# A bucket holds this many seconds of its per-minute rate, so short bursts go straight through
+BUCKET_BURST_SECONDS = 10.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English; only used to pace requests
+    return len(text) // 4 + 1
+
+
+def error_status(error: Exception) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_quota_error(error: Exception) -> bool:
+    """Out of credit: retrying will not help."""
+    return getattr(error, "code", None) == "insufficient_quota" or "insufficient_quota" in str(error)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return error_status(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error: Exception) -> bool:
+    if is_quota_error(error):
+        return False
+    if error_status(error) in RETRYABLE_STATUS_CODES or type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def retry_after(error: Exception) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(SCHEDULER_BACKOFF_MAX_SECONDS, SCHEDULER_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    hinted = retry_after(error)
+    return max(delay, hinted) if hinted else delay
+
+
+class TokenBucket:
+    """Refills at `per_minute / 60` units a second. Not thread-safe; RateLimiter locks it."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * BUCKET_BURST_SECONDS, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` (going into debt if needed) and return how long to wait before using it."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A single request larger than the bucket must still be able to go through
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class RateLimiter:
+    """Request and token budgets shared by every caller of one API."""
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+        self.throttled_seconds = 0.0
+        self.retries = 0
+        self.pauses = 0
+        self.failures = 0
+
+    def reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self._requests:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            self.requests += 1
+            self.tokens += tokens
+            self.throttled_seconds += wait
+            return wait
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Record a retry and return how long the caller should sleep first.
+
+        Rate limits pause the limiter itself, so other callers wait as well
+        and the caller's next `acquire` does the waiting.
+        """
+        delay = backoff_delay(attempt, error)
+        with self._lock:
+            self.retries += 1
+            if is_rate_limit_error(error):
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self.pauses += 1
+                delay = 0.0
+        print(f"{self.name}: {type(error).__name__} ({error_status(error)}), retry {attempt + 1}/{SCHEDULER_MAX_RETRIES}")
+        return delay
+
+    def gave_up(self, error: Exception, attempt: int) -> bool:
+        if attempt < SCHEDULER_MAX_RETRIES and is_retryable(error):
+            return False
+        with self._lock:
+            self.failures += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "retries": self.retries,
+            "pauses": self.pauses,
+            "failures": self.failures,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+
+def call_with_retry(limiter: RateLimiter, tokens: int, fn: Callable[[], Any]) -> Any:
+    attempt = 0
+    while True:
+        limiter.acquire(tokens)
+        try:
+            return fn()
+        except Exception as e:
+            if limiter.gave_up(e, attempt):
+                raise
+            time.sleep(limiter.backoff(attempt, e))
+            attempt += 1
+
+
+async def acall_with_retry(limiter: RateLimiter, tokens: int, fn: Callable[[], Awaitable[Any]]) -> Any:
+    attempt = 0
+    while True:
+        await limiter.aacquire(tokens)
+        try:
+            return await fn()
+        except Exception as e:
+            if limiter.gave_up(e, attempt):
+                raise
+            await asyncio.sleep(limiter.backoff(attempt, e))
+            attempt += 1
+
+
+async def stream_with_retry(limiter: RateLimiter, tokens: int, fn: Callable[[], Awaitable[Any]]):
+    """Like acall_with_retry for streaming calls; retries only until the first item arrives."""
+    attempt = 0
+    while True:
+        await limiter.aacquire(tokens)
+        started = False
+        try:
+            async for item in await fn():
+                started = True
+                yield item
+            return
+        except Exception as e:
+            if started or limiter.gave_up(e, attempt):
+                raise
+            await asyncio.sleep(limiter.backoff(attempt, e))
+            attempt += 1
@@ -0,0 +1,79 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+The first caller for a key runs the work; callers arriving with the same key
+while it is in flight await that result instead of repeating it. Nothing is
+kept once the flight lands (the answer cache covers later repeats).
+
+If the leading caller is cancelled (e.g. its client disconnected), the
+followers get FlightAbandoned rather than a CancelledError, and run()
+retries for them: the first to retry leads a new flight.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class FlightAbandoned(Exception):
+    """The caller running a flight was cancelled before it finished."""
+
+
+class SingleFlight:
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self.failures = 0
+        self._flights: dict[Hashable, asyncio.Future] = {}
+
+    def join(self, key: Hashable) -> Awaitable | None:
+        """Awaitable for the flight in progress for `key`, or None if there is none."""
+        future = self._flights.get(key)
+        if future is None:
+            return None
+        self.followers += 1
+        # A follower giving up must not cancel the shared flight
+        return asyncio.shield(future)
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Return (result, coalesced); `coalesced` is True when another caller's flight was joined."""
+        flight = self.join(key)
+        while flight is not None:
+            try:
+                return await flight, True
+            except FlightAbandoned:
+                # Counted again below, as a leader or as a follower of the new flight
+                self.followers -= 1
+                flight = self.join(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Cancelling the shared future would cancel every follower with it
+            future.set_exception(FlightAbandoned(f"The flight for {key!r} was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            self.failures += 1
+            future.set_exception(e)
+            # Mark it retrieved so a flight without followers doesn't log "never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def stats(self) -> dict:
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "failures": self.failures,
+            "coalesced_rate": round(self.followers / total, 4) if total else 0.0,
+        }
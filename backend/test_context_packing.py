@@ -0,0 +1,57 @@
+"""
+Token-budgeted context packing: the budget holds, and repeated or
+overlapping text is cut.
+
+Run with: python -m pytest test_context_packing.py
+"""
+
+import pytest
+
+schema = pytest.importorskip("llama_index.core.schema")
+
+from context_packing import overlap_length, pack_context, strip_overlaps, token_count  # noqa: E402
+
+
+def candidates(*texts):
+    return [schema.NodeWithScore(node=schema.TextNode(id_=f"n{i}", text=text), score=float(i)) for i, text in enumerate(texts)]
+
+
+def packed_tokens(packed) -> int:
+    return sum(token_count(node.node.get_content(metadata_mode=schema.MetadataMode.LLM)) for node in packed)
+
+
+def test_overlap_between_adjacent_chunks_is_cut():
+    first = "The warranty covers parts and labour for two years from delivery."
+    second = "for two years from delivery. Claims go through the dealer."
+    assert overlap_length(first, second) == len("for two years from delivery.")
+    assert strip_overlaps(second, [first]) == "Claims go through the dealer."
+    # A chunk contained in one already kept adds nothing
+    assert strip_overlaps("parts and labour for two years", [first]) is None
+
+
+def test_packing_stays_within_the_budget():
+    texts = [f"Section {i}: " + " ".join(f"word{i}_{j}" for j in range(40)) for i in range(8)]
+    packed = pack_context(candidates(*texts), budget=200, mmr_lambda=1.0)
+    assert packed and packed_tokens(packed) <= 200
+    # With relevance only, the order is the incoming one
+    assert [node.node.node_id for node in packed] == [f"n{i}" for i in range(len(packed))]
+
+
+def test_long_chunk_is_skipped_for_a_shorter_one_that_fits():
+    short = "Invoices are paid within thirty days of receipt."
+    long = " ".join(f"filler{j}" for j in range(400))
+    packed = pack_context(candidates(short, long, "Late payments incur a two percent fee."), budget=60, mmr_lambda=1.0)
+    assert [node.node.node_id for node in packed] == ["n0", "n2"]
+
+
+def test_first_chunk_is_truncated_if_it_alone_is_too_long():
+    long = " ".join(f"filler{j}" for j in range(400))
+    packed = pack_context(candidates(long), budget=50)
+    assert len(packed) == 1 and packed_tokens(packed) <= 50
+
+
+def test_duplicates_are_dropped():
+    text = "Replace the seal with part XJ-200 when the pump leaks."
+    packed = pack_context(candidates(text, text, "The pump is serviced yearly."), budget=500)
+    assert [node.node.get_content() for node in packed].count(text) == 1
+    assert len(packed) == 2
@@ -0,0 +1,54 @@
+"""
+The flat vector store's storage types: quantisation round trips, and
+queries that agree with exact float32 search.
+
+Run with: python -m pytest test_flat_store.py
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from flat_store import FlatCollection, _to_float32, quantise  # noqa: E402
+
+
+def random_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_float16_conversion_is_exact():
+    values = np.array([0.0, -0.0, 1.0, -2.5, 65504.0, 6.1e-5, 6e-8, -3e-7], dtype=np.float16)
+    assert np.array_equal(_to_float32(values), values.astype(np.float32))
+    block = random_vectors(64, 32).astype(np.float16)
+    assert np.array_equal(_to_float32(block), block.astype(np.float32))
+
+
+def test_int8_round_trip_is_within_half_a_step():
+    vectors = random_vectors(50, 32)
+    vectors[3] = 0.0
+    stored, scales = quantise(vectors, "int8")
+    assert stored.dtype == np.int8 and scales.shape == (50,)
+    restored = stored.astype(np.float32) * scales[:, None]
+    assert np.all(np.abs(restored - vectors) <= scales[:, None] / 2 + 1e-7)
+    # An all-zero row gets scale 1, not a division by zero
+    assert scales[3] == 1.0 and not stored[3].any()
+
+
+@pytest.mark.parametrize("dtype,rerank", [("float32", False), ("float16", False), ("int8", False), ("int8", True)])
+def test_query_matches_exact_search(tmp_path, dtype, rerank):
+    vectors = random_vectors(300, 32)
+    collection = FlatCollection.create(str(tmp_path / "chunks"), "chunks", dtype=dtype, rerank=rerank)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    collection.add(ids=ids, embeddings=vectors.tolist(), documents=[f"text {i}" for i in range(len(vectors))])
+
+    queries = random_vectors(20, 32, seed=1)
+    recall = []
+    for query in queries:
+        result = collection.query(query_embeddings=[query.tolist()], n_results=5)
+        exact = np.argsort(((vectors - query) ** 2).sum(axis=1), kind="stable")[:5]
+        recall.append(len({ids[i] for i in exact} & set(result["ids"][0])) / 5)
+        # Distances are squared L2, like Chroma's
+        best = ids.index(result["ids"][0][0])
+        assert result["distances"][0][0] == pytest.approx(((vectors[best] - query) ** 2).sum(), abs=0.05)
+    assert np.mean(recall) >= (1.0 if dtype == "float32" or rerank else 0.9)
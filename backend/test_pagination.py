@@ -0,0 +1,53 @@
+"""
+Keyset pagination cursors.
+
+Run with: python -m pytest test_pagination.py
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+
+from pagination import after_filter, decode_cursor, encode_cursor  # noqa: E402
+
+# The in-memory `documents` collection the API benchmark uses
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from memory_mongo import MemoryCollection  # noqa: E402
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 12, 30, 15, 250000)
+    cursor = encode_cursor(timestamp, "doc|with|pipes")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, "doc|with|pipes")
+
+
+def test_invalid_cursor_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+def test_pages_cover_every_item_once_despite_tied_timestamps():
+    documents = MemoryCollection("documents")
+    start = datetime(2024, 1, 1)
+    for i in range(25):
+        # Pairs of items share a timestamp, so the id has to break ties
+        documents.insert_one({"document_id": f"doc-{i:02d}", "uploaded_at": start + timedelta(minutes=i // 2)})
+
+    seen, cursor = [], None
+    while True:
+        query = after_filter("uploaded_at", "document_id", cursor) if cursor else {}
+        page = list(documents.find(query).sort([("uploaded_at", -1), ("document_id", -1)]).limit(4))
+        seen += [doc["document_id"] for doc in page]
+        if len(page) < 4:
+            break
+        cursor = encode_cursor(page[-1]["uploaded_at"], page[-1]["document_id"])
+    assert seen == [f"doc-{i:02d}" for i in reversed(range(25))]
@@ -0,0 +1,125 @@
+"""
+The storage reaper against a flat store and the in-memory `documents`
+collection: which entries count as stale, the grace period, and the
+refusals that keep a misconfigured store from wiping `documents`.
+
+Run with: python -m pytest test_reaper.py
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+# The in-memory `documents` collection the API benchmark uses
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import reaper  # noqa: E402
+from flat_store import FlatStoreClient  # noqa: E402
+from memory_mongo import MemoryCollection  # noqa: E402
+
+OLD = datetime.utcnow() - timedelta(days=2)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Keep the file sweeps inside the test's directory
+    for name in ("LEXICAL_INDEX_DIR", "UPLOAD_SPOOL_DIR", "FLAT_STORE_PATH"):
+        monkeypatch.setattr(reaper, name, str(tmp_path / name.lower()))
+    return FlatStoreClient(str(tmp_path / "flat")), MemoryCollection("documents")
+
+
+def add_document(client, documents, document_id: str, with_chunks: bool = True, uploaded_at: datetime = OLD) -> str:
+    collection_name = f"document_{document_id}"
+    if with_chunks:
+        collection = client.get_or_create_collection(collection_name, metadata={"created_at": int(time.time()) - 86400})
+        collection.add(ids=[f"{document_id}-0"], embeddings=[[1.0, 0.0]], documents=["text"], metadatas=[{"page": 1}])
+    documents.insert_one({
+        "document_id": document_id,
+        "collection_name": collection_name,
+        "storage_mode": "per_document",
+        "chat_id": "chat_1",
+        "uploaded_at": uploaded_at,
+    })
+    return collection_name
+
+
+def remaining(documents) -> set[str]:
+    return {entry["document_id"] for entry in documents.find({})}
+
+
+def test_entries_without_chunks_are_removed(store, tmp_path):
+    client, documents = store
+    for document_id in ("a", "b", "c"):
+        add_document(client, documents, document_id)
+    add_document(client, documents, "gone", with_chunks=False)
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path))
+    assert report["refused"] is None
+    assert report["documents_removed"] == 1
+    assert remaining(documents) == {"a", "b", "c"}
+
+
+def test_recent_and_active_entries_are_kept(store, tmp_path):
+    client, documents = store
+    for document_id in ("a", "b", "c", "d"):
+        add_document(client, documents, document_id)
+    # Its chunks may still be on their way: inside the grace period
+    add_document(client, documents, "new", with_chunks=False, uploaded_at=datetime.utcnow())
+    add_document(client, documents, "ingesting", with_chunks=False)
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path), active={"ingesting"})
+    assert report["documents_removed"] == 0
+    assert remaining(documents) == {"a", "b", "c", "d", "new", "ingesting"}
+
+
+def test_empty_store_removes_nothing_unless_forced(store, tmp_path):
+    client, documents = store
+    for document_id in ("a", "b"):
+        add_document(client, documents, document_id, with_chunks=False)
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path))
+    assert "no collections" in report["refused"]
+    assert report["documents_removed"] == 0
+    assert remaining(documents) == {"a", "b"}
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path), force=True)
+    assert report["documents_removed"] == 2
+    assert remaining(documents) == set()
+
+
+def test_mass_removal_is_refused_unless_forced(store, tmp_path):
+    client, documents = store
+    add_document(client, documents, "a")
+    for document_id in ("b", "c"):
+        add_document(client, documents, document_id, with_chunks=False)
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path), max_stale_fraction=0.5)
+    assert report["refused"]
+    assert remaining(documents) == {"a", "b", "c"}
+    # The refused entries' chunk sets still count as referenced
+    assert [collection.name for collection in client.list_collections()] == ["document_a"]
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path), max_stale_fraction=0.5, force=True)
+    assert report["documents_removed"] == 2
+    assert remaining(documents) == {"a"}
+
+
+def test_unreferenced_collections_are_dropped_after_the_grace_period(store, tmp_path):
+    client, documents = store
+    add_document(client, documents, "a")
+    old = client.get_or_create_collection("document_orphan", metadata={"created_at": int(time.time()) - 86400})
+    old.add(ids=["orphan-0"], embeddings=[[0.0, 1.0]], documents=["text"])
+    client.get_or_create_collection("document_filling", metadata={"created_at": int(time.time())})
+
+    dry_run = reaper.reap(client, documents, chroma_path=str(tmp_path), dry_run=True)
+    assert dry_run["collections_dropped"] == 1
+    assert len(client.list_collections()) == 3
+
+    report = reaper.reap(client, documents, chroma_path=str(tmp_path))
+    assert report["collections_dropped"] == 1
+    assert sorted(collection.name for collection in client.list_collections()) == ["document_a", "document_filling"]
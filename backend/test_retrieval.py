@@ -0,0 +1,56 @@
+"""
+Ranking helpers for hybrid retrieval: merging per-collection vector results,
+reciprocal-rank fusion, and the BM25 exact-identifier shortcut.
+
+Run with: python -m pytest test_retrieval.py
+"""
+
+import pytest
+
+from lexical_index import BM25Index, identifier_terms
+from retrieval import merge_top_k, reciprocal_rank_fusion
+
+
+def test_merge_top_k_orders_by_distance_across_collections():
+    schema = pytest.importorskip("llama_index.core.schema")
+
+    def nodes(*scored):
+        return [schema.NodeWithScore(node=schema.TextNode(id_=node_id, text=node_id), score=score) for node_id, score in scored]
+
+    merged = merge_top_k([nodes(("a1", 0.4), ("a2", 0.9)), nodes(("b1", 0.1), ("b2", 0.5)), []], top_k=3)
+    # Scores are distances: smallest first, whichever collection they came from
+    assert [node.node.node_id for node in merged] == ["b1", "a1", "b2"]
+    assert merge_top_k([[], []], top_k=3) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "d"], ["c", "b"]], k=60)
+    # b is second in both lists, which beats first in only one
+    assert fused == ["b", "a", "c", "d"]
+    assert reciprocal_rank_fusion([["x", "y"]]) == ["x", "y"]
+
+
+def test_reciprocal_rank_fusion_ties_and_ranks():
+    # Ties on score keep first-seen order
+    assert reciprocal_rank_fusion([["a"], ["b"]]) == ["a", "b"]
+    # Rank 1 in one list beats rank 2 in one list, whatever k is
+    assert reciprocal_rank_fusion([["a", "b"], ["c"]], k=1)[:2] == ["a", "c"]
+
+
+def test_identifier_terms():
+    assert identifier_terms("What does error XJ-200 mean in v10.2.1?") == {"xj-200", "v10.2.1"}
+    assert identifier_terms("How many pages are there in 2023?") == set()
+
+
+def test_bm25_finds_the_chunk_naming_an_identifier():
+    index = BM25Index()
+    index.add("intro", "The pump is installed in the basement and serviced yearly.")
+    index.add("parts", "Replace the seal with part XJ-200 when the pump leaks.")
+    index.add("other", "Seals and pumps are covered by the warranty.")
+
+    hits = index.search(["xj-200", "seal"], top_n=2)
+    assert hits[0][0] == "parts"
+    assert index.contains_all("parts", identifier_terms("Where is part XJ-200 used?"))
+    assert not index.contains_all("other", identifier_terms("Where is part XJ-200 used?"))
+    # The parts are indexed too, so "XJ 200" finds the same chunk
+    assert index.search(["xj", "200"], top_n=1)[0][0] == "parts"
@@ -0,0 +1,28 @@
+"""
+Token buckets behind RateLimiter.
+
+Run with: python -m pytest test_scheduler.py
+"""
+
+from scheduler import BUCKET_BURST_SECONDS, TokenBucket
+
+
+def test_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    # A full bucket holds BUCKET_BURST_SECONDS of refill
+    for _ in range(int(BUCKET_BURST_SECONDS)):
+        assert bucket.reserve(1, now) == 0.0
+    # The next one waits for a second of refill, the one after for two
+    assert bucket.reserve(1, now) == 1.0
+    assert bucket.reserve(1, now) == 2.0
+    # Time passing pays the debt back
+    assert bucket.reserve(1, now + 3.0) == 0.0
+
+
+def test_oversized_request_still_goes_through():
+    bucket = TokenBucket(per_minute=600)
+    now = bucket.updated
+    # Larger than the bucket: takes the whole bucket rather than waiting forever
+    assert bucket.reserve(bucket.capacity * 5, now) == 0.0
+    assert bucket.reserve(10, now) == 1.0
@@ -0,0 +1,118 @@
+"""
+Round trip for the shared-collection layout: ingest -> filtered query -> delete.
+
+Documents go through the real ingestion path (iter_documents ->
+iter_node_batches -> tag_nodes -> embed_and_store into vector_store_for)
+with offline hashing embeddings, into both Chroma and the flat store.
+
+Run with: python -m pytest test_shared_layout.py
+"""
+
+import os
+import sys
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import Settings  # noqa: E402
+from llama_index.core.node_parser import SentenceSplitter  # noqa: E402
+
+# The in-memory `documents` collection the API benchmark uses
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from chroma_layout import STORAGE_SHARED, shared_collection_name, tag_nodes, where_for  # noqa: E402
+from embedding_models import HashingEmbedding  # noqa: E402
+from flat_store import FlatStoreClient, vector_store_for  # noqa: E402
+from ingestion import embed_and_store, iter_documents, iter_node_batches  # noqa: E402
+from memory_mongo import MemoryCollection  # noqa: E402
+from reaper import drop_chunk_set, release_documents  # noqa: E402
+from retrieval import query_collection  # noqa: E402
+
+DOCUMENTS = {
+    "doc_a": "Invoices are paid within thirty days of receipt. " * 40,
+    "doc_b": "The warranty covers parts and labour for two years. " * 40,
+}
+
+
+@pytest.fixture(params=["chroma", "flat"])
+def client(request, tmp_path):
+    Settings.embed_model = HashingEmbedding(dim=64)
+    Settings.node_parser = SentenceSplitter(chunk_size=64, chunk_overlap=0)
+    if request.param == "chroma":
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        yield chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+        SharedSystemClient.clear_system_cache()
+    else:
+        yield FlatStoreClient(str(tmp_path / "flat"))
+
+
+def ingest(client, tmp_path, document_id: str, text: str) -> tuple[str, int]:
+    """Ingest `text` the way main.ingest_document does for shared storage."""
+    path = tmp_path / f"{document_id}.txt"
+    path.write_text(text)
+    collection_name = shared_collection_name(document_id)
+    vector_store = vector_store_for(client.get_or_create_collection(collection_name))
+
+    def tagged(batches):
+        for batch in batches:
+            yield tag_nodes(batch, document_id, "chat_1")
+
+    stored = embed_and_store(tagged(iter_node_batches(iter_documents(str(path), "text/plain", path.name))), vector_store)
+    return collection_name, stored
+
+
+def test_shared_layout_round_trip(client, tmp_path):
+    stored = {document_id: ingest(client, tmp_path, document_id, text) for document_id, text in DOCUMENTS.items()}
+    collection_name = stored["doc_a"][0]
+    assert all(name == collection_name for name, _ in stored.values())
+    collection = client.get_collection(collection_name)
+    assert collection.count() == sum(count for _, count in stored.values())
+
+    # Each document's chunks are found by its own document_id
+    for document_id, (_, count) in stored.items():
+        assert count > 1
+        rows = collection.get(where=where_for([document_id]), include=["metadatas"])
+        assert len(rows["ids"]) == count
+        assert {metadata["document_id"] for metadata in rows["metadatas"]} == {document_id}
+
+    query = Settings.embed_model.get_query_embedding("When are invoices paid?")
+    nodes = query_collection(collection, query, top_k=3, where=where_for(["doc_b"]))
+    assert len(nodes) == 3
+    assert all(node.node.metadata["document_id"] == "doc_b" for node in nodes)
+    assert all("warranty" in node.node.get_content() for node in nodes)
+
+    both = query_collection(collection, query, top_k=3, where=where_for(["doc_a", "doc_b"]))
+    assert both[0].node.metadata["document_id"] == "doc_a"
+
+    # Deleting one document's chunk set leaves the other's alone
+    assert drop_chunk_set(client, collection_name, "doc_a") == stored["doc_a"][1]
+    collection = client.get_collection(collection_name)
+    assert query_collection(collection, query, top_k=3, where=where_for(["doc_a"])) == []
+    assert collection.count() == stored["doc_b"][1]
+    assert len(query_collection(collection, query, top_k=3, where=where_for(["doc_b"]))) == 3
+
+
+def test_shared_chunks_go_with_their_last_document(client, tmp_path):
+    """A deduplicated upload reads another entry's chunks; they are dropped only when neither is left."""
+    collection_name, count = ingest(client, tmp_path, "doc_a", DOCUMENTS["doc_a"])
+    ingest(client, tmp_path, "doc_b", DOCUMENTS["doc_b"])
+    documents = MemoryCollection("documents")
+    entries = [
+        {"document_id": document_id, "collection_name": collection_name, "storage_mode": STORAGE_SHARED,
+         "chunk_document_id": "doc_a", "chat_id": chat_id}
+        for document_id, chat_id in (("doc_a", "chat_1"), ("doc_a_copy", "chat_2"))
+    ]
+    for entry in entries:
+        documents.insert_one(dict(entry))
+
+    assert release_documents(client, documents, [entries[0]]) == []
+    assert len(client.get_collection(collection_name).get(where=where_for(["doc_a"]))["ids"]) == count
+
+    assert release_documents(client, documents, [entries[1]]) == [(collection_name, "doc_a")]
+    collection = client.get_collection(collection_name)
+    assert collection.get(where=where_for(["doc_a"]))["ids"] == []
+    assert collection.get(where=where_for(["doc_b"]))["ids"]
+    assert documents.count_documents({}) == 0
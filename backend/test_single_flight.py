@@ -0,0 +1,78 @@
+"""
+SingleFlight coalescing, including a leader cancelled mid-flight.
+
+Run with: python -m pytest test_single_flight.py
+"""
+
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_flight():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flights.run("key", work) for _ in range(3)))
+        return calls, results, flights.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert sorted(results, key=lambda result: result[1]) == [("answer", False), ("answer", True), ("answer", True)]
+    assert stats["in_flight"] == 0 and stats["leaders"] == 1 and stats["followers"] == 2
+
+
+def test_cancelled_leader_hands_the_work_to_a_follower():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.01)
+            return f"answer {calls}"
+
+        leader = asyncio.create_task(flights.run("key", work))
+        await started.wait()
+        followers = [asyncio.create_task(flights.run("key", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        results = await asyncio.gather(*followers)
+        return calls, results, flights.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    # One follower leads the retry and the other joins it; neither sees the cancellation
+    assert calls == 2
+    assert sorted(results, key=lambda result: result[1]) == [("answer 2", False), ("answer 2", True)]
+    assert stats["in_flight"] == 0 and stats["leaders"] == 2 and stats["followers"] == 1
+
+
+def test_failures_reach_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider down")
+
+        return await asyncio.gather(*(flights.run("key", work) for _ in range(2)), return_exceptions=True), flights
+
+    results, flights = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.failures == 1
+    # Nothing is left behind, so the next caller runs the work again
+    assert flights.stats()["in_flight"] == 0
@@ -0,0 +1,161 @@
+"""
+Streaming upload handling.
+
+The multipart request body is parsed as it arrives and the file part is
+written straight to a uniquely named temp file, so memory per request does
+not grow with the file size and oversized uploads are rejected as soon as
+they cross the limit. A SHA-256 of the file is computed on the way through
+for deduplication.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "./temp")
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", "5")) * 1024 * 1024  # Default 5MB
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedUploadType(Exception):
+    pass
+
+
+class SpooledUpload:
+    def __init__(self, path: str, filename: str, content_type: str, size: int, content_hash: str):
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.content_hash = content_hash
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def file_too_large_error(size: int | None = None) -> HTTPException:
+    limit_mb = MAX_FILE_SIZE / (1024 * 1024)
+    detail = f"File too large. Maximum size is {limit_mb:g}MB."
+    if size is not None:
+        detail += f" Your file is {size / (1024*1024):.1f}MB"
+    return HTTPException(status_code=400, detail=detail)
+
+
+async def spool_upload(request: Request, allowed_types: list[str] | None = None, field_name: str = "file", max_size: int = MAX_FILE_SIZE) -> SpooledUpload:
+    """Stream the `field_name` part of a multipart request into a temp file.
+
+    Raises HTTPException(400) when the body is not multipart, the part is
+    missing or not one of `allowed_types`, or the file exceeds `max_size`.
+    The temp file is removed on error.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    declared_length = request.headers.get("content-length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > max_size + MULTIPART_OVERHEAD:
+        raise file_too_large_error(int(declared_length))
+
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+
+    state = {
+        "header_field": b"",
+        "header_value": b"",
+        "headers": {},
+        "in_file": False,
+        "found": False,
+        "filename": None,
+        "content_type": None,
+        "size": 0,
+    }
+    pending: list[bytes] = []
+    digest = hashlib.sha256()
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("latin-1")
+        state["in_file"] = name == field_name and not state["found"]
+        if state["in_file"]:
+            state["found"] = True
+            state["filename"] = disposition.get(b"filename", b"upload").decode("utf-8", errors="replace")
+            part_type = state["headers"].get(b"content-type", b"application/octet-stream")
+            state["content_type"] = part_type.decode("latin-1").split(";")[0].strip()
+            if allowed_types and state["content_type"] not in allowed_types:
+                raise UnsupportedUploadType()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if not state["in_file"]:
+            return
+        state["size"] += end - start
+        if state["size"] > max_size:
+            raise UploadTooLarge()
+        chunk = data[start:end]
+        digest.update(chunk)
+        pending.append(chunk)
+
+    def on_part_end():
+        state["in_file"] = False
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    spool = tempfile.NamedTemporaryFile(prefix="temp_", dir=UPLOAD_SPOOL_DIR, delete=False)
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if pending:
+                data = b"".join(pending)
+                pending.clear()
+                await asyncio.to_thread(spool.write, data)
+        parser.finalize()
+        await asyncio.to_thread(spool.close)
+    except UploadTooLarge:
+        spool.close()
+        os.remove(spool.name)
+        raise file_too_large_error()
+    except UnsupportedUploadType:
+        spool.close()
+        os.remove(spool.name)
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    except Exception:
+        spool.close()
+        os.remove(spool.name)
+        raise
+
+    if not state["found"]:
+        os.remove(spool.name)
+        raise HTTPException(status_code=400, detail=f"Missing '{field_name}' file field in upload")
+
+    return SpooledUpload(spool.name, state["filename"], state["content_type"], state["size"], digest.hexdigest())
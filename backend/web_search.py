@@ -0,0 +1,91 @@
+"""
+Dappier web search with a timeout and a TTL result cache.
+
+query_document runs this concurrently with document synthesis; a slow or
+failing search returns None so the answer degrades to document-only instead
+of holding the request.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+WEB_SEARCH_TIMEOUT_SECONDS = float(os.getenv("WEB_SEARCH_TIMEOUT_SECONDS", "8"))
+DOCUMENT_ANSWER_TIMEOUT_SECONDS = float(os.getenv("DOCUMENT_ANSWER_TIMEOUT_SECONDS", "30"))
+WEB_CACHE_TTL_SECONDS = float(os.getenv("WEB_CACHE_TTL_SECONDS", "600"))
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", "512"))
+
+
+def normalise_question(question: str) -> str:
+    return re.sub(r"[\s?!.]+$", "", " ".join(question.lower().split()))
+
+
+class WebResultCache:
+    def __init__(self, ttl_seconds: float = WEB_CACHE_TTL_SECONDS, max_entries: int = WEB_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question: str) -> str | None:
+        key = normalise_question(question)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, question: str, result: str):
+        key = normalise_question(question)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+async def search_web(dappier_tool, question: str, cache: WebResultCache, timeout: float = WEB_SEARCH_TIMEOUT_SECONDS) -> str | None:
+    """Return Dappier results for `question`, or None on timeout, error or no results."""
+    cached = cache.get(question)
+    if cached is not None:
+        return cached
+    try:
+        result = await asyncio.wait_for(
+            asyncio.to_thread(dappier_tool.search_real_time_data_string, question),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        print(f"Web search timed out after {timeout}s")
+        cache.timeouts += 1
+        return None
+    except Exception as e:
+        print(f"Web search failed: {e}")
+        cache.errors += 1
+        return None
+    if result:
+        cache.put(question, result)
+    return result or None
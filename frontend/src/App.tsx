@@ -1,8 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { UploadPane } from './components/UploadPane';
 import { ChatWindow } from './components/ChatWindow';
 import { Sidebar } from './components/Sidebar';
-import { createChat, getChats, getChatMessages, deleteChat, deleteAllChats, getChatThreshold, updateChatThreshold, getChatDocuments } from './api/api';
+import { createChat, getChats, streamChatMessages, deleteChat, deleteAllChats, getChatThreshold, updateChatThreshold, getChatDocuments } from './api/api';
 import { Message } from './types';
 
 interface ChatSession {
@@ -26,6 +26,10 @@ const STORAGE_KEYS = {
 
 function App() {
   const [chats, setChats] = useState<ChatSession[]>([]);
+  // Cursor of the next, older page of chats; null once the last page is loaded
+  const [chatsCursor, setChatsCursor] = useState<string | null>(null);
+  // Bumped on every message load, so a superseded stream stops adding messages
+  const messagesLoad = useRef(0);
   const [activeChatId, setActiveChatId] = useState<string | null>(null);
   const [currentMessages, setCurrentMessages] = useState<Message[]>([]);
   const [activeChatDocuments, setActiveChatDocuments] = useState<any[]>([]);
@@ -277,6 +281,7 @@ function App() {
     try {
       const response = await getChats();
       const serverChats = response.data.chats;
+      setChatsCursor(response.data.next_cursor);
       
       // Merge with localStorage data (localStorage takes precedence for UI)
       const localChats = JSON.parse(localStorage.getItem(STORAGE_KEYS.CHATS) || '[]');
@@ -293,6 +298,19 @@ function App() {
     }
   }
 
+  async function loadMoreChats() {
+    if (!chatsCursor) return;
+    try {
+      const response = await getChats(chatsCursor);
+      setChatsCursor(response.data.next_cursor);
+      setChats(prev => [...prev, ...response.data.chats.filter((chat: ChatSession) =>
+        !prev.some((loaded) => loaded._id === chat._id)
+      )]);
+    } catch (error) {
+      console.error('Error loading more chats:', error);
+    }
+  }
+
   async function loadChatMessages(chatId: string) {
     try {
       // First try to load from localStorage
@@ -301,47 +319,45 @@ function App() {
         setCurrentMessages(JSON.parse(savedMessages));
       }
       
-      // Then try to load from server as backup
-      const response = await getChatMessages(chatId);
-      const allMessages: Message[] = [];
-      
-      response.data.messages.forEach((msg: any, index: number) => {
-        // Generate unique base ID for each message pair (user + assistant)
-        const baseId = msg._id || `${Date.now()}_${index}`;
-        
-        // Add user message
-        allMessages.push({
-          id: `${baseId}_user`,
-          text: msg.question,
-          sender: 'user' as const,
-          timestamp: msg.timestamp,
-          metadata: {
-            distance: msg.distance,
-            threshold: msg.threshold,
-            webSearchUsed: msg.web_search_used,
-            webSearchReason: msg.web_search_reason
-          }
-        });
-        
-        // Add assistant message
-        allMessages.push({
-          id: `${baseId}_assistant`,
-          text: msg.answer,
-          sender: 'assistant' as const,
-          timestamp: msg.timestamp,
-          metadata: {
+      // Then stream them from the server, showing each chunk as it arrives
+      const load = ++messagesLoad.current;
+      let received = 0;
+      await streamChatMessages(chatId, (messages) => {
+        if (load !== messagesLoad.current) return;
+        const pairs: Message[] = [];
+        messages.forEach((msg: any, index: number) => {
+          // Generate unique base ID for each message pair (user + assistant)
+          const baseId = msg._id || msg.cursor || `${Date.now()}_${received + index}`;
+          const metadata = {
             distance: msg.distance,
             threshold: msg.threshold,
             webSearchUsed: msg.web_search_used,
             webSearchReason: msg.web_search_reason
-          }
+          };
+
+          // Add user message
+          pairs.push({
+            id: `${baseId}_user`,
+            text: msg.question,
+            sender: 'user' as const,
+            timestamp: msg.timestamp,
+            metadata
+          });
+
+          // Add assistant message
+          pairs.push({
+            id: `${baseId}_assistant`,
+            text: msg.answer,
+            sender: 'assistant' as const,
+            timestamp: msg.timestamp,
+            metadata
+          });
         });
+
+        // Server messages replace the localStorage copy once the first ones arrive
+        setCurrentMessages(prev => received === 0 ? pairs : [...prev, ...pairs]);
+        received += messages.length;
       });
-      
-      // Use server messages if they exist, otherwise keep localStorage messages
-      if (allMessages.length > 0) {
-        setCurrentMessages(allMessages);
-      }
     } catch (error) {
       console.error('Error loading chat messages:', error);
     }
@@ -421,6 +437,8 @@ function App() {
           activeChatId={activeChatId}
           setActiveChatId={setActiveChatId}
           onRefreshChats={loadChats}
+          hasMoreChats={chatsCursor !== null}
+          onLoadMoreChats={loadMoreChats}
           onDeleteChat={handleDeleteChat}
           onClearAllChats={clearAllLocalStorage}
           collapsed={sidebarCollapsed}
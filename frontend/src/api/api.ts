@@ -11,9 +11,43 @@ export async function uploadDocument(file: File, chatId?: string) {
     ? `${BASE_URL}/upload/?chat_id=${chatId}`
     : `${BASE_URL}/upload/`;
     
-  return axios.post(url, formData, {
+  const response = await axios.post(url, formData, {
     headers: { 'Content-Type': 'multipart/form-data' }
   });
+
+  // The backend indexes the file in the background; wait for the job to finish
+  return waitForJob(response.data.job_id);
+}
+
+export async function getJob(jobId: string) {
+  return axios.get(`${BASE_URL}/jobs/${jobId}`);
+}
+
+// Large PDFs can take minutes to index; past this, stop waiting and report the upload as failed
+const JOB_TIMEOUT_MS = 30 * 60 * 1000;
+
+export async function waitForJob(jobId: string, intervalMs = 1000, timeoutMs = JOB_TIMEOUT_MS) {
+  const deadline = Date.now() + timeoutMs;
+  while (true) {
+    let response;
+    try {
+      response = await getJob(jobId);
+    } catch (error) {
+      // Jobs live in the server's memory, so a restart forgets them
+      if (axios.isAxiosError(error) && error.response?.status === 404) {
+        throw new Error('Document processing was interrupted (the server may have restarted). Please upload again.');
+      }
+      throw error;
+    }
+    if (response.data.status === 'completed') return response;
+    if (response.data.status === 'failed') {
+      throw new Error(response.data.error || 'Document processing failed');
+    }
+    if (Date.now() >= deadline) {
+      throw new Error('Document processing is taking too long. Please try again later.');
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
 }
 
 export async function queryDocument(question: string, chatId?: string, threshold?: number, useWebSearch?: boolean) {
@@ -30,12 +64,33 @@ export async function createChat() {
   return axios.post(`${BASE_URL}/chats/`);
 }
 
-export async function getChats() {
-  return axios.get(`${BASE_URL}/chats/`);
+// List endpoints return one page at a time; pass a page's next_cursor as `after` for the next one
+export async function getChats(after?: string) {
+  return axios.get(`${BASE_URL}/chats/`, { params: { after } });
+}
+
+export async function getChatMessages(chatId: string, after?: string) {
+  return axios.get(`${BASE_URL}/chats/${chatId}/messages`, { params: { after } });
 }
 
-export async function getChatMessages(chatId: string) {
-  return axios.get(`${BASE_URL}/chats/${chatId}/messages`);
+// Reads the whole history as NDJSON, handing each chunk's messages to onMessages as it arrives
+export async function streamChatMessages(chatId: string, onMessages: (messages: any[]) => void) {
+  const response = await fetch(`${BASE_URL}/chats/${chatId}/messages?format=ndjson`);
+  if (!response.ok || !response.body) {
+    throw new Error(`Loading messages failed: HTTP ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    buffered += decoder.decode(value, { stream: !done });
+    const lines = buffered.split('\n');
+    buffered = done ? '' : lines.pop() || '';
+    const messages = lines.filter((line) => line.trim()).map((line) => JSON.parse(line));
+    if (messages.length > 0) onMessages(messages);
+    if (done) return;
+  }
 }
 
 export async function deleteChat(chatId: string) {
@@ -50,8 +105,8 @@ export async function getChatDocuments(chatId: string) {
   return axios.get(`${BASE_URL}/chats/${chatId}/documents`);
 }
 
-export async function getAllDocuments() {
-  return axios.get(`${BASE_URL}/documents/`);
+export async function getAllDocuments(after?: string) {
+  return axios.get(`${BASE_URL}/documents/`, { params: { after } });
 }
 
 export async function getChatThreshold(chatId: string) {
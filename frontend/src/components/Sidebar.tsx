@@ -22,6 +22,8 @@ interface SidebarProps {
   activeChatId: string | null;
   setActiveChatId: (chatId: string) => void;
   onRefreshChats: () => void;
+  hasMoreChats?: boolean;
+  onLoadMoreChats?: () => void;
   onDeleteChat: (chatId: string) => void;
   onClearAllChats: () => void;
   collapsed?: boolean;
@@ -36,7 +38,7 @@ interface SidebarProps {
   onUpdatePreferences?: (preferences: any) => void;
 }
 
-export function Sidebar({ onNewChat, chats, activeChatId, setActiveChatId, onRefreshChats, onDeleteChat, onClearAllChats, collapsed = false, onToggleCollapse, theme = 'light', onToggleTheme, userPreferences, onUpdatePreferences }: SidebarProps) {
+export function Sidebar({ onNewChat, chats, activeChatId, setActiveChatId, onRefreshChats, hasMoreChats = false, onLoadMoreChats, onDeleteChat, onClearAllChats, collapsed = false, onToggleCollapse, theme = 'light', onToggleTheme, userPreferences, onUpdatePreferences }: SidebarProps) {
   const [chatDocuments, setChatDocuments] = useState<Record<string, Document[]>>({});
 
   useEffect(() => {
@@ -215,6 +217,15 @@ export function Sidebar({ onNewChat, chats, activeChatId, setActiveChatId, onRef
         })}
       </div>
       
+      {hasMoreChats && (
+        <button
+          onClick={onLoadMoreChats}
+          className="w-full px-4 py-2 text-sm bg-gray-200 text-gray-800 rounded hover:bg-gray-300"
+        >
+          Load older chats
+        </button>
+      )}
+      
       {chats.length === 0 && (
         <div className="text-center text-gray-500 text-sm py-8">
           No chat history yet. Start a new chat!
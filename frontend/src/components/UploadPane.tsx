@@ -22,6 +22,7 @@ export function UploadPane({ onUpload, chatId }: UploadPaneProps) {
       onUpload();
     } catch (err) {
       console.error(err);
+      alert(err instanceof Error ? err.message : 'Upload failed. Please try again.');
     } finally {
       setLoading(false);
     }